@@ -0,0 +1 @@
+# Benchmarks module - offline performance measurements
@@ -0,0 +1,328 @@
+"""
+Offline benchmark suite for processors and post-processing.
+
+Generates synthetic images at several resolutions, times each stage and
+reports latency percentiles, images/s and peak RSS as JSON. Run from the
+repository root:
+
+    python -m benchmarks                            # stub model, default sizes
+    python -m benchmarks --onnx path/to/model.onnx  # small local ONNX model
+    python -m benchmarks --model u2netp             # already-downloaded rembg model
+    python -m benchmarks --output new.json --compare baseline.json
+"""
+
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+try:
+    from utils.image import (
+        auto_crop_image, add_sticker_outline, create_checkerboard_preview, apply_background_color
+    )
+    from utils.memory import get_rss_bytes, get_peak_rss_bytes
+    from benchmarks.stub_session import stub_session_factory
+except ImportError:
+    from ..utils.image import (
+        auto_crop_image, add_sticker_outline, create_checkerboard_preview, apply_background_color
+    )
+    from ..utils.memory import get_rss_bytes, get_peak_rss_bytes
+    from .stub_session import stub_session_factory
+
+
+# Bump when the result layout changes so old baselines are not misread
+RESULTS_SCHEMA = 1
+
+DEFAULT_SIZES = ["512x512", "1024x768", "2048x1536", "4000x3000"]
+
+POST_PROCESSING_STAGES = [
+    "auto_crop_image",
+    "add_sticker_outline",
+    "create_checkerboard_preview",
+    "apply_background_color",
+]
+
+
+def parse_size(size: str) -> Tuple[int, int]:
+    """Parse a 'WIDTHxHEIGHT' string."""
+    width, height = size.lower().split("x")
+    return int(width), int(height)
+
+
+def make_synthetic_image(width: int, height: int, mode: str = "RGB", seed: int = 0) -> Image.Image:
+    """
+    Create a deterministic test image: a noisy gradient background with an
+    elliptical subject covering roughly the middle third of the frame.
+
+    Args:
+        width, height: Image size
+        mode: "RGB" for a photo-like input, "RGBA" for a cutout with soft edges
+        seed: Noise seed so every run sees identical pixels
+
+    Returns:
+        PIL Image in the requested mode
+    """
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[0:height, 0:width].astype(np.float32)
+
+    # Soft-edged ellipse, 1.0 inside the subject
+    dist = ((xx - width / 2) / (width / 3)) ** 2 + ((yy - height / 2) / (height / 3)) ** 2
+    subject = np.clip((1.0 - dist) * 20, 0, 1)
+
+    background = np.stack([
+        180 + 40 * xx / width,
+        190 + 30 * yy / height,
+        np.full_like(xx, 200),
+    ], axis=2)
+    foreground = np.stack([
+        60 + 120 * yy / height,
+        40 + 60 * xx / width,
+        np.full_like(xx, 90),
+    ], axis=2)
+
+    rgb = background * (1 - subject[..., None]) + foreground * subject[..., None]
+    rgb += rng.normal(0, 4, rgb.shape)
+    rgb = np.clip(rgb, 0, 255).astype(np.uint8)
+
+    if mode == "RGBA":
+        alpha = (subject * 255).astype(np.uint8)
+        return Image.fromarray(np.dstack([rgb, alpha]), "RGBA")
+    return Image.fromarray(rgb, "RGB")
+
+
+def summarize(samples: List[float]) -> dict:
+    """Latency percentiles (ms) and throughput for a list of durations in seconds."""
+    values = np.array(samples, dtype=np.float64) * 1000.0
+    mean = float(values.mean())
+    return {
+        "count": len(samples),
+        "mean_ms": round(mean, 3),
+        "min_ms": round(float(values.min()), 3),
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p90_ms": round(float(np.percentile(values, 90)), 3),
+        "p95_ms": round(float(np.percentile(values, 95)), 3),
+        "p99_ms": round(float(np.percentile(values, 99)), 3),
+        "max_ms": round(float(values.max()), 3),
+        "images_per_sec": round(1000.0 / mean, 3) if mean > 0 else None,
+    }
+
+
+def time_call(func: Callable[[], object], repeat: int, warmup: int) -> List[float]:
+    """Run func warmup + repeat times and return the timed durations."""
+    for _ in range(warmup):
+        func()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def bench_post_processing(sizes: List[str], repeat: int, warmup: int) -> Dict[str, dict]:
+    """Time each utils.image post-processing function at each size."""
+    results = {name: {} for name in POST_PROCESSING_STAGES}
+
+    for size in sizes:
+        width, height = parse_size(size)
+        cutout = make_synthetic_image(width, height, "RGBA")
+
+        calls = {
+            "auto_crop_image": lambda: auto_crop_image(cutout, 10),
+            "add_sticker_outline": lambda: add_sticker_outline(cutout, 5, (255, 255, 255)),
+            "create_checkerboard_preview": lambda: create_checkerboard_preview(cutout, (250, 180)),
+            "apply_background_color": lambda: apply_background_color(cutout, (255, 255, 255)),
+        }
+        for name in POST_PROCESSING_STAGES:
+            print(f"[Bench] {name} @ {size}", file=sys.stderr)
+            results[name][size] = summarize(time_call(calls[name], repeat, warmup))
+
+    return results
+
+
+def make_processor(model: Optional[str], onnx_path: Optional[str]):
+    """
+    Create the RembgProcessor to benchmark.
+
+    Returns:
+        (processor, model_name) - model_name is what goes in the options dict
+    """
+    from processors.rembg_processor import RembgProcessor
+
+    if onnx_path:
+        from rembg import new_session
+        return RembgProcessor(lambda name: new_session("u2net_custom", model_path=onnx_path)), "u2net_custom"
+    if model:
+        return RembgProcessor(), model
+    return RembgProcessor(stub_session_factory), "stub"
+
+
+def bench_processor(
+    processor,
+    model_name: str,
+    sizes: List[str],
+    repeat: int,
+    warmup: int,
+    alpha_matting: bool = False,
+    matting_method: str = "closed_form"
+) -> Dict[str, dict]:
+    """Time the full RembgProcessor.process path (file read to RGBA result)."""
+    results = {}
+    options = {
+        "model": model_name,
+        "alpha_matting": alpha_matting,
+        "alpha_matting_method": matting_method,
+    }
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for size in sizes:
+            width, height = parse_size(size)
+            input_path = Path(tmp_dir) / f"input_{size}.jpg"
+            make_synthetic_image(width, height, "RGB").save(input_path, quality=95)
+            output_path = Path(tmp_dir) / f"input_{size}_nobg.png"
+
+            print(f"[Bench] RembgProcessor.process @ {size}", file=sys.stderr)
+            results[size] = summarize(time_call(
+                lambda: processor.process(input_path, output_path, options),
+                repeat, warmup
+            ))
+
+    return results
+
+
+def collect_environment() -> dict:
+    """Describe the machine and code version so results can be compared."""
+    commit = None
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, timeout=5,
+            cwd=Path(__file__).parent.parent
+        ).stdout.strip() or None
+    except (OSError, subprocess.TimeoutExpired):
+        pass
+
+    return {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "numpy": np.__version__,
+        "pillow": Image.__version__,
+    }
+
+
+def compare_results(baseline: dict, current: dict, tolerance: float, min_delta_ms: float = 1.0) -> List[str]:
+    """
+    Compare p50 latencies of two result files.
+
+    Args:
+        baseline: Previously saved results
+        current: Results from this run
+        tolerance: Allowed slowdown as a fraction (0.1 = 10%)
+        min_delta_ms: Ignore slowdowns smaller than this (timer noise)
+
+    Returns:
+        List of human-readable regression descriptions (empty if none)
+    """
+    regressions = []
+    if baseline.get("schema") != current.get("schema"):
+        return [f"Schema mismatch: baseline {baseline.get('schema')} vs current {current.get('schema')}"]
+
+    for stage, by_size in current.get("results", {}).items():
+        for size, stats in by_size.items():
+            old = baseline.get("results", {}).get(stage, {}).get(size)
+            if not old or not old.get("p50_ms"):
+                continue
+            change = stats["p50_ms"] / old["p50_ms"] - 1.0
+            if change > tolerance and stats["p50_ms"] - old["p50_ms"] >= min_delta_ms:
+                regressions.append(
+                    f"{stage} @ {size}: p50 {old['p50_ms']:.1f}ms -> {stats['p50_ms']:.1f}ms (+{change * 100:.0f}%)"
+                )
+    return regressions
+
+
+def run_benchmarks(args: argparse.Namespace) -> dict:
+    """Run the selected benchmarks and return the results dict."""
+    rss_start = get_rss_bytes()
+    results = {}
+
+    if not args.skip_post:
+        results.update(bench_post_processing(args.sizes, args.repeat, args.warmup))
+
+    if not args.skip_processor:
+        processor, model_name = make_processor(args.model, args.onnx)
+        results["RembgProcessor.process"] = bench_processor(
+            processor, model_name, args.sizes, args.repeat, args.warmup,
+            args.alpha_matting, args.matting_method
+        )
+
+    return {
+        "schema": RESULTS_SCHEMA,
+        "environment": collect_environment(),
+        "config": {
+            "sizes": args.sizes,
+            "repeat": args.repeat,
+            "warmup": args.warmup,
+            "model": "onnx:" + Path(args.onnx).name if args.onnx else (args.model or "stub"),
+            "alpha_matting": args.alpha_matting,
+            "matting_method": args.matting_method,
+        },
+        "results": results,
+        "rss_start_bytes": rss_start,
+        "rss_end_bytes": get_rss_bytes(),
+        "peak_rss_bytes": get_peak_rss_bytes(),
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="BrainDead Background Remover benchmarks")
+    parser.add_argument("--sizes", nargs="+", default=DEFAULT_SIZES, help="Image sizes as WIDTHxHEIGHT")
+    parser.add_argument("--repeat", type=int, default=10, help="Timed runs per stage and size")
+    parser.add_argument("--warmup", type=int, default=1, help="Untimed runs before timing")
+    parser.add_argument("--model", help="rembg model name (must already be downloaded to run offline)")
+    parser.add_argument("--onnx", help="Path to a local ONNX model loaded as u2net_custom")
+    parser.add_argument("--alpha-matting", action="store_true", help="Enable alpha matting in the processor run")
+    parser.add_argument("--matting-method", choices=["closed_form", "guided"], default="closed_form",
+                        help="Alpha matting method used with --alpha-matting")
+    parser.add_argument("--skip-post", action="store_true", help="Skip post-processing benchmarks")
+    parser.add_argument("--skip-processor", action="store_true", help="Skip RembgProcessor benchmarks")
+    parser.add_argument("--output", help="Write results JSON here instead of stdout")
+    parser.add_argument("--compare", help="Baseline results JSON to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Allowed p50 slowdown vs baseline (0.10 = 10%%)")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0, help="Ignore p50 slowdowns smaller than this")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args)
+    text = json.dumps(results, indent=2)
+
+    if args.output:
+        Path(args.output).write_text(text)
+        print(f"[Bench] Results written to {args.output}", file=sys.stderr)
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare_results(baseline, results, args.tolerance, args.min_delta_ms)
+        for line in regressions:
+            print(f"[Bench] REGRESSION {line}", file=sys.stderr)
+        if regressions:
+            return 1
+        print("[Bench] No regressions against baseline", file=sys.stderr)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
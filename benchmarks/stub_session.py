@@ -0,0 +1,38 @@
+"""
+Stub rembg session - predicts a mask without loading a real model.
+
+Mimics the shape of a real session's work (resize to a fixed model input,
+compute a mask, resize back to the image size) so the processor path can be
+benchmarked offline. The "model" is a luminance threshold, not a network.
+"""
+
+from typing import List, Tuple
+
+import numpy as np
+from PIL import Image
+
+
+class StubSession:
+    """Drop-in replacement for a rembg session in benchmarks."""
+
+    def __init__(self, model_name: str = "stub", input_size: Tuple[int, int] = (1024, 1024)):
+        self.model_name = model_name
+        self.input_size = input_size
+
+    def predict(self, img: Image.Image, *args, **kwargs) -> List[Image.Image]:
+        small = img.convert("RGB").resize(self.input_size, Image.Resampling.LANCZOS)
+
+        # Pixels that differ from the mean border color count as foreground,
+        # with a narrow soft ramp so the mask looks like a model's output
+        pixels = np.asarray(small, dtype=np.float32)
+        border = np.concatenate([pixels[0], pixels[-1], pixels[:, 0], pixels[:, -1]])
+        distance = np.abs(pixels - border.mean(axis=0)).sum(axis=2)
+        mask = np.clip((distance - 40) * 8, 0, 255).astype(np.uint8)
+
+        mask_img = Image.fromarray(mask, mode="L")
+        return [mask_img.resize(img.size, Image.Resampling.LANCZOS)]
+
+
+def stub_session_factory(model_name: str) -> StubSession:
+    """Session factory for RembgProcessor that always returns a stub."""
+    return StubSession(model_name)
@@ -7,7 +7,8 @@ Optional SAM3 support for text-based segmentation.
 This is the main entry point. The application has been refactored into modules:
 - core/: Constants, configuration management
 - processors/: Image processing backends (rembg, SAM3)
-- ui/: User interface components
+- services/: Headless modes (HTTP server)
+- ui/: User interface components and command line
 - utils/: GPU detection, image utilities
 """
 
@@ -15,6 +16,7 @@ import sys
 import os
 import io
 import logging
+import multiprocessing
 
 
 class NullWriter(io.IOBase):
@@ -53,13 +55,19 @@ if getattr(sys, 'frozen', False):
     logging.disable(logging.CRITICAL)
     logging.root.handlers = [logging.NullHandler()]
 
-from ui.main_window import BackgroundRemoverApp
-
 
 def main():
+    # Arguments select a headless mode (see ui/cli.py); none starts the GUI
+    if len(sys.argv) > 1:
+        from ui.cli import main as cli_main
+        sys.exit(cli_main(sys.argv[1:]))
+
+    from ui.main_window import BackgroundRemoverApp
     app = BackgroundRemoverApp()
     app.run()
 
 
 if __name__ == "__main__":
+    # Decode processes (pipeline_decode_processes) re-run this file in a frozen build
+    multiprocessing.freeze_support()
     main()
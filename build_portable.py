@@ -58,16 +58,40 @@ def main():
         "--hidden-import", "core",
         "--hidden-import", "core.constants",
         "--hidden-import", "core.config",
+        "--hidden-import", "core.metrics",
+        "--hidden-import", "core.pipeline",
         "--hidden-import", "processors",
         "--hidden-import", "processors.base",
         "--hidden-import", "processors.rembg_processor",
+        "--hidden-import", "processors.sessions",
         "--hidden-import", "processors.sam3_processor",
+        "--hidden-import", "services",
+        "--hidden-import", "services.server",
+        "--hidden-import", "services.watch",
         "--hidden-import", "ui",
         "--hidden-import", "ui.main_window",
         "--hidden-import", "ui.dialogs",
+        "--hidden-import", "ui.cli",
         "--hidden-import", "utils",
         "--hidden-import", "utils.gpu",
         "--hidden-import", "utils.image",
+        "--hidden-import", "utils.memory",
+        "--hidden-import", "utils.matting",
+        "--hidden-import", "utils.mask",
+        "--hidden-import", "utils.keying",
+        "--hidden-import", "utils.dedup",
+        "--hidden-import", "utils.animation",
+        "--hidden-import", "core.sequence",
+        "--hidden-import", "utils.roi",
+        "--hidden-import", "services.distributed",
+        "--hidden-import", "utils.shared_frames",
+        "--hidden-import", "core.scheduler",
+        "--hidden-import", "processors.batching",
+        "--hidden-import", "services.autotune",
+        "--hidden-import", "core.profiling",
+        "--hidden-import", "core.memory_tracker",
+        "--hidden-import", "core.api",
+        "--hidden-import", "core.async_api",
         # Data collection
         "--collect-all", "rembg",
         "--collect-data", "tkinterdnd2",
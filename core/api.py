@@ -0,0 +1,363 @@
+"""
+Library API - background removal for images in memory, for embedding in
+other Python services.
+
+    from core.api import remove_background, remove_backgrounds
+
+    cutout = remove_background("photo.jpg", model="u2net")
+
+    for result in remove_backgrounds(uploads, model="birefnet-general", encode="PNG"):
+        if result.ok:
+            store(result.index, result.data)
+
+Inputs may be file paths, encoded bytes (or a binary file object), NumPy
+arrays (HxW, HxWx3 RGB, HxWx4 RGBA) or PIL images; nothing is written to
+disk. Options are the processing option names (model, alpha_matting, roi,
+...) and post-processing option names (auto_crop, sticker_mode,
+background, ...), defaulting to DEFAULT_CONFIG or a given config.
+
+remove_backgrounds is a generator: it takes inputs from the iterable only
+as results are consumed, with at most max_in_flight images decoded or in
+processing at once, so an endless or very large input stream runs in
+bounded memory. Decode, cutout, post-processing and encoding run on worker
+threads; with batch_size > 1 the model calls of concurrent images are
+coalesced (processors.batching.MicroBatcher). Model sessions live in the
+processor and are reused across calls - the shared default processor
+unless one is passed in.
+"""
+
+import io
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Any, Iterable, Iterator, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+from rembg.bg import fix_image_orientation, get_concat_v_multi
+
+try:
+    from core.config import build_processing_options, build_post_options
+    from core.constants import BACKGROUND_OPTIONS, DEFAULT_CONFIG
+    from core.metrics import ImageTimings, get_metrics, span
+    from processors.batching import DEFAULT_MAX_LATENCY_MS, MicroBatcher
+    from processors.rembg_processor import RembgProcessor
+    from utils.image import apply_post_processing, apply_background_color
+except ImportError:
+    from .config import build_processing_options, build_post_options
+    from .constants import BACKGROUND_OPTIONS, DEFAULT_CONFIG
+    from .metrics import ImageTimings, get_metrics, span
+    from ..processors.batching import DEFAULT_MAX_LATENCY_MS, MicroBatcher
+    from ..processors.rembg_processor import RembgProcessor
+    from ..utils.image import apply_post_processing, apply_background_color
+
+
+# Images decoded or in processing at once, by default
+DEFAULT_MAX_IN_FLIGHT = 4
+
+OUTPUT_MODES = ("cutout", "mask")
+
+_default_processor: Optional[RembgProcessor] = None
+_default_lock = threading.Lock()
+
+
+class RemovalResult:
+    """The outcome of one input of remove_backgrounds."""
+
+    def __init__(self, index: int, path: Optional[Path] = None):
+        # Position of the input in the iterable
+        self.index = index
+        # The input's path, if it was given as one
+        self.path = path
+        # Cutout (RGBA, or RGB over a solid background) or mask (L)
+        self.image: Optional[Image.Image] = None
+        # The image encoded with the encode option (format), else None
+        self.data: Optional[bytes] = None
+        self.format: Optional[str] = None
+        self.error: Optional[Exception] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def to_array(self) -> np.ndarray:
+        """The image as a NumPy array (HxWx4, HxWx3 or HxW uint8)."""
+        return np.asarray(self.image)
+
+    def to_bytes(self, format: str = "PNG") -> bytes:
+        """The image encoded (data when it is already in that format)."""
+        if self.data is not None and self.format == format.upper():
+            return self.data
+        buffer = io.BytesIO()
+        self.image.save(buffer, format)
+        return buffer.getvalue()
+
+    def __repr__(self) -> str:
+        state = f"error={self.error!r}" if self.error else f"size={self.image.size if self.image else None}"
+        return f"RemovalResult(index={self.index}, {state})"
+
+
+def get_default_processor() -> RembgProcessor:
+    """The processor shared by calls without processor= (sessions stay loaded)."""
+    global _default_processor
+    with _default_lock:
+        if _default_processor is None:
+            _default_processor = RembgProcessor(
+                intra_op_threads=DEFAULT_CONFIG.get("onnx_intra_op_threads", 0)
+            )
+        return _default_processor
+
+
+def load_image(source: Any) -> Image.Image:
+    """
+    Decode an input of any accepted kind.
+
+    Args:
+        source: Path (str or Path), encoded bytes / bytearray / memoryview,
+            binary file object, NumPy array (HxW gray, HxWx3 RGB, HxWx4
+            RGBA; uint8, or float in 0-1) or PIL Image
+
+    Returns:
+        PIL Image, loaded
+    """
+    if isinstance(source, Image.Image):
+        return source
+    if isinstance(source, np.ndarray):
+        return _image_from_array(source)
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        image = Image.open(io.BytesIO(source))
+    elif isinstance(source, (str, Path)) or hasattr(source, "read"):
+        image = Image.open(source)
+    else:
+        raise TypeError(f"cannot read an image from {type(source).__name__}")
+    image.load()
+    return image
+
+
+def _image_from_array(array: np.ndarray) -> Image.Image:
+    if array.dtype != np.uint8:
+        if not np.issubdtype(array.dtype, np.floating):
+            raise TypeError(f"expected a uint8 or float array, got {array.dtype}")
+        array = (np.clip(array, 0.0, 1.0) * 255 + 0.5).astype(np.uint8)
+    if array.ndim == 3 and array.shape[2] == 1:
+        array = array[:, :, 0]
+    if array.ndim == 2:
+        return Image.fromarray(array, "L")
+    if array.ndim == 3 and array.shape[2] in (3, 4):
+        return Image.fromarray(np.ascontiguousarray(array), "RGB" if array.shape[2] == 3 else "RGBA")
+    raise ValueError(f"expected an HxW, HxWx3 or HxWx4 array, got shape {array.shape}")
+
+
+def build_options(config: Optional[dict] = None, **options) -> Tuple[dict, dict]:
+    """
+    Processing and post-processing options from a config plus overrides.
+
+    Args:
+        config: Settings to start from (default: DEFAULT_CONFIG)
+        **options: Processing or post-processing option names
+
+    Returns:
+        (options, post_options)
+    """
+    config = config if config is not None else DEFAULT_CONFIG
+    processing = build_processing_options(config)
+    post = build_post_options(config)
+    for key, value in options.items():
+        if key in processing:
+            processing[key] = value
+        elif key in post:
+            post[key] = value
+        else:
+            raise TypeError(f"unknown option {key!r}")
+    if post["background"] not in BACKGROUND_OPTIONS:
+        raise ValueError(f"unknown background {post['background']!r}")
+    return processing, post
+
+
+def process_one(
+    processor,
+    source: Any,
+    options: dict,
+    post_options: dict,
+    output: str = "cutout",
+    encode: Optional[str] = None,
+    batcher: Optional[MicroBatcher] = None,
+    index: int = 0
+) -> RemovalResult:
+    """
+    Decode, process and optionally encode one input. Errors are returned
+    in the result, not raised.
+
+    Args:
+        processor: RembgProcessor (or another BaseProcessor for output="cutout"
+            without a batcher)
+        source: Any input load_image accepts
+        options / post_options: See build_options
+        output: "cutout" or "mask"
+        encode: Image format for result.data ("PNG", "WEBP", ...), or None
+        batcher: Started MicroBatcher to run the model call through
+        index: Stored in the result
+    """
+    result = RemovalResult(index, Path(source) if isinstance(source, (str, Path)) else None)
+    timings = ImageTimings(str(result.path) if result.path else f"api:{index}")
+    try:
+        with timings.activate():
+            with span("decode"):
+                image = load_image(source)
+            if output == "mask" or batcher is not None:
+                image = fix_image_orientation(image)
+                if batcher is not None:
+                    masks = batcher.submit(image, options)
+                else:
+                    masks = processor.predict_masks(image, options)
+                if output == "mask":
+                    result.image = masks[0] if len(masks) == 1 else get_concat_v_multi(masks)
+                else:
+                    cutout = processor.cutout(image, masks, options).convert("RGBA")
+            else:
+                cutout = processor.process_image(image, options)
+
+            if result.image is None:
+                cutout = apply_post_processing(cutout, post_options)
+                with span("background"):
+                    result.image = apply_background_color(
+                        cutout, BACKGROUND_OPTIONS[post_options["background"]][1]
+                    )
+
+            if encode:
+                with span("encode"):
+                    buffer = io.BytesIO()
+                    result.image.save(buffer, encode)
+                    result.data = buffer.getvalue()
+                result.format = encode.upper()
+    except Exception as e:
+        timings.status = "error"
+        result.image = None
+        result.error = e
+    finally:
+        get_metrics().record_image(timings)
+    return result
+
+
+def remove_background(source: Any, processor=None, config: Optional[dict] = None,
+                      output: str = "cutout", **options) -> Image.Image:
+    """
+    Remove the background of one image.
+
+    Args:
+        source: Path, bytes, file object, NumPy array or PIL Image
+        processor: Processor to use (default: the shared one)
+        config: Settings the options default to (default: DEFAULT_CONFIG)
+        output: "cutout" or "mask"
+        **options: Processing / post-processing options (see build_options)
+
+    Returns:
+        The cutout (RGBA, or RGB with a background) or the mask (L)
+
+    Raises:
+        The error processing the image failed with
+    """
+    if output not in OUTPUT_MODES:
+        raise ValueError(f"output must be one of {', '.join(OUTPUT_MODES)}")
+    processing, post = build_options(config, **options)
+    result = process_one(processor or get_default_processor(), source, processing, post, output)
+    if result.error is not None:
+        raise result.error
+    return result.image
+
+
+def remove_backgrounds(
+    sources: Iterable[Any],
+    processor=None,
+    config: Optional[dict] = None,
+    output: str = "cutout",
+    encode: Optional[str] = None,
+    max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+    workers: Optional[int] = None,
+    batch_size: int = 1,
+    ordered: bool = True,
+    raise_errors: bool = False,
+    **options
+) -> Iterator[RemovalResult]:
+    """
+    Remove the backgrounds of a stream of images, lazily.
+
+    Args:
+        sources: Iterable of paths, bytes, file objects, NumPy arrays or PIL
+            Images (read only as results are consumed)
+        processor: Processor to use (default: the shared one)
+        config: Settings the options default to (default: DEFAULT_CONFIG)
+        output: "cutout" or "mask"
+        encode: Also encode each image in the worker threads, into
+            result.data ("PNG", "WEBP", ...)
+        max_in_flight: Most inputs taken from the iterable and not yet
+            yielded
+        workers: Worker threads (default: max_in_flight)
+        batch_size: Images per model call (rembg only); > 1 coalesces the
+            model calls of concurrent images
+        ordered: Yield in input order; False yields each result as soon as
+            it is done
+        raise_errors: Raise the first failure instead of yielding a result
+            with error set
+        **options: Processing / post-processing options (see build_options)
+
+    Yields:
+        RemovalResult per input
+    """
+    if output not in OUTPUT_MODES:
+        raise ValueError(f"output must be one of {', '.join(OUTPUT_MODES)}")
+    processing, post = build_options(config, **options)
+    processor = processor or get_default_processor()
+    max_in_flight = max(1, max_in_flight)
+    return _stream(processor, iter(sources), processing, post, output, encode, max_in_flight,
+                   max(1, workers or max_in_flight), batch_size, ordered, raise_errors)
+
+
+def _stream(processor, sources: Iterator[Any], options: dict, post_options: dict, output: str,
+            encode: Optional[str], max_in_flight: int, workers: int, batch_size: int,
+            ordered: bool, raise_errors: bool) -> Iterator[RemovalResult]:
+    # Generator body kept apart so argument errors raise at the call
+    batcher = None
+    if batch_size > 1:
+        batcher = MicroBatcher(processor, batch_size, DEFAULT_MAX_LATENCY_MS, metric_prefix="api")
+        batcher.start()
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bg-api")
+    pending = deque()
+    index = 0
+    exhausted = False
+    try:
+        while True:
+            # Top up to max_in_flight from the iterable
+            while not exhausted and len(pending) < max_in_flight:
+                source = next(sources, _END)
+                if source is _END:
+                    exhausted = True
+                    break
+                pending.append(executor.submit(
+                    process_one, processor, source, options, post_options, output, encode, batcher, index
+                ))
+                index += 1
+            if not pending:
+                return
+
+            if ordered:
+                future = pending.popleft()
+            else:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                future = next(f for f in pending if f in done)
+                pending.remove(future)
+            result = future.result()
+            if raise_errors and result.error is not None:
+                raise result.error
+            yield result
+    finally:
+        # Also reached when the caller stops iterating early
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=True)
+        if batcher is not None:
+            batcher.stop()
+
+
+_END = object()
@@ -0,0 +1,313 @@
+"""
+asyncio API - background removal that never blocks the event loop.
+
+    from core.async_api import AsyncRemover
+
+    async with AsyncRemover(max_concurrency=4, timeout=30) as remover:
+        cutout = await remover.remove(upload_bytes, model="u2net")
+
+        async for result in remover.results(stream_of_uploads, encode="PNG"):
+            ...
+
+The work runs in an executor: a thread pool sharing one processor (the
+default; ONNX Runtime and PIL release the GIL, and batch_size > 1
+coalesces concurrent model calls), or with processes=N a pool of spawned
+processes, each with its own processor (for post-processing heavy setups
+that are bound by Python code). Inputs, options and results are the same
+as core.api's; in a process pool file objects are read into bytes first.
+
+At most max_concurrency images are in the executor at once; further calls
+wait their turn without blocking the loop. timeout limits each image from
+the moment it is handed to the executor. Cancelling the awaiting task (or
+a timeout) drops images that have not started; one already running in a
+worker finishes there and its result is discarded, since threads cannot be
+interrupted. Until it does it keeps its slot, so timed out images cannot
+pile up in the executor beyond max_concurrency.
+
+For a single call on a processor without any of this, see
+BaseProcessor.aprocess / aprocess_image.
+"""
+
+import asyncio
+import multiprocessing
+import pickle
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, AsyncIterable, AsyncIterator, Iterable, Optional, Union
+
+from PIL import Image
+
+try:
+    from core.api import RemovalResult, OUTPUT_MODES, build_options, get_default_processor, process_one
+    from processors.batching import DEFAULT_MAX_LATENCY_MS, MicroBatcher
+except ImportError:
+    from .api import RemovalResult, OUTPUT_MODES, build_options, get_default_processor, process_one
+    from ..processors.batching import DEFAULT_MAX_LATENCY_MS, MicroBatcher
+
+
+DEFAULT_MAX_CONCURRENCY = 4
+
+# The processor of a process pool worker (see _init_worker)
+_worker_processor = None
+
+
+def _init_worker(config: Optional[dict]) -> None:
+    """Process pool initializer: one processor per worker process."""
+    global _worker_processor
+    try:
+        from processors.rembg_processor import RembgProcessor
+    except ImportError:
+        from ..processors.rembg_processor import RembgProcessor
+
+    config = config or {}
+    _worker_processor = RembgProcessor(
+        shared_weights=config.get("shared_weights", False),
+        intra_op_threads=config.get("onnx_intra_op_threads", 0),
+    )
+
+
+def _process_in_worker(source: Any, options: dict, post_options: dict, output: str,
+                       encode: Optional[str], index: int) -> RemovalResult:
+    """process_one in a process pool worker."""
+    result = process_one(_worker_processor, source, options, post_options, output, encode, index=index)
+    if result.error is not None:
+        try:
+            pickle.dumps(result.error)
+        except Exception:
+            # Sent back to the parent, so it must pickle
+            result.error = RuntimeError(f"{type(result.error).__name__}: {result.error}")
+    return result
+
+
+class AsyncRemover:
+    """
+    Runs background removal for asyncio code with bounded concurrency.
+
+    Create and use it within one event loop.
+    """
+
+    def __init__(
+        self,
+        processor=None,
+        config: Optional[dict] = None,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        timeout: Optional[float] = None,
+        processes: int = 0,
+        batch_size: int = 1,
+        executor: Optional[Executor] = None
+    ):
+        """
+        Args:
+            processor: Processor for the thread pool (default: core.api's
+                shared one)
+            config: Settings the options default to (default:
+                DEFAULT_CONFIG); with processes, also the workers'
+                processor settings
+            max_concurrency: Most images in the executor at once
+            timeout: Default seconds per image (None = no limit)
+            processes: Worker processes instead of threads (0 = threads)
+            batch_size: Images per model call in the thread pool (> 1
+                coalesces concurrent model calls, see MicroBatcher)
+            executor: Use this thread pool instead of creating one (not
+                shut down by close)
+        """
+        self.config = config
+        self.max_concurrency = max(1, max_concurrency)
+        self.timeout = timeout
+        self.processes = max(0, processes)
+        self.processor = None if self.processes else (processor or get_default_processor())
+
+        self._own_executor = executor is None
+        if executor is not None:
+            self._executor = executor
+        elif self.processes:
+            # Spawned, not forked: forking a process with model threads running is unsafe
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.processes,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(config,),
+            )
+        else:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_concurrency, thread_name_prefix="bg-async"
+            )
+
+        self._batcher = None
+        if batch_size > 1 and not self.processes:
+            self._batcher = MicroBatcher(self.processor, batch_size, DEFAULT_MAX_LATENCY_MS, metric_prefix="api")
+            self._batcher.start()
+
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._closed = False
+
+    async def __aenter__(self) -> "AsyncRemover":
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        """Drop queued images, wait for running ones and shut the pool down."""
+        if self._closed:
+            return
+        self._closed = True
+        loop = asyncio.get_running_loop()
+        if self._own_executor:
+            await loop.run_in_executor(None, lambda: self._executor.shutdown(wait=True, cancel_futures=True))
+        if self._batcher is not None:
+            self._batcher.stop()
+
+    async def _submit(self, source: Any, options: dict, post_options: dict, output: str,
+                      encode: Optional[str], index: int):
+        if self.processes:
+            if hasattr(source, "read"):
+                # File objects do not pickle; read on the loop's default
+                # executor, since the read may block
+                source = await asyncio.get_running_loop().run_in_executor(None, source.read)
+            return self._executor.submit(_process_in_worker, source, options, post_options, output, encode, index)
+        # The thread pool reads file objects itself (load_image)
+        return self._executor.submit(
+            process_one, self.processor, source, options, post_options, output, encode, self._batcher, index
+        )
+
+    async def _run(self, source: Any, options: dict, post_options: dict, output: str,
+                   encode: Optional[str], index: int, timeout: Optional[float]) -> RemovalResult:
+        """One image through the executor; errors and timeouts go into the result."""
+        if self._closed:
+            raise RuntimeError("AsyncRemover is closed")
+        loop = asyncio.get_running_loop()
+        await self._semaphore.acquire()
+        try:
+            future = await self._submit(source, options, post_options, output, encode, index)
+        except BaseException:
+            self._semaphore.release()
+            raise
+
+        def release(_):
+            # Runs in the executor's thread once the image is out of it -
+            # also after a timeout, when this call has long returned
+            try:
+                loop.call_soon_threadsafe(self._semaphore.release)
+            except RuntimeError:
+                pass  # Loop already closed
+
+        future.add_done_callback(release)
+        try:
+            # Cancelling the wrapper cancels the executor future too
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except asyncio.TimeoutError:
+            result = RemovalResult(index, Path(source) if isinstance(source, (str, Path)) else None)
+            result.error = TimeoutError(f"timed out after {timeout}s")
+            return result
+
+    async def remove(self, source: Any, output: str = "cutout", timeout: Optional[float] = None,
+                     **options) -> Image.Image:
+        """
+        Remove the background of one image.
+
+        Args:
+            source: Path, bytes, file object, NumPy array or PIL Image
+            output: "cutout" or "mask"
+            timeout: Seconds for this image (default: the remover's)
+            **options: Processing / post-processing options (see
+                core.api.build_options)
+
+        Returns:
+            The cutout (RGBA, or RGB with a background) or the mask (L)
+
+        Raises:
+            TimeoutError, or the error processing the image failed with
+        """
+        result = await self.remove_result(source, output=output, timeout=timeout, **options)
+        if result.error is not None:
+            raise result.error
+        return result.image
+
+    async def remove_result(self, source: Any, output: str = "cutout", encode: Optional[str] = None,
+                            timeout: Optional[float] = None, **options) -> RemovalResult:
+        """Like remove, but returns the RemovalResult (errors in result.error)."""
+        if output not in OUTPUT_MODES:
+            raise ValueError(f"output must be one of {', '.join(OUTPUT_MODES)}")
+        processing, post = build_options(self.config, **options)
+        return await self._run(source, processing, post, output, encode, 0,
+                               timeout if timeout is not None else self.timeout)
+
+    async def results(
+        self,
+        sources: Union[Iterable[Any], AsyncIterable[Any]],
+        output: str = "cutout",
+        encode: Optional[str] = None,
+        timeout: Optional[float] = None,
+        max_in_flight: Optional[int] = None,
+        ordered: bool = True,
+        **options
+    ) -> AsyncIterator[RemovalResult]:
+        """
+        Remove the backgrounds of a stream of images.
+
+        Args:
+            sources: Iterable or async iterable of inputs (read only as
+                results are consumed)
+            output: "cutout" or "mask"
+            encode: Also encode each image in the executor, into
+                result.data ("PNG", "WEBP", ...)
+            timeout: Seconds per image (default: the remover's)
+            max_in_flight: Most inputs taken and not yet yielded (default:
+                max_concurrency)
+            ordered: Yield in input order; False yields each result as soon
+                as it is done
+            **options: Processing / post-processing options
+
+        Yields:
+            RemovalResult per input (failures and timeouts in result.error)
+        """
+        if output not in OUTPUT_MODES:
+            raise ValueError(f"output must be one of {', '.join(OUTPUT_MODES)}")
+        processing, post = build_options(self.config, **options)
+        timeout = timeout if timeout is not None else self.timeout
+        limit = max(1, max_in_flight or self.max_concurrency)
+        iterator = _aiter(sources)
+
+        pending = deque()
+        index = 0
+        exhausted = False
+        try:
+            while True:
+                while not exhausted and len(pending) < limit:
+                    try:
+                        source = await iterator.__anext__()
+                    except StopAsyncIteration:
+                        exhausted = True
+                        break
+                    pending.append(asyncio.ensure_future(
+                        self._run(source, processing, post, output, encode, index, timeout)
+                    ))
+                    index += 1
+                if not pending:
+                    return
+
+                if ordered:
+                    task = pending.popleft()
+                    result = await task
+                else:
+                    done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    task = next(t for t in pending if t in done)
+                    pending.remove(task)
+                    result = task.result()
+                yield result
+        finally:
+            # Also reached when the consumer stops early or is cancelled
+            for task in pending:
+                task.cancel()
+
+
+async def _aiter(sources: Union[Iterable[Any], AsyncIterable[Any]]) -> AsyncIterator[Any]:
+    """Iterate a sync or async iterable asynchronously."""
+    if hasattr(sources, "__aiter__"):
+        async for source in sources:
+            yield source
+    else:
+        for source in sources:
+            yield source
@@ -71,3 +71,46 @@ def set_hf_token(token: str) -> None:
             login(token=token, add_to_git_credential=False)
         except Exception:
             pass
+
+
+def build_processing_options(config: dict) -> dict:
+    """
+    Build processor options from saved settings.
+
+    Shared by the window (with its current widget values), the CLI and the
+    server, so every front end routes with the same keys and defaults.
+    """
+    return {
+        "model": config.get("model", DEFAULT_CONFIG["model"]),
+        "alpha_matting": config.get("alpha_matting", False),
+        "alpha_matting_foreground_threshold": config.get("alpha_matting_fg_threshold", 240),
+        "alpha_matting_background_threshold": config.get("alpha_matting_bg_threshold", 10),
+        "alpha_matting_erode_size": config.get("alpha_matting_erode_size", 10),
+        "alpha_matting_method": config.get("alpha_matting_method", "closed_form"),
+        "cascade": config.get("cascade", False),
+        "cascade_fast_model": config.get("cascade_fast_model", DEFAULT_CONFIG["cascade_fast_model"]),
+        "cascade_threshold": config.get("cascade_threshold", 0.03),
+        "fast_path": config.get("fast_path", False),
+        "fast_path_tolerance": config.get("fast_path_tolerance", 30.0),
+        "dedup": config.get("dedup", False),
+        "dedup_max_distance": config.get("dedup_max_distance", 6),
+        "dedup_max_residual": config.get("dedup_max_residual", 0.15),
+        "roi": config.get("roi", False),
+        "roi_margin": config.get("roi_margin", 0.15),
+        "animation_keyframe_threshold": config.get("animation_keyframe_threshold", 0.02),
+        "prompt": config.get("sam3_prompt", "").strip(),
+        "keep_subject": config.get("sam3_keep_subject", True),
+        "hf_token": config.get("hf_token", ""),
+    }
+
+
+def build_post_options(config: dict) -> dict:
+    """Build post-processing options (see apply_post_processing) from saved settings."""
+    return {
+        "auto_crop": config.get("auto_crop", False),
+        "auto_crop_margin": config.get("auto_crop_margin", 10),
+        "sticker_mode": config.get("sticker_mode", False),
+        "sticker_width": config.get("sticker_width", 5),
+        "sticker_color": config.get("sticker_color", "#ffffff"),
+        "background": config.get("background", "transparent"),
+    }
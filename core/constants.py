@@ -32,6 +32,9 @@ SUFFIX_OPTIONS = [
     "_cutout",
 ]
 
+# Fast first stage of the cascade mode (escalates to the selected model)
+CASCADE_FAST_MODEL = "u2netp"
+
 # Background color options: key -> (display_name, rgb_tuple or None for transparent)
 BACKGROUND_OPTIONS = {
     "transparent": ("Transparent", None),
@@ -39,8 +42,14 @@ BACKGROUND_OPTIONS = {
     "black": ("Black", (0, 0, 0)),
 }
 
+# Alpha matting methods: key -> display name
+MATTING_METHODS = {
+    "closed_form": "Closed-form (rembg) - best, slow",
+    "guided": "Guided filter - fast edge refinement",
+}
+
 # Supported image formats
-VALID_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.webp', '.bmp', '.tiff', '.tif'}
+VALID_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.webp', '.bmp', '.tiff', '.tif', '.gif', '.apng'}
 
 # Default configuration values
 DEFAULT_CONFIG = {
@@ -51,6 +60,30 @@ DEFAULT_CONFIG = {
     "alpha_matting_fg_threshold": 240,
     "alpha_matting_bg_threshold": 10,
     "alpha_matting_erode_size": 10,
+    "alpha_matting_method": "closed_form",
+    # Cascade: fast model first, selected model only for low-confidence masks
+    "cascade": False,
+    "cascade_fast_model": CASCADE_FAST_MODEL,
+    "cascade_threshold": 0.03,
+    # Fast path: key out solid studio backgrounds without running a model
+    "fast_path": False,
+    "fast_path_tolerance": 30.0,
+    # Dedup: reuse the mask of a near-identical earlier frame (aligned, verified)
+    "dedup": False,
+    "dedup_max_distance": 6,
+    "dedup_max_residual": 0.15,
+    # ROI: locate the subject on a small copy, then run the model on a crop around it
+    "roi": False,
+    "roi_margin": 0.15,
+    # Animations: frames closer than this to the last keyframe reuse its mask
+    "animation_keyframe_threshold": 0.02,
+    # Numbered sequences (frame_0001.png, ...): keyframe inference, masks propagated between
+    "sequence_mode": False,
+    "sequence_keyframe_interval": 8,
+    "sequence_max_residual": 0.25,
+    # Inputs that are already cutouts (output names, alpha) skip the model
+    "skip_processed": True,
+    "cutout_post_process": False,
     "output_format": "png",
     "auto_process": True,
     "use_sam3": False,
@@ -62,6 +95,57 @@ DEFAULT_CONFIG = {
     "sticker_mode": False,
     "sticker_color": "#ffffff",
     "sticker_width": 5,
+    # Bulk pipeline: workers per stage and queue capacity between stages
+    "pipeline_decode_workers": 2,
+    "pipeline_post_workers": 2,
+    "pipeline_write_workers": 1,
+    "pipeline_queue_size": 4,
+    # Images stacked into one model call in bulk runs (1 = no batching)
+    "pipeline_inference_batch": 1,
+    # Threads one model call uses (0 = onnxruntime default, all cores)
+    "onnx_intra_op_threads": 0,
+    # Images a bulk job processes before another queued job gets a turn
+    "scheduler_slice_size": 32,
+    # Low-memory mode: peak memory target in MB for bulk processing (0 disables)
+    "memory_budget_mb": 0,
+    # Timing metrics exports (empty / 0 disables)
+    "metrics_json_log": "",
+    "metrics_prometheus_file": "",
+    "metrics_http_port": 0,
+    # HTTP inference server (bg_remover.py serve)
+    "server_host": "127.0.0.1",
+    "server_port": 7860,
+    "server_max_batch_size": 4,
+    "server_max_latency_ms": 20,
+    "server_max_sessions": 1,
+    # Watch-folder daemon (bg_remover.py watch)
+    "watch_dirs": [],
+    "watch_debounce_seconds": 2.0,
+    "watch_poll_seconds": 1.0,
+    "watch_recursive": False,
+    "watch_backend": "auto",
+    # Distributed workers sharing a job database (bg_remover.py enqueue / worker)
+    "distributed_chunk_size": 8,
+    "distributed_lease_seconds": 120.0,
+    "distributed_max_attempts": 3,
+    # Worker processes started by one `worker` command (set by autotune)
+    "worker_processes": 1,
+    # Decode in separate processes, pixels handed over through shared memory (0 = threads)
+    "pipeline_decode_processes": 0,
+    "pipeline_shared_slot_mb": 64,
+    # Memory-map model weights so worker processes share one copy
+    "shared_weights": False,
+    # cProfile GUI bulk runs (the CLI has --profile); functions per stage in the summary
+    "profile_runs": False,
+    "profile_top_n": 25,
+    # Memory growth per batch for long-running instances (watch --track-memory in the CLI):
+    # checked after each bulk session and every memory_check_images images, model
+    # sessions recycled past memory_recycle_mb of growth (0 = never), optional JSON-lines log
+    "memory_tracking": False,
+    "memory_check_images": 25,
+    "memory_recycle_mb": 0,
+    "memory_top_n": 10,
+    "memory_log": "",
 }
 
 # Window dimensions
@@ -73,3 +157,6 @@ MIN_WINDOW_HEIGHT = 820
 # Preview dimensions
 PREVIEW_MAX_WIDTH = 250
 PREVIEW_MAX_HEIGHT = 180
+
+# Longest the window waits on close for in-flight bulk writes to finish
+CLOSE_TIMEOUT_SECONDS = 30
@@ -0,0 +1,285 @@
+"""
+Memory tracking - growth per batch, top allocators and session recycling.
+
+For instances left running for days (the GUI, `watch`). Opt-in: tracemalloc
+slows down every Python allocation.
+
+    tracker = MemoryTracker(recycle_mb=500, on_recycle=processor.clear_session)
+    tracker.start()
+    ...
+    tracker.checkpoint("bulk")   # after each batch
+    tracker.stop()
+
+Two sources are combined:
+
+    RSS          Sampled on a background thread (peak between checkpoints)
+                 and at each checkpoint. Counts everything, including ONNX
+                 Runtime arenas and PIL image buffers.
+    tracemalloc  Snapshot at each checkpoint, compared with the previous
+                 one to list the source lines whose allocations grew most.
+                 Only sees Python and NumPy allocations.
+
+RSS growth that tracemalloc does not account for is reported as native
+growth (sessions, PIL, allocator fragmentation).
+
+Once RSS has grown recycle_mb beyond where it started (or beyond where the
+last recycle left it), on_recycle is called to drop the model sessions and
+anything else the caller holds on to. After it the garbage collector runs
+and, on glibc, freed heap pages are handed back to the system.
+"""
+
+import ctypes
+import gc
+import json
+import sys
+import threading
+import time
+import tracemalloc
+from collections import deque
+from pathlib import Path
+from typing import Callable, Deque, List, Optional, Tuple
+
+try:
+    from utils.memory import get_rss_bytes
+except ImportError:
+    from ..utils.memory import get_rss_bytes
+
+
+# Allocators listed per checkpoint
+DEFAULT_TOP_N = 10
+
+# RSS samples kept (an hour at the default interval)
+MAX_SAMPLES = 3600
+
+# Allocations made by tracemalloc, the tracker and the import system are not the app's
+_SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, __file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+_MB = 1024 * 1024
+
+
+def trim_heap() -> bool:
+    """
+    Return freed heap memory to the system (glibc malloc_trim). Freed
+    blocks otherwise stay in the process and keep RSS high.
+
+    Returns:
+        Whether anything could be trimmed
+    """
+    if not sys.platform.startswith("linux"):
+        return False
+    try:
+        return bool(ctypes.CDLL("libc.so.6").malloc_trim(0))
+    except (OSError, AttributeError):
+        return False
+
+
+class MemoryTracker:
+    """
+    Records memory growth between checkpoints and recycles sessions past
+    a threshold.
+
+    Thread-safe; on_recycle runs on the thread calling checkpoint().
+    """
+
+    def __init__(
+        self,
+        top_n: int = DEFAULT_TOP_N,
+        trace_frames: int = 1,
+        sample_seconds: float = 1.0,
+        recycle_mb: int = 0,
+        on_recycle: Optional[Callable[[], Optional[bool]]] = None,
+        log_path: Optional[Path] = None
+    ):
+        """
+        Args:
+            top_n: Allocators listed per checkpoint
+            trace_frames: Stack frames tracemalloc keeps per allocation
+                (1 groups by source line; more costs memory)
+            sample_seconds: RSS sampling interval (0 = only at checkpoints)
+            recycle_mb: Call on_recycle once RSS has grown this much
+                (0 = never)
+            on_recycle: Drops sessions and caches; may return False to
+                postpone (e.g. while work is running)
+            log_path: JSON-lines file, one line per checkpoint
+        """
+        self.top_n = top_n
+        self.trace_frames = max(1, trace_frames)
+        self.sample_seconds = sample_seconds
+        self.recycle_mb = recycle_mb
+        self.on_recycle = on_recycle
+        self.log_path = Path(log_path) if log_path else None
+
+        self.checkpoints: List[dict] = []
+        self.recycles = 0
+        self.samples: Deque[Tuple[float, int]] = deque(maxlen=MAX_SAMPLES)
+
+        self._lock = threading.Lock()
+        self._started_tracing = False
+        self._start_time = 0.0
+        self._start_rss = 0
+        self._last_rss = 0
+        self._recycle_base_rss = 0
+        self._peak_rss = 0
+        self._snapshot: Optional[tracemalloc.Snapshot] = None
+        self._traced = 0
+        self._stop = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._start_time > 0
+
+    def start(self) -> None:
+        """Start tracing and sampling; the current footprint is the baseline."""
+        if self.running:
+            return
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.trace_frames)
+            self._started_tracing = True
+        gc.collect()
+        rss = get_rss_bytes() or 0
+        with self._lock:
+            self._start_time = time.time()
+            self._start_rss = self._last_rss = self._recycle_base_rss = self._peak_rss = rss
+            self._snapshot = self._take_snapshot()
+            self._traced = tracemalloc.get_traced_memory()[0]
+        if self.sample_seconds > 0:
+            self._stop.clear()
+            self._sampler = threading.Thread(target=self._sample_loop, daemon=True)
+            self._sampler.start()
+        print(f"[Memory] Tracking started at RSS {rss / _MB:.0f} MB")
+
+    def stop(self) -> None:
+        """Stop sampling, and tracing if start() turned it on."""
+        if not self.running:
+            return
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+            self._sampler = None
+        with self._lock:
+            self._start_time = 0.0
+            self._snapshot = None
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def _take_snapshot(self) -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+
+    def _sample_loop(self) -> None:
+        while not self._stop.wait(self.sample_seconds):
+            rss = get_rss_bytes()
+            if rss is None:
+                continue
+            with self._lock:
+                self.samples.append((time.time(), rss))
+                self._peak_rss = max(self._peak_rss, rss)
+
+    def checkpoint(self, label: str = "batch") -> Optional[dict]:
+        """
+        Record growth since the last checkpoint (call after each batch), and
+        recycle if RSS is past the threshold.
+
+        Args:
+            label: What just finished (logged with the numbers)
+
+        Returns:
+            The checkpoint (see to_dict), or None if not started
+        """
+        if not self.running:
+            return None
+        with self._lock:
+            rss = get_rss_bytes() or 0
+            snapshot = self._take_snapshot()
+            traced = tracemalloc.get_traced_memory()[0]
+
+            top = []
+            for stat in snapshot.compare_to(self._snapshot, "lineno"):
+                if stat.size_diff <= 0:
+                    continue
+                frame = stat.traceback[0]
+                top.append({
+                    "where": f"{frame.filename}:{frame.lineno}",
+                    "size_bytes": stat.size,
+                    "growth_bytes": stat.size_diff,
+                    "count_growth": stat.count_diff,
+                })
+                if len(top) >= self.top_n:
+                    break
+
+            rss_growth = rss - self._last_rss
+            traced_growth = traced - self._traced
+            point = {
+                "label": label,
+                "time": round(time.time(), 3),
+                "rss_bytes": rss,
+                "peak_rss_bytes": max(self._peak_rss, rss),
+                "growth_bytes": rss_growth,
+                "total_growth_bytes": rss - self._start_rss,
+                "traced_bytes": traced,
+                "traced_growth_bytes": traced_growth,
+                "native_growth_bytes": rss_growth - traced_growth,
+                "top_allocators": top,
+                "recycled": False,
+            }
+            self._snapshot = snapshot
+            self._traced = traced
+            self._last_rss = rss
+            self._peak_rss = rss
+            over = self.recycle_mb > 0 and rss - self._recycle_base_rss > self.recycle_mb * _MB
+
+        print(f"[Memory] {label}: RSS {rss / _MB:.0f} MB ({rss_growth / _MB:+.1f} MB, "
+              f"{point['total_growth_bytes'] / _MB:+.1f} MB since start, "
+              f"peak {point['peak_rss_bytes'] / _MB:.0f} MB); "
+              f"Python {traced_growth / _MB:+.1f} MB, native {point['native_growth_bytes'] / _MB:+.1f} MB")
+        for entry in top[:3]:
+            print(f"[Memory]   {entry['growth_bytes'] / 1024:+.0f} KB  {entry['where']}")
+
+        if over:
+            self._recycle(point)
+
+        with self._lock:
+            self.checkpoints.append(point)
+            if self.log_path:
+                with open(self.log_path, "a") as f:
+                    f.write(json.dumps(point) + "\n")
+        return point
+
+    def _recycle(self, point: dict) -> None:
+        """Drop sessions and caches, then give the memory back."""
+        if self.on_recycle is not None and self.on_recycle() is False:
+            print("[Memory] Over the recycle threshold; recycling postponed")
+            return
+        gc.collect()
+        trim_heap()
+        rss = get_rss_bytes() or 0
+        with self._lock:
+            self.recycles += 1
+            # Count the next recycle from here: growth that recycling does
+            # not free (a leak elsewhere) must not trigger it every time
+            self._recycle_base_rss = self._last_rss = self._peak_rss = rss
+            self._snapshot = self._take_snapshot()
+            self._traced = tracemalloc.get_traced_memory()[0]
+        point["recycled"] = True
+        point["rss_after_recycle_bytes"] = rss
+        print(f"[Memory] Recycled sessions: RSS {point['rss_bytes'] / _MB:.0f} MB -> {rss / _MB:.0f} MB")
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            last = self.checkpoints[-1] if self.checkpoints else None
+            return {
+                "running": self.running,
+                "start_rss_bytes": self._start_rss,
+                "rss_bytes": last["rss_bytes"] if last else self._start_rss,
+                "peak_rss_bytes": max([self._peak_rss] + [p["peak_rss_bytes"] for p in self.checkpoints]),
+                "checkpoints": len(self.checkpoints),
+                "recycles": self.recycles,
+                "last": last,
+            }
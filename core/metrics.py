@@ -0,0 +1,315 @@
+"""
+Timing instrumentation - per-image spans, counters/histograms and exporters.
+
+Code wraps each unit of work in a span:
+
+    with span("inference"):
+        masks = session.predict(image)
+
+Every span is observed in a process-wide histogram, and also added to the
+ImageTimings of the image the current thread is working on (if any), so
+each image's time can be broken down by stage. Aggregates can be exported
+as JSON lines, a Prometheus text file, or served over local HTTP.
+"""
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+
+# Histogram bucket upper bounds in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+METRIC_PREFIX = "bgremover"
+
+_local = threading.local()
+
+
+class Histogram:
+    """Cumulative histogram of durations (Prometheus-style buckets)."""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.bucket_counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.bucket_counts[i] += 1
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "mean": round(self.sum / self.count, 6) if self.count else 0.0,
+            "buckets": {str(b): c for b, c in zip(self.buckets, self.bucket_counts)},
+        }
+
+
+class ImageTimings:
+    """Timing spans collected for one image."""
+
+    def __init__(self, source: str = ""):
+        self.source = source
+        self.spans: List[Tuple[str, float]] = []
+        self.started = time.time()
+        self.status = "ok"
+
+    def add(self, name: str, seconds: float) -> None:
+        self.spans.append((name, seconds))
+
+    @contextmanager
+    def activate(self):
+        """Make this the current image for spans opened on this thread."""
+        previous = getattr(_local, "timings", None)
+        _local.timings = self
+        try:
+            yield self
+        finally:
+            _local.timings = previous
+
+    def totals(self) -> Dict[str, float]:
+        """Total seconds per span name (a stage may run more than once)."""
+        totals: Dict[str, float] = {}
+        for name, seconds in self.spans:
+            totals[name] = totals.get(name, 0.0) + seconds
+        return totals
+
+    def to_dict(self) -> dict:
+        totals = self.totals()
+        return {
+            "source": self.source,
+            "started": round(self.started, 3),
+            "status": self.status,
+            "total_seconds": round(sum(totals.values()), 6),
+            "stages": {name: round(seconds, 6) for name, seconds in totals.items()},
+        }
+
+
+class RunCounters:
+    """
+    Counters of one unit of work, such as a bulk run. The process-wide
+    registry also counts other work finishing at the same time (interactive
+    images, server requests, other jobs); these only count increments made
+    on threads working for this unit (see count_into).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = {}
+
+    def inc(self, name: str, value: float = 1) -> None:
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            return {name: value for name, value in self._counters.items() if value}
+
+
+@contextmanager
+def count_into(counters: Optional[RunCounters]):
+    """Also add counters incremented on this thread to counters (None = only the registry)."""
+    previous = getattr(_local, "counters", None)
+    _local.counters = counters
+    try:
+        yield counters
+    finally:
+        _local.counters = previous
+
+
+class MetricsRegistry:
+    """Process-wide counters and per-stage duration histograms."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: Dict[str, float] = {}
+        self.histograms: Dict[str, Histogram] = {}
+        self.json_log_path: Optional[Path] = None
+        self.prometheus_path: Optional[Path] = None
+        self.prometheus_interval = 5.0
+        self._last_prometheus_write = 0.0
+        self._http_server: Optional[ThreadingHTTPServer] = None
+
+    def inc(self, name: str, value: float = 1) -> None:
+        """Increment a counter (and the RunCounters active on this thread, if any)."""
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+        run = getattr(_local, "counters", None)
+        if run is not None:
+            run.inc(name, value)
+
+    def get_counter(self, name: str) -> float:
+        with self._lock:
+            return self.counters.get(name, 0)
+
+    def observe(self, stage: str, seconds: float) -> None:
+        """Record a duration for a stage."""
+        with self._lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = Histogram()
+            histogram.observe(seconds)
+
+    def record_image(self, timings: ImageTimings) -> None:
+        """Record a finished image: total histogram, counters and exports."""
+        totals = timings.totals()
+        self.observe("total", sum(totals.values()))
+        self.inc("images_processed" if timings.status == "ok" else "images_failed")
+
+        if self.json_log_path:
+            line = json.dumps(timings.to_dict())
+            with self._lock:
+                with open(self.json_log_path, "a") as f:
+                    f.write(line + "\n")
+
+        if self.prometheus_path and time.time() - self._last_prometheus_write >= self.prometheus_interval:
+            self.write_prometheus()
+
+    def snapshot(self) -> dict:
+        """Get all counters and histograms as a plain dict."""
+        with self._lock:
+            return {
+                "counters": dict(self.counters),
+                "stages": {name: h.to_dict() for name, h in self.histograms.items()},
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def to_prometheus(self) -> str:
+        """Render metrics in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            for name, value in sorted(self.counters.items()):
+                metric = f"{METRIC_PREFIX}_{name}_total"
+                lines.append(f"# TYPE {metric} counter")
+                lines.append(f"{metric} {value}")
+
+            metric = f"{METRIC_PREFIX}_stage_seconds"
+            if self.histograms:
+                lines.append(f"# HELP {metric} Time spent per processing stage")
+                lines.append(f"# TYPE {metric} histogram")
+            for stage, h in sorted(self.histograms.items()):
+                for bound, count in zip(h.buckets, h.bucket_counts):
+                    lines.append(f'{metric}_bucket{{stage="{stage}",le="{bound}"}} {count}')
+                lines.append(f'{metric}_bucket{{stage="{stage}",le="+Inf"}} {h.count}')
+                lines.append(f'{metric}_sum{{stage="{stage}"}} {h.sum:.6f}')
+                lines.append(f'{metric}_count{{stage="{stage}"}} {h.count}')
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self) -> None:
+        """Write the Prometheus text file (atomically, for node_exporter's textfile collector)."""
+        if not self.prometheus_path:
+            return
+        tmp_path = self.prometheus_path.with_name(self.prometheus_path.name + ".tmp")
+        tmp_path.write_text(self.to_prometheus())
+        os.replace(tmp_path, self.prometheus_path)
+        self._last_prometheus_write = time.time()
+
+    def start_http_server(self, port: int, host: str = "127.0.0.1") -> None:
+        """Serve /metrics (Prometheus text) and /metrics.json on a local port."""
+        if self._http_server is not None:
+            return
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/metrics":
+                    body = registry.to_prometheus().encode()
+                    content_type = "text/plain; version=0.0.4"
+                elif self.path == "/metrics.json":
+                    body = json.dumps(registry.snapshot()).encode()
+                    content_type = "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._http_server = ThreadingHTTPServer((host, port), Handler)
+        thread = threading.Thread(target=self._http_server.serve_forever, daemon=True)
+        thread.start()
+        print(f"[Metrics] Serving http://{host}:{port}/metrics")
+
+    def stop_http_server(self) -> None:
+        if self._http_server is not None:
+            self._http_server.shutdown()
+            self._http_server = None
+
+
+_registry = MetricsRegistry()
+
+
+def get_metrics() -> MetricsRegistry:
+    """Get the process-wide metrics registry."""
+    return _registry
+
+
+def get_current_timings() -> Optional[ImageTimings]:
+    """Get the ImageTimings active on this thread, if any."""
+    return getattr(_local, "timings", None)
+
+
+@contextmanager
+def span(name: str):
+    """Time a block of work as stage `name`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        _registry.observe(name, seconds)
+        timings = get_current_timings()
+        if timings is not None:
+            timings.add(name, seconds)
+
+
+def configure_metrics(config: dict) -> MetricsRegistry:
+    """
+    Set up exporters from config keys:
+
+        metrics_json_log: path of a JSON-lines file, one line per image
+        metrics_prometheus_file: path of a Prometheus text file
+        metrics_http_port: local port for /metrics, 0 to disable
+
+    Returns:
+        The process-wide registry
+    """
+    json_log = config.get("metrics_json_log", "")
+    prometheus_file = config.get("metrics_prometheus_file", "")
+    http_port = config.get("metrics_http_port", 0)
+
+    _registry.json_log_path = Path(json_log) if json_log else None
+    _registry.prometheus_path = Path(prometheus_file) if prometheus_file else None
+
+    if http_port:
+        try:
+            _registry.start_http_server(int(http_port))
+        except OSError as e:
+            print(f"[Metrics] Could not start HTTP endpoint on port {http_port}: {e}")
+
+    return _registry
+
+
+def flush_metrics() -> None:
+    """Write any pending exports (call at the end of a batch or on exit)."""
+    if _registry.prometheus_path:
+        _registry.write_prometheus()
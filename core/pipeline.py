@@ -0,0 +1,931 @@
+"""
+Bulk processing pipeline - overlaps file I/O, decoding, inference and saving.
+
+Images flow through four stages connected by bounded queues:
+
+    decode -> inference -> post -> write
+
+Each stage has its own worker count, so image N+1 is read and decoded
+while image N is still in the model. Per-stage timing shows which stage
+is the bottleneck.
+
+With a memory budget (low-memory mode), the decode stage reserves an
+estimate of each image's peak memory before decoding it and waits while
+the budget is used up, so the whole pipeline slows down instead of
+growing. Reservations are released once the image is written. Same-size
+images reuse scratch buffers, and PNGs are encoded straight into the
+output file.
+
+With skip_processed, inputs that are already cutouts - named like one of
+our outputs, or with a meaningful alpha channel - never reach the model.
+They are skipped in the decode stage, or with cutout_post_process, sent
+straight to post-processing with their own alpha.
+
+Animated inputs (GIF, APNG, WebP) travel as a utils.animation.Animation
+after inference and are written as animated PNGs.
+
+With decode_processes, decoding runs in separate processes (JPEG/PNG
+decoding then uses more than one core regardless of the GIL). Pixels come
+back through a shared-memory ring (utils.shared_frames): only a slot number
+and the image size cross the process boundary, and the inference stage
+reads the slot in place.
+
+With inference_batch_size > 1, that many inference workers run at once and
+hand their images to a processors.batching.MicroBatcher, which stacks them
+into one model call (RembgProcessor.predict_masks_batch). Cutouts are then
+made back on the workers.
+"""
+
+import io
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional
+
+from PIL import Image
+from rembg.bg import fix_image_orientation
+
+try:
+    from core.constants import BACKGROUND_OPTIONS, SUFFIX_OPTIONS
+    from core.metrics import ImageTimings, RunCounters, count_into, get_metrics, flush_metrics, span
+    from core.profiling import RunProfiler, profile_thread
+    from utils.animation import Animation, is_animated, load_frames, post_process_animation, save_animation
+    from utils.image import apply_post_processing, apply_background_color
+    from utils.mask import has_cutout_alpha
+    from utils.memory import BufferPool, MemoryBudget, estimate_image_bytes, get_memory_breakdown, use_buffer_pool
+    from utils.shared_frames import SharedFrameRing, decode_into_slot
+    from processors.batching import MicroBatcher
+except ImportError:
+    from .constants import BACKGROUND_OPTIONS, SUFFIX_OPTIONS
+    from .metrics import ImageTimings, RunCounters, count_into, get_metrics, flush_metrics, span
+    from .profiling import RunProfiler, profile_thread
+    from ..utils.animation import Animation, is_animated, load_frames, post_process_animation, save_animation
+    from ..utils.image import apply_post_processing, apply_background_color
+    from ..utils.mask import has_cutout_alpha
+    from ..utils.memory import (
+        BufferPool, MemoryBudget, estimate_image_bytes, get_memory_breakdown, use_buffer_pool
+    )
+    from ..utils.shared_frames import SharedFrameRing, decode_into_slot
+    from ..processors.batching import MicroBatcher
+
+
+# Marks the end of the input stream in a stage queue
+_STOP = object()
+
+STAGES = ("decode", "inference", "post", "write")
+
+# How an input can end up; cancelled means dropped unfinished by an abort
+OUTCOMES = ("completed", "failed", "skipped", "cancelled")
+
+# Stages that stop taking items while paused and drop them on abort; items
+# past inference are always finished, so the writer is flushed
+_HELD_STAGES = ("decode", "inference")
+
+
+def build_output_path(input_path: Path, suffix: str) -> Path:
+    """Get the output path for an input image: {stem}{suffix}.png next to it."""
+    input_path = Path(input_path)
+    return input_path.parent / f"{input_path.stem}{suffix or '_nobg'}.png"
+
+
+def is_output_file(path: Path, suffix: str = "_nobg") -> bool:
+    """Whether a file looks like one of our outputs ({stem}{suffix}.png, any SUFFIX_OPTIONS suffix)."""
+    path = Path(path)
+    if path.suffix.lower() != ".png":
+        return False
+    return any(path.stem.endswith(s) for s in set(SUFFIX_OPTIONS) | {suffix})
+
+
+def cutout_input_action(image: Image.Image, skip_processed: bool, cutout_post_process: bool) -> Optional[str]:
+    """
+    How to handle an input that may already be a cutout (see skip_processed).
+
+    Returns:
+        "skip" to leave it alone, "post_process" to post-process it with its
+        own alpha (no model), or None to run the model
+    """
+    if not skip_processed or not has_cutout_alpha(image):
+        return None
+    return "post_process" if cutout_post_process else "skip"
+
+
+def write_png(image: Image.Image, output_path: Path, stream: bool = False) -> None:
+    """
+    Encode an image as PNG and write it, timing the two steps separately.
+
+    Args:
+        image: Image to save
+        output_path: Destination file
+        stream: Encode straight into the file instead of a memory buffer
+            first (one "write" span, no second copy of the encoded image)
+    """
+    if stream:
+        with span("write"):
+            image.save(output_path, "PNG")
+        return
+
+    with span("encode"):
+        buffer = io.BytesIO()
+        image.save(buffer, "PNG")
+
+    with span("write"):
+        with open(output_path, "wb") as f:
+            f.write(buffer.getbuffer())
+
+
+def write_output(result, output_path: Path, stream: bool = False) -> None:
+    """
+    Write a cutout (PNG) or Animation (animated PNG) atomically.
+
+    The file is written under a temporary name and renamed into place, so
+    an interrupted write never leaves a partial PNG and a re-run
+    (distributed workers) replaces the output atomically.
+
+    Args:
+        result: Image or Animation
+        output_path: Destination file
+        stream: Encode straight into the file (see write_png)
+    """
+    output_path = Path(output_path)
+    temp_path = output_path.with_name(f".{output_path.name}.{uuid.uuid4().hex[:8]}.tmp")
+    try:
+        if isinstance(result, Animation):
+            save_animation(result, temp_path)
+        else:
+            write_png(result, temp_path, stream=stream)
+        os.replace(temp_path, output_path)
+    except BaseException:
+        if temp_path.exists():
+            temp_path.unlink()
+        raise
+
+
+class PipelineItem:
+    """A single image moving through the pipeline."""
+
+    def __init__(self, index: int, input_path: Path, output_path: Path):
+        self.index = index
+        self.input_path = input_path
+        self.output_path = output_path
+        self.image: Optional[Image.Image] = None
+        self.result: Optional[Image.Image] = None
+        self.error: Optional[str] = None
+        self.timings = ImageTimings(str(input_path))
+        # Bytes reserved from the memory budget while this item is in flight
+        self.reserved_bytes = 0
+        # Why the item was skipped without output (already processed), if it was
+        self.skipped: Optional[str] = None
+        # Dropped before inference because the run was aborted
+        self.cancelled = False
+        # Already a cutout: post-process its own alpha instead of running the model
+        self.passthrough = False
+        # Gives back the shared-memory slot the decoded image lives in, if any
+        self.slot_release: Optional[Callable[[], None]] = None
+        # A whole image sequence (sequence mode): the inference stage masks
+        # its frames and sends them on as items of their own
+        self.frames: Optional[List[Path]] = None
+        # A sequence frame's masks; the post stage cuts the image out with them
+        self.masks: Optional[List[Image.Image]] = None
+
+    def drop_image(self) -> None:
+        """Drop the decoded image (and free its shared-memory slot)."""
+        self.image = None
+        if self.slot_release is not None:
+            release, self.slot_release = self.slot_release, None
+            release()
+
+    def release(self) -> None:
+        """Drop image references so memory is freed as soon as possible."""
+        self.drop_image()
+        self.result = None
+        self.masks = None
+
+
+class StageStats:
+    """Timing counters for one pipeline stage."""
+
+    def __init__(self, name: str, workers: int):
+        self.name = name
+        self.workers = workers
+        self.items = 0
+        self.errors = 0
+        # Time spent doing work
+        self.busy_seconds = 0.0
+        # Time spent waiting for input (upstream is slower)
+        self.starved_seconds = 0.0
+        # Time spent waiting for space downstream (downstream is slower)
+        self.blocked_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, busy: float, starved: float, blocked: float, error: bool) -> None:
+        with self._lock:
+            self.items += 1
+            self.errors += 1 if error else 0
+            self.busy_seconds += busy
+            self.starved_seconds += starved
+            self.blocked_seconds += blocked
+
+    def occupancy(self, elapsed: float) -> float:
+        """Fraction of available worker time spent busy (0.0 - 1.0)."""
+        if elapsed <= 0 or self.workers <= 0:
+            return 0.0
+        return min(1.0, self.busy_seconds / (elapsed * self.workers))
+
+    def to_dict(self, elapsed: float) -> dict:
+        return {
+            "workers": self.workers,
+            "items": self.items,
+            "errors": self.errors,
+            "busy_seconds": round(self.busy_seconds, 3),
+            "starved_seconds": round(self.starved_seconds, 3),
+            "blocked_seconds": round(self.blocked_seconds, 3),
+            "occupancy": round(self.occupancy(elapsed), 3),
+        }
+
+
+class BulkPipeline:
+    """
+    Staged, multi-threaded bulk processor.
+
+    The inference stage defaults to a single worker because the model
+    session is shared; the other stages are I/O or PIL bound and release
+    the GIL for most of their work.
+    """
+
+    def __init__(
+        self,
+        processor,
+        options: dict,
+        post_options: dict,
+        suffix: str = "_nobg",
+        decode_workers: int = 2,
+        inference_workers: int = 1,
+        inference_batch_size: int = 1,
+        post_workers: int = 2,
+        write_workers: int = 1,
+        queue_size: int = 4,
+        memory_budget_mb: int = 0,
+        decode_processes: int = 0,
+        shared_slot_mb: int = 64,
+        skip_processed: bool = False,
+        cutout_post_process: bool = False,
+        sequence_mode: bool = False,
+        sequence_keyframe_interval: int = 8,
+        sequence_max_residual: float = 0.25,
+        on_item_complete: Optional[Callable[[PipelineItem], None]] = None,
+        on_item_error: Optional[Callable[[PipelineItem], None]] = None,
+        on_item_skipped: Optional[Callable[[PipelineItem], None]] = None,
+        on_item_cancelled: Optional[Callable[[PipelineItem], None]] = None,
+        inference_gate: Optional[Callable[[], None]] = None,
+        profiler: Optional[RunProfiler] = None,
+    ):
+        """
+        Args:
+            processor: BaseProcessor used for inference
+            options: Processing options dict (see _build_processing_options)
+            post_options: Post-processing options (see apply_post_processing),
+                plus "background" - a BACKGROUND_OPTIONS key
+            suffix: Output filename suffix
+            decode_workers / inference_workers / post_workers / write_workers:
+                Concurrency of each stage
+            inference_batch_size: Images stacked into one model call (needs
+                a processor with predict_masks_batch); runs at least this
+                many inference workers
+            queue_size: Capacity of each queue between stages
+            memory_budget_mb: Peak memory target for the process in MB;
+                0 disables low-memory mode
+            decode_processes: Decode in this many separate processes, which
+                hand pixels over through a shared-memory ring
+                (utils.shared_frames) instead of pickling them; 0 decodes
+                on the decode threads
+            shared_slot_mb: Size of each ring slot in MB; larger images are
+                decoded in this process
+            skip_processed: Don't run the model on inputs that are already
+                cutouts (output filenames, or a meaningful alpha channel)
+            cutout_post_process: With skip_processed, post-process inputs
+                with alpha (crop, sticker, background) instead of skipping them
+            sequence_mode: Process numbered frame sequences (frame_0001.png, ...)
+                with keyframe inference and mask propagation (see core.sequence)
+            sequence_keyframe_interval: Frames between model runs in a sequence
+            sequence_max_residual: Largest alignment residual for carrying a
+                keyframe mask over to a frame
+            on_item_complete: Called from a worker thread after an image is saved
+            on_item_error: Called from a worker thread when an image fails
+            on_item_skipped: Called from a worker thread when an input is
+                skipped as already processed
+            on_item_cancelled: Called from a worker thread for an image
+                dropped unfinished by cancel(abort=True)
+            inference_gate: Called before each inference; blocks while
+                higher-priority work runs (see core.scheduler)
+            profiler: Profile the pipeline's threads into this, one stage
+                per pipeline stage (see core.profiling)
+        """
+        self.processor = processor
+        self.options = options
+        self.post_options = post_options
+        self.suffix = suffix
+        self.queue_size = max(1, queue_size)
+        self.skip_processed = skip_processed
+        self.cutout_post_process = cutout_post_process
+        self.sequence_mode = sequence_mode
+        self.sequence_keyframe_interval = sequence_keyframe_interval
+        self.sequence_max_residual = sequence_max_residual
+        self.on_item_complete = on_item_complete
+        self.on_item_error = on_item_error
+        self.on_item_skipped = on_item_skipped
+        self.on_item_cancelled = on_item_cancelled
+        self.inference_gate = inference_gate
+        self.profiler = profiler
+
+        # Run controls (see pause / resume / cancel)
+        self._unpaused = threading.Event()
+        self._unpaused.set()
+        self._cancelled = threading.Event()
+        self._abort = False
+        # Input paths of the last run by outcome: completed, failed,
+        # skipped, cancelled
+        self.results: Dict[str, List[Path]] = {name: [] for name in OUTCOMES}
+        self._results_lock = threading.Lock()
+        # Items inside the inference stage right now (see inference_busy)
+        self._inferring = 0
+
+        # Batched inference: one MicroBatcher per run, fed by the workers
+        self.inference_batch_size = max(1, inference_batch_size)
+        if not hasattr(processor, "predict_masks_batch"):
+            self.inference_batch_size = 1
+        self._batcher: Optional[MicroBatcher] = None
+        self.batch_stats: Optional[dict] = None
+
+        self.decode_processes = max(0, decode_processes)
+        self.shared_slot_bytes = shared_slot_mb * 1024 * 1024
+        self._ring: Optional[SharedFrameRing] = None
+        self._decode_pool: Optional[ProcessPoolExecutor] = None
+        # Ring occupancy from the last run with decode processes
+        self.shared_stats: Optional[dict] = None
+
+        self.workers = {
+            # One decode thread per process, each waits on its process
+            "decode": self.decode_processes or max(1, decode_workers),
+            "inference": max(1, inference_workers, self.inference_batch_size),
+            "post": max(1, post_workers),
+            "write": max(1, write_workers),
+        }
+        self.stats: Dict[str, StageStats] = {}
+        self.elapsed = 0.0
+        # Metrics counters incremented by the last run's own threads (e.g.
+        # cascade stats); other work running at the same time is not counted
+        self.counters: Dict[str, float] = {}
+        self._run_counters: Optional[RunCounters] = None
+        # Per-sequence stats from the last run in sequence mode, keyed by first frame
+        self.sequence_stats: Dict[str, dict] = {}
+        # The post stage's queue while running (sequence frames go in there)
+        self._post_queue: Optional[queue.Queue] = None
+
+        self.memory_budget: Optional[MemoryBudget] = None
+        self.buffer_pool: Optional[BufferPool] = None
+        if memory_budget_mb > 0:
+            self.memory_budget = MemoryBudget(memory_budget_mb * 1024 * 1024)
+            self.buffer_pool = BufferPool()
+
+        bg_choice = post_options.get("background", "transparent")
+        self._bg_color = BACKGROUND_OPTIONS.get(bg_choice, (None, None))[1]
+
+    # Run controls - safe to call from any thread
+
+    def pause(self) -> None:
+        """
+        Stop taking new images: feeding, decoding and inference wait.
+        Images already past inference are still written.
+        """
+        self._unpaused.clear()
+
+    def resume(self) -> None:
+        self._unpaused.set()
+
+    def cancel(self, abort: bool = False) -> None:
+        """
+        Stop the run; run() returns once the pipeline is empty. Cancelling
+        is final for this pipeline.
+
+        Args:
+            abort: Also drop images not yet through inference (reported as
+                cancelled) instead of finishing them. Images already
+                inferred are always written.
+        """
+        self._abort = self._abort or abort
+        self._cancelled.set()
+        self._unpaused.set()
+
+    @property
+    def paused(self) -> bool:
+        return not self._unpaused.is_set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    @property
+    def inference_busy(self) -> bool:
+        """Whether an item is being inferred (its model session in use)."""
+        with self._results_lock:
+            return self._inferring > 0
+
+    def _count_inferring(self, delta: int) -> None:
+        with self._results_lock:
+            self._inferring += delta
+
+    def _proceed(self) -> bool:
+        """Wait while paused; whether new work may start (not cancelled)."""
+        self._unpaused.wait()
+        return not self._cancelled.is_set()
+
+    def _in_flight_may_continue(self) -> bool:
+        """Wait while paused; whether work already fed may go on (not aborted)."""
+        self._unpaused.wait()
+        return not self._abort
+
+    def _finish_item(self, outcome: str, item: PipelineItem) -> None:
+        """Record how an item ended and call its callback."""
+        with self._results_lock:
+            self.results[outcome].append(item.input_path)
+        callback = {
+            "completed": self.on_item_complete,
+            "failed": self.on_item_error,
+            "skipped": self.on_item_skipped,
+            "cancelled": self.on_item_cancelled,
+        }[outcome]
+        if callback:
+            # A failing callback must not take the stage thread (and with it
+            # the stop signal run() waits for) down
+            try:
+                callback(item)
+            except Exception as e:
+                print(f"[Pipeline] {outcome} callback failed for {item.input_path}: {e}")
+
+    # Stage functions - each takes an item and fills in the next field
+
+    @property
+    def low_memory(self) -> bool:
+        return self.memory_budget is not None
+
+    def _decode(self, item: PipelineItem) -> None:
+        if item.frames is not None:
+            # The sequence runner decodes its frames in order
+            return
+        if self.skip_processed and is_output_file(item.input_path, self.suffix):
+            item.skipped = "output file"
+            return
+
+        # Image.open is lazy and only reads the header here
+        image = Image.open(item.input_path)
+        if self.memory_budget is not None:
+            # Wait for room before the pixels are decoded (back-pressure)
+            item.reserved_bytes = self.memory_budget.acquire(
+                estimate_image_bytes(image.width, image.height, self.options,
+                                     frames=getattr(image, "n_frames", 1))
+            )
+        if self._ring is not None and not is_animated(image) and self._ring.fits(image.width * image.height * 4):
+            image = self._decode_shared(item, image)
+        else:
+            with span("decode"):
+                image.load()
+
+        action = cutout_input_action(image, self.skip_processed, self.cutout_post_process)
+        if action == "skip":
+            item.skipped = "already transparent"
+            return
+        item.passthrough = action == "post_process"
+        item.image = image
+
+    def _decode_shared(self, item: PipelineItem, image: Image.Image) -> Image.Image:
+        """Decode in a decode process, into a ring slot the image then maps."""
+        slot = self._ring.acquire()
+        try:
+            with span("decode"):
+                size = self._decode_pool.submit(
+                    decode_into_slot, self._ring.handle, slot, str(item.input_path)
+                ).result()
+        except BaseException:
+            self._ring.release(slot)
+            raise
+
+        if size is None:
+            # Larger than a slot once rotated
+            self._ring.release(slot)
+            get_metrics().inc("shared_decode_fallbacks")
+            with span("decode"):
+                image.load()
+            return image
+
+        ring = self._ring
+        item.slot_release = lambda: ring.release(slot)
+        get_metrics().inc("shared_decodes")
+        return ring.image(slot, size)
+
+    def _infer(self, item: PipelineItem) -> None:
+        if item.frames is not None:
+            self._run_sequence(item)
+            return
+        # Processors without animation support (SAM3) get the first frame
+        animated = is_animated(item.image) and hasattr(self.processor, "process_animation")
+        if item.passthrough:
+            item.result = load_frames(item.image) if animated else item.image.convert("RGBA")
+        elif animated:
+            item.result = self.processor.process_animation(item.image, self.options)
+        elif self._batcher is not None:
+            # What process_image does, with the masks from a shared model call
+            image = fix_image_orientation(item.image)
+            masks = self._batcher.submit(image, self.options)
+            item.result = self.processor.cutout(image, masks, self.options).convert("RGBA")
+        else:
+            item.result = self.processor.process_image(item.image, self.options)
+        item.drop_image()
+
+    def _post(self, item: PipelineItem) -> None:
+        if item.masks is not None:
+            # A sequence frame, masked by the sequence runner
+            masks, item.masks = item.masks, None
+            item.result = self.processor.cutout(item.image, masks, self.options).convert("RGBA")
+            item.drop_image()
+        result, item.result = item.result, None
+        if isinstance(result, Animation):
+            item.result = post_process_animation(result, self.post_options, self._bg_color)
+            return
+        result = apply_post_processing(result, self.post_options)
+        with span("background"):
+            item.result = apply_background_color(result, self._bg_color)
+
+    def _write(self, item: PipelineItem) -> None:
+        result, item.result = item.result, None
+        write_output(result, item.output_path, stream=self.low_memory)
+        if item.passthrough:
+            get_metrics().inc("inputs_post_processed_only")
+
+    # Pipeline plumbing
+
+    def _feed(self, input_paths: Iterable, out_queue: queue.Queue) -> None:
+        paths = iter(input_paths)
+        if self.sequence_mode and hasattr(self.processor, "predict_masks"):
+            # Propagation needs masks, not just cutouts
+            paths = self._group_sequences(paths)
+        index = 0
+        # Checked before taking the next path, so a cancelled run leaves the
+        # rest of the iterator untouched
+        while self._proceed():
+            path = next(paths, None)
+            if path is None:
+                break
+            if isinstance(path, list):
+                frames, path = path, path[0]
+            else:
+                frames, path = None, Path(path)
+            item = PipelineItem(index, path, build_output_path(path, self.suffix))
+            item.frames = frames
+            out_queue.put(item)
+            index += 1
+        for _ in range(self.workers["decode"]):
+            out_queue.put(_STOP)
+
+    def _group_sequences(self, paths: Iterable) -> Iterable:
+        """The inputs with each numbered sequence as one list of frame paths."""
+        try:
+            from core.sequence import group_sequences
+        except ImportError:
+            from .sequence import group_sequences
+
+        # Previous outputs stay single items, so the decode stage reports them skipped
+        exclude = (lambda path: is_output_file(path, self.suffix)) if self.skip_processed else None
+        return group_sequences(paths, exclude=exclude)
+
+    def _run_sequence(self, item: PipelineItem) -> None:
+        """Mask a sequence's frames (see core.sequence) and send them on to the post stage."""
+        try:
+            from core.sequence import SequenceRunner
+        except ImportError:
+            from .sequence import SequenceRunner
+
+        runner = SequenceRunner(self, self.sequence_keyframe_interval, self.sequence_max_residual)
+        stats = runner.run(item.frames)
+        with self._results_lock:
+            self.sequence_stats[str(item.frames[0])] = stats
+
+    def _send_to_post(self, item: PipelineItem) -> None:
+        """Queue an inferred item for the post stage (from an inference worker)."""
+        self._post_queue.put(item)
+
+    def _finish_frames(self, outcome: str, item: PipelineItem) -> None:
+        """Record an outcome for every frame of a sequence item that never reached the runner."""
+        for index, path in enumerate(item.frames):
+            frame = PipelineItem(index, path, build_output_path(path, self.suffix))
+            frame.error = item.error
+            self._finish_item(outcome, frame)
+
+    def _run_stage(
+        self,
+        name: str,
+        func: Callable[[PipelineItem], None],
+        in_queue: queue.Queue,
+        out_queue: Optional[queue.Queue],
+        remaining: List[int],
+        lock: threading.Lock,
+        next_workers: int,
+    ) -> None:
+        stats = self.stats[name]
+
+        try:
+            while True:
+                wait_start = time.perf_counter()
+                item = in_queue.get()
+                if name in _HELD_STAGES and item is not _STOP:
+                    # Paused, or interactive work goes first: counted as waiting for input
+                    self._unpaused.wait()
+                    if name == "inference" and self.inference_gate is not None and not self._abort:
+                        self.inference_gate()
+                    item.cancelled = self._abort
+                starved = time.perf_counter() - wait_start
+
+                if item is _STOP:
+                    return
+
+                work_start = time.perf_counter()
+                if not item.cancelled:
+                    if name == "inference":
+                        self._count_inferring(1)
+                    try:
+                        with item.timings.activate(), use_buffer_pool(self.buffer_pool):
+                            func(item)
+                    except Exception as e:
+                        item.error = str(e) if str(e) else type(e).__name__
+                    finally:
+                        if name == "inference":
+                            self._count_inferring(-1)
+                busy = time.perf_counter() - work_start
+
+                blocked = 0.0
+                if item.frames is not None and (item.cancelled or item.error is not None):
+                    # A sequence that never got going: each frame ends the same way
+                    outcome = "cancelled" if item.cancelled else "failed"
+                    get_metrics().inc("inputs_cancelled" if item.cancelled else "images_failed", len(item.frames))
+                    self._finish_frames(outcome, item)
+                elif item.frames is not None and name == "inference":
+                    # Its frames went on to the post stage one by one
+                    pass
+                elif item.cancelled:
+                    item.release()
+                    self._release_budget(item)
+                    get_metrics().inc("inputs_cancelled")
+                    self._finish_item("cancelled", item)
+                elif item.skipped is not None:
+                    item.release()
+                    self._release_budget(item)
+                    get_metrics().inc("inputs_skipped")
+                    self._finish_item("skipped", item)
+                elif item.error is not None:
+                    item.release()
+                    self._release_budget(item)
+                    item.timings.status = "error"
+                    get_metrics().record_image(item.timings)
+                    self._finish_item("failed", item)
+                elif out_queue is not None:
+                    put_start = time.perf_counter()
+                    out_queue.put(item)
+                    blocked = time.perf_counter() - put_start
+                else:
+                    self._release_budget(item)
+                    get_metrics().record_image(item.timings)
+                    self._finish_item("completed", item)
+
+                stats.record(busy, starved, blocked, item.error is not None)
+        finally:
+            # The last worker of this stage forwards the stop signal, also
+            # when this one died of an unexpected error
+            with lock:
+                remaining[0] -= 1
+                last = remaining[0] == 0
+            if last and out_queue is not None:
+                for _ in range(next_workers):
+                    out_queue.put(_STOP)
+
+    def _release_budget(self, item: PipelineItem) -> None:
+        if self.memory_budget is not None and item.reserved_bytes:
+            self.memory_budget.release(item.reserved_bytes)
+            item.reserved_bytes = 0
+
+    def run(self, input_paths: Iterable) -> dict:
+        """
+        Process all input paths, blocking until every image is written (or,
+        after cancel(), until the images in flight are done).
+
+        Returns:
+            Per-stage stats dict (see get_stats)
+        """
+        funcs = {
+            "decode": self._decode,
+            "inference": self._infer,
+            "post": self._post,
+            "write": self._write,
+        }
+        self.stats = {name: StageStats(name, self.workers[name]) for name in STAGES}
+
+        # One queue in front of each stage
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in STAGES]
+
+        self._run_counters = RunCounters()
+        start = time.perf_counter()
+        self.results = {name: [] for name in OUTCOMES}
+
+        self.sequence_stats = {}
+        self._post_queue = queues[STAGES.index("post")]
+        if self.decode_processes:
+            self._start_decode_processes()
+        if self.inference_batch_size > 1:
+            self._batcher = MicroBatcher(self.processor, self.inference_batch_size, metric_prefix="pipeline",
+                                         profiler=self.profiler, counters=self._run_counters)
+            self._batcher.start()
+
+        threads = [threading.Thread(
+            target=self._stage_target("feed", self._feed), args=(input_paths, queues[0]), daemon=True
+        )]
+
+        for i, name in enumerate(STAGES):
+            out_queue = queues[i + 1] if i + 1 < len(STAGES) else None
+            next_workers = self.workers[STAGES[i + 1]] if out_queue is not None else 0
+            remaining = [self.workers[name]]
+            lock = threading.Lock()
+            for _ in range(self.workers[name]):
+                threads.append(threading.Thread(
+                    target=self._stage_target(name, self._run_stage),
+                    args=(name, funcs[name], queues[i], out_queue, remaining, lock, next_workers),
+                    daemon=True,
+                ))
+
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.elapsed = time.perf_counter() - start
+        self.counters = self._run_counters.snapshot()
+        if self.buffer_pool is not None:
+            self.buffer_pool.clear()
+        self._stop_decode_processes()
+        if self._batcher is not None:
+            self._batcher.stop()
+            self.batch_stats = {
+                "batches": self._batcher.batches,
+                "mean_batch_size": round(self._batcher.batched_images / self._batcher.batches, 2)
+                if self._batcher.batches else 0.0,
+            }
+            self._batcher = None
+        flush_metrics()
+        return self.get_stats()
+
+    def _stage_target(self, stage: str, target: Callable) -> Callable:
+        """A thread target that counts into this run, under the profiler if there is one."""
+        counters = self._run_counters
+
+        def run(*args):
+            with count_into(counters), profile_thread(self.profiler, stage):
+                target(*args)
+        return run
+
+    def _start_decode_processes(self) -> None:
+        # Every item holds its slot from decode until inference is done, so
+        # this many slots never run out while the queues are full
+        slots = self.workers["decode"] + self.queue_size + self.workers["inference"]
+        try:
+            self._ring = SharedFrameRing(slots, self.shared_slot_bytes)
+        except OSError as e:
+            print(f"[Pipeline] Shared memory unavailable, decoding in-process: {e}")
+            return
+        # Spawned, not forked: forking a process with model threads running is unsafe
+        self._decode_pool = ProcessPoolExecutor(
+            max_workers=self.decode_processes, mp_context=multiprocessing.get_context("spawn")
+        )
+
+    def _stop_decode_processes(self) -> None:
+        if self._decode_pool is not None:
+            self._decode_pool.shutdown(wait=True)
+            self._decode_pool = None
+        if self._ring is not None:
+            self.shared_stats = self._ring.to_dict()
+            self._ring.close()
+            self._ring = None
+
+    def get_progress(self) -> dict:
+        """
+        Images per outcome so far in this run (completed, failed, skipped,
+        cancelled), plus "state": running / paused / cancelled / aborted.
+        """
+        with self._results_lock:
+            progress = {name: len(paths) for name, paths in self.results.items()}
+        if self._cancelled.is_set():
+            progress["state"] = "aborted" if self._abort else "cancelled"
+        else:
+            progress["state"] = "paused" if self.paused else "running"
+        return progress
+
+    def get_stats(self) -> dict:
+        """
+        Get per-stage stats from the last run.
+
+        Returns:
+            Dict with "elapsed_seconds", "bottleneck" (the busiest stage)
+            and a "stages" dict of StageStats.to_dict() values, "counters"
+            (metrics counters incremented during the run), "progress"
+            (images per outcome, and whether the run was cancelled), "process_memory"
+            (utils.memory.get_memory_breakdown() at the end), plus "memory"
+            (MemoryBudget.to_dict()) in low-memory mode, "sequences"
+            (SequenceRunner.run() results) in sequence mode,
+            "shared_memory" (SharedFrameRing.to_dict()) with decode processes
+            and "batching" (model calls, mean images per call) with
+            inference_batch_size > 1
+        """
+        stages = {name: s.to_dict(self.elapsed) for name, s in self.stats.items()}
+        bottleneck = None
+        if self.stats:
+            bottleneck = max(self.stats.values(), key=lambda s: s.occupancy(self.elapsed)).name
+        stats = {
+            "elapsed_seconds": round(self.elapsed, 3),
+            "bottleneck": bottleneck,
+            "stages": stages,
+            "counters": dict(self.counters),
+            "progress": self.get_progress(),
+            "process_memory": get_memory_breakdown(),
+        }
+        if self.memory_budget is not None:
+            stats["memory"] = self.memory_budget.to_dict()
+            stats["memory"]["buffer_reuse"] = self.buffer_pool.hits
+        if self.sequence_stats:
+            stats["sequences"] = dict(self.sequence_stats)
+        if self.shared_stats:
+            stats["shared_memory"] = dict(self.shared_stats)
+        if self.batch_stats:
+            stats["batching"] = dict(self.batch_stats)
+        return stats
+
+
+def format_routing_summary(counters: dict) -> str:
+    """
+    Summarize how images were routed (fast path, animation and sequence
+    keyframes, dedup, ROI crops, cascade escalations, skipped inputs) from
+    metrics counters. Returns an empty string when no routing happened.
+    """
+    parts = []
+    images = counters.get("fast_path_images", 0)
+    if images:
+        taken = counters.get("fast_path_taken", 0)
+        parts.append(f"fast path {taken:.0f}/{images:.0f} ({taken / images * 100:.0f}%)")
+    frames = counters.get("animation_frames", 0)
+    if frames:
+        keyframes = counters.get("animation_keyframes", 0)
+        parts.append(f"animation keyframes {keyframes:.0f}/{frames:.0f} ({keyframes / frames * 100:.0f}%)")
+    frames = counters.get("sequence_frames", 0)
+    if frames:
+        keyframes = counters.get("sequence_keyframes", 0)
+        parts.append(f"sequence keyframes {keyframes:.0f}/{frames:.0f} ({keyframes / frames * 100:.0f}%)")
+    images = counters.get("dedup_images", 0)
+    if images:
+        reused = counters.get("dedup_reused", 0)
+        parts.append(f"dedup reused {reused:.0f}/{images:.0f} ({reused / images * 100:.0f}%)")
+    images = counters.get("roi_images", 0)
+    if images:
+        cropped = counters.get("roi_cropped", 0)
+        parts.append(f"roi cropped {cropped:.0f}/{images:.0f} ({cropped / images * 100:.0f}%)")
+    images = counters.get("cascade_images", 0)
+    if images:
+        escalated = counters.get("cascade_escalated", 0)
+        parts.append(f"cascade escalated {escalated:.0f}/{images:.0f} ({escalated / images * 100:.0f}%)")
+    skipped = counters.get("inputs_skipped", 0)
+    if skipped:
+        parts.append(f"{skipped:.0f} already processed skipped")
+    post_only = counters.get("inputs_post_processed_only", 0)
+    if post_only:
+        parts.append(f"{post_only:.0f} cutouts post-processed only")
+    return ", ".join(parts)
+
+
+def format_stage_summary(stats: dict) -> str:
+    """Format pipeline stats as a one-line occupancy summary."""
+    parts = [
+        f"{name} {s['occupancy'] * 100:.0f}%"
+        for name, s in stats.get("stages", {}).items()
+    ]
+    summary = f"busy: {', '.join(parts)} (bottleneck: {stats.get('bottleneck')})"
+    routing = format_routing_summary(stats.get("counters", {}))
+    if routing:
+        summary += f"; {routing}"
+    memory = stats.get("memory")
+    if memory:
+        peak = (memory.get("peak_rss_bytes") or 0) / (1024 * 1024)
+        summary += f"; peak RSS {peak:.0f} MB, {memory['waits']} budget waits"
+    shared = stats.get("shared_memory")
+    if shared:
+        summary += (f"; shared slots peak {shared['peak_in_use']}/{shared['slots']} "
+                    f"(mean {shared['mean_in_use']}), {shared['waits']} slot waits")
+    return summary
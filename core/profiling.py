@@ -0,0 +1,280 @@
+"""
+Run profiling - the processing threads, profiled and merged per stage.
+
+Every thread doing processing work profiles itself under a stage name
+(RunProfiler.thread): the pipeline stages (decode, inference, post, write),
+the batcher thread, the input feed, and in the GUI the Tk main thread
+("ui"). save() then writes:
+
+    {name}.prof           all stages merged (python -m pstats, snakeviz, tuna)
+    {name}.{stage}.prof   one stage
+    {name}.txt            top functions per stage, by cumulative and own time
+
+Up to Python 3.11 each thread runs its own cProfile, which only sees the
+thread that enabled it. From 3.12 cProfile is built on sys.monitoring,
+which allows one profiler per process - a second thread's enable() fails.
+There a single sampling thread reads every registered thread's stack
+(sys._current_frames) every SAMPLE_INTERVAL_SECONDS and attributes it to
+that thread's stage. The .prof files have the same layout; times are
+sampled wall time and the call counts are sample counts.
+
+cProfile slows down Python code (each call is recorded); time spent inside
+ONNX Runtime, NumPy or PIL calls is measured but not slowed, so the
+stage split stays representative. Sampling barely slows anything but
+misses calls shorter than the interval. Decode processes
+(pipeline_decode_processes) are not profiled.
+"""
+
+import cProfile
+import io
+import pstats
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+
+# Functions listed per stage in the summary
+DEFAULT_TOP_N = 25
+
+# Wait between stack samples (sampling mode)
+SAMPLE_INTERVAL_SECONDS = 0.005
+
+# cProfile allows one profiler per process from 3.12 on (sys.monitoring)
+SAMPLING_DEFAULT = sys.version_info >= (3, 12)
+
+
+class _StageSamples:
+    """Stack samples of one stage, in pstats' layout."""
+
+    def __init__(self):
+        self.count = 0
+        # function -> seconds as the innermost frame / anywhere on the stack
+        self.own = defaultdict(float)
+        self.cumulative = defaultdict(float)
+        self.samples = defaultdict(int)
+        # callee -> caller -> seconds
+        self.callers = defaultdict(lambda: defaultdict(float))
+        self.caller_samples = defaultdict(lambda: defaultdict(int))
+
+    def add(self, frame, seconds: float) -> None:
+        """Record one sample of a stack (innermost frame first)."""
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+            frame = frame.f_back
+        if not stack:
+            return
+        self.count += 1
+        self.own[stack[0]] += seconds
+        # Recursion puts a function on the stack more than once; count it once
+        for function in set(stack):
+            self.cumulative[function] += seconds
+            self.samples[function] += 1
+        for callee, caller in set(zip(stack, stack[1:])):
+            self.callers[callee][caller] += seconds
+            self.caller_samples[callee][caller] += 1
+
+    def create_stats(self) -> None:
+        """pstats.Stats(samples) reads .stats after calling this."""
+        self.stats = {}
+        for function, count in self.samples.items():
+            callers = {
+                caller: (self.caller_samples[function][caller], self.caller_samples[function][caller],
+                         0.0, cumulative)
+                for caller, cumulative in self.callers[function].items()
+            }
+            self.stats[function] = (count, count, self.own[function], self.cumulative[function], callers)
+
+
+class RunProfiler:
+    """Collects profiles from several threads, grouped by stage."""
+
+    def __init__(
+        self,
+        top_n: int = DEFAULT_TOP_N,
+        sampling: Optional[bool] = None,
+        sample_interval: float = SAMPLE_INTERVAL_SECONDS
+    ):
+        """
+        Args:
+            top_n: Functions listed per stage in the summary
+            sampling: Sample stacks instead of running cProfile per thread
+                (default: from Python 3.12 on, see module docstring)
+            sample_interval: Seconds between stack samples
+        """
+        self.top_n = top_n
+        self.sampling = SAMPLING_DEFAULT if sampling is None else sampling
+        self.sample_interval = sample_interval
+        self._stats: Dict[str, pstats.Stats] = {}
+        self._samples: Dict[str, _StageSamples] = {}
+        # Sampling mode: thread id -> stages being profiled (innermost last)
+        self._threads: Dict[int, List[str]] = {}
+        self._sampler: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def thread(self, stage: str):
+        """Profile the calling thread for the duration of the block."""
+        handle = self.start(stage)
+        try:
+            yield
+        finally:
+            self.stop(handle)
+
+    def start(self, stage: str) -> Optional[Tuple[str, object]]:
+        """
+        Start profiling the calling thread under a stage (for work that is
+        not one block, e.g. Tk callbacks between two events). Pass the
+        result to stop(), on the same thread.
+        """
+        if self.sampling:
+            thread_id = threading.get_ident()
+            with self._lock:
+                self._threads.setdefault(thread_id, []).append(stage)
+                if self._sampler is None:
+                    self._sampler = threading.Thread(target=self._sample_loop, name="profile-sampler", daemon=True)
+                    self._sampler.start()
+            return stage, thread_id
+
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler (a debugger, an outer cProfile) is active
+            print(f"[Profile] Another profiler is active; {stage} is not profiled on this thread")
+            return None
+        return stage, profile
+
+    def stop(self, handle: Optional[Tuple[str, object]]) -> None:
+        """Stop profiling started with start() and add the result to its stage."""
+        if handle is None:
+            return
+        stage, profile = handle
+        if self.sampling:
+            with self._lock:
+                stages = self._threads.get(profile, [])
+                if stage in stages:
+                    stages.remove(stage)
+                if not stages:
+                    self._threads.pop(profile, None)
+            return
+
+        profile.disable()
+        try:
+            stats = pstats.Stats(profile)
+        except TypeError:
+            # Nothing was recorded
+            return
+        with self._lock:
+            if stage in self._stats:
+                self._stats[stage].add(stats)
+            else:
+                self._stats[stage] = stats
+
+    def _sample_loop(self) -> None:
+        """Sample the registered threads until none is left."""
+        last = time.perf_counter()
+        while True:
+            time.sleep(self.sample_interval)
+            now = time.perf_counter()
+            # Each sample stands for the time since the previous one
+            seconds, last = now - last, now
+            frames = sys._current_frames()
+            with self._lock:
+                if not self._threads:
+                    self._sampler = None
+                    return
+                for thread_id, stages in self._threads.items():
+                    frame = frames.get(thread_id)
+                    if frame is None:
+                        continue
+                    samples = self._samples.get(stages[-1])
+                    if samples is None:
+                        samples = self._samples[stages[-1]] = _StageSamples()
+                    samples.add(frame, seconds)
+            del frames
+
+    def _stage_stats(self) -> Dict[str, pstats.Stats]:
+        """pstats per stage, from either mode. Call with the lock held."""
+        stats = dict(self._stats)
+        for stage, samples in self._samples.items():
+            stats[stage] = pstats.Stats(samples)
+        return stats
+
+    @property
+    def stages(self) -> List[str]:
+        with self._lock:
+            return list(self._stats) + [stage for stage in self._samples if stage not in self._stats]
+
+    def summary(self, top_n: Optional[int] = None) -> str:
+        """Top functions per stage, by cumulative time and by own time."""
+        top_n = top_n or self.top_n
+        lines = []
+        with self._lock:
+            for stage, stats in self._stage_stats().items():
+                if stage in self._samples:
+                    counted = f"{self._samples[stage].count} samples"
+                else:
+                    counted = f"{stats.total_calls} calls"
+                lines.append(f"==== {stage}: {counted}, {stats.total_tt:.3f}s profiled ====")
+                for order in ("cumulative", "tottime"):
+                    stream = io.StringIO()
+                    stats.stream = stream
+                    stats.sort_stats(order).print_stats(top_n)
+                    lines.append(f"-- by {order} --")
+                    # Skip pstats' own header (file list, totals)
+                    text = stream.getvalue()
+                    start = text.find("   ncalls")
+                    lines.append(text[start:].rstrip() if start >= 0 else text.rstrip())
+                lines.append("")
+        return "\n".join(lines)
+
+    def save(self, path: Path) -> List[Path]:
+        """
+        Write the merged and per-stage .prof files and the text summary.
+
+        Args:
+            path: The merged .prof file; the others are named after it
+
+        Returns:
+            The files written
+        """
+        path = Path(path)
+        base = path.with_suffix("")
+        written = []
+        with self._lock:
+            stats = list(self._stage_stats().items())
+        if not stats:
+            return written
+
+        merged = None
+        for stage, stage_stats in stats:
+            stage_path = base.with_name(f"{base.name}.{stage}.prof")
+            stage_stats.dump_stats(stage_path)
+            written.append(stage_path)
+            if merged is None:
+                merged = pstats.Stats(str(stage_path))
+            else:
+                merged.add(str(stage_path))
+        merged.dump_stats(path)
+        written.insert(0, path)
+
+        summary_path = base.with_suffix(".txt")
+        summary_path.write_text(self.summary(), encoding="utf-8")
+        written.append(summary_path)
+        return written
+
+
+def profile_thread(profiler: Optional[RunProfiler], stage: str):
+    """profiler.thread(stage), or a no-op without a profiler."""
+    return profiler.thread(stage) if profiler is not None else nullcontext()
+
+
+def default_profile_path(folder: Path = Path("."), prefix: str = "bg_remover") -> Path:
+    """A timestamped .prof path in folder."""
+    return Path(folder) / f"{prefix}-profile-{time.strftime('%Y%m%d-%H%M%S')}.prof"
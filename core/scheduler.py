@@ -0,0 +1,444 @@
+"""
+Job scheduler - interactive images ahead of bulk work, bulk jobs sharing time.
+
+Work comes in two priority classes:
+
+    interactive  One image the user is looking at (drop, Process button).
+                 Runs on its own thread as soon as it is submitted; tasks
+                 queue behind each other, never behind bulk work.
+    bulk         A list of images run through a BulkPipeline. Jobs queue
+                 up instead of replacing each other.
+
+While interactive work is pending, bulk pipelines wait in front of their
+inference stage (BulkPipeline's inference_gate), so an interactive image
+waits for at most the model call already in progress. The bulk items stay
+where they are in the pipeline and continue afterwards.
+
+Bulk jobs take turns feeding images in slices (stride scheduling): each
+job has a pass value that grows by images_fed / weight, and the job with
+the lowest pass feeds next. A new job starts at the lowest pass of the jobs
+already there, so it gets its share from then on rather than catching up on
+the time before it arrived; with only one job there is no slicing at all.
+
+Each job's pipeline runs once, on its own thread, over all of the job's
+images: at the end of a slice its feed simply waits for the next turn while
+the images already fed finish. Decode processes, the shared frame ring and
+the micro-batcher are set up once per job rather than once per slice, and
+a job's last images drain while the next job already feeds.
+
+pause() holds all bulk work where it is (the running pipeline stops taking
+images, images past inference are still written) and resume() continues
+it. cancel() stops a job; with abort=True images not yet through inference
+are dropped too. Either way outputs are only ever renamed into place whole
+(core.pipeline.write_output), and each job reports how many images were
+completed, failed, skipped, cancelled in flight and never started.
+"""
+
+import itertools
+import threading
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+# Images fed to a bulk job before another waiting job gets its turn
+DEFAULT_SLICE_SIZE = 32
+
+# Job states
+QUEUED = "queued"
+RUNNING = "running"
+WAITING = "waiting"
+CANCELLED = "cancelled"
+DONE = "done"
+
+
+class BulkJob:
+    """One bulk submission and how far it has got."""
+
+    def __init__(self, job_id: int, name: str, paths: List, weight: float = 1.0):
+        self.id = job_id
+        self.name = name
+        self.paths = list(paths)
+        self.weight = max(0.01, weight)
+        # Index of the next path to feed; everything before it has been
+        # handed to the pipeline
+        self.position = 0
+        self.state = QUEUED
+        self.pipeline = None
+        # Turns the job has had at feeding images
+        self.slices = 0
+        self.elapsed_seconds = 0.0
+        # Metrics counters of the job's run
+        self.counters: Dict[str, float] = {}
+        # Stats of the job's run (BulkPipeline.get_stats), once it is over
+        self.stats: Optional[dict] = None
+        # Images per outcome (see core.pipeline.OUTCOMES)
+        self.outcomes: Dict[str, int] = {}
+        # Stride scheduling pass value
+        self._pass = 0.0
+        # Runs the pipeline, from the job's first turn on
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def total(self) -> int:
+        return len(self.paths)
+
+    @property
+    def remaining(self) -> int:
+        return len(self.paths) - self.position
+
+    @property
+    def finished(self) -> bool:
+        return self.state in (CANCELLED, DONE)
+
+    @property
+    def started(self) -> bool:
+        return self._thread is not None
+
+    def _add_run(self, stats: dict) -> None:
+        self.stats = stats
+        self.elapsed_seconds = stats.get("elapsed_seconds", 0.0)
+        self.counters = dict(stats.get("counters", {}))
+        self.outcomes = {
+            name: value for name, value in stats.get("progress", {}).items() if isinstance(value, int)
+        }
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "name": self.name,
+            "state": self.state,
+            "total": self.total,
+            "position": self.position,
+            "weight": self.weight,
+            "slices": self.slices,
+            "elapsed_seconds": round(self.elapsed_seconds, 3),
+            "not_started": self.remaining,
+            **self.outcomes,
+        }
+
+
+class JobScheduler:
+    """
+    Runs interactive tasks and bulk jobs by priority.
+
+    Thread-safe; callbacks run on the scheduler's threads.
+    """
+
+    def __init__(
+        self,
+        slice_size: int = DEFAULT_SLICE_SIZE,
+        on_job_started: Optional[Callable[[BulkJob], None]] = None,
+        on_job_finished: Optional[Callable[[BulkJob], None]] = None
+    ):
+        """
+        Args:
+            slice_size: Images fed to a bulk job per turn while other bulk
+                jobs wait
+            on_job_started: Called when a bulk job runs its first slice
+            on_job_finished: Called when a bulk job is done or cancelled
+                (job.state tells which)
+        """
+        self.slice_size = max(1, slice_size)
+        self.on_job_started = on_job_started
+        self.on_job_finished = on_job_finished
+
+        self._cond = threading.Condition()
+        self._ids = itertools.count(1)
+        self._jobs: List[BulkJob] = []
+        self._interactive: Deque[Tuple[int, Callable[[], None]]] = deque()
+        # Interactive tasks queued or running; bulk inference waits while > 0
+        self._interactive_pending = 0
+        self._paused = False
+        # The bulk job whose turn it is to feed images
+        self._running: Optional[BulkJob] = None
+        self._shutdown = False
+        self._interactive_thread: Optional[threading.Thread] = None
+
+    # Submitting work
+
+    def submit_bulk(
+        self,
+        name: str,
+        paths: List,
+        make_pipeline: Callable[[BulkJob], object],
+        weight: float = 1.0
+    ) -> BulkJob:
+        """
+        Queue a bulk job.
+
+        Args:
+            name: Label for progress and logs
+            paths: Input images
+            make_pipeline: Builds the job's BulkPipeline (called once, now,
+                with the job, so callbacks can refer to it). Pass
+                inference_gate=scheduler.wait_for_interactive to it.
+            weight: Share of pipeline time relative to other bulk jobs
+
+        Returns:
+            The job
+        """
+        job = BulkJob(next(self._ids), name, paths, weight)
+        job.pipeline = make_pipeline(job)
+        with self._cond:
+            active = [j for j in self._jobs if not j.finished]
+            job._pass = min((j._pass for j in active), default=0.0)
+            self._jobs.append(job)
+            self._dispatch()
+            self._cond.notify_all()
+        print(f"[Scheduler] Queued bulk job {job.id} ({job.name}, {job.total} images)")
+        return job
+
+    def submit_interactive(self, task: Callable[[], None]) -> int:
+        """
+        Run a task ahead of all bulk work (after earlier interactive tasks).
+
+        Returns:
+            Task id (for cancel while it is still queued)
+        """
+        task_id = next(self._ids)
+        with self._cond:
+            self._interactive.append((task_id, task))
+            self._interactive_pending += 1
+            self._ensure_thread("_interactive_thread", self._interactive_loop)
+            self._cond.notify_all()
+        return task_id
+
+    def cancel(self, job_id: int, abort: bool = False) -> bool:
+        """
+        Cancel a bulk job or a queued interactive task. A started bulk job
+        stops feeding new images; those already in its pipeline finish.
+
+        Args:
+            job_id: Bulk job or interactive task id
+            abort: Also drop a running job's images that have not been
+                through inference yet (see BulkPipeline.cancel)
+
+        Returns:
+            Whether anything was cancelled
+        """
+        finished = None
+        with self._cond:
+            for i, (task_id, _) in enumerate(self._interactive):
+                if task_id == job_id:
+                    del self._interactive[i]
+                    self._interactive_pending -= 1
+                    self._cond.notify_all()
+                    return True
+            for job in self._jobs:
+                if job.id == job_id and not job.finished:
+                    job.state = CANCELLED
+                    if job.started:
+                        # Its pipeline stops feeding (also while waiting for
+                        # a turn) and the next job may feed
+                        job.pipeline.cancel(abort)
+                        self._release_turn(job)
+                    else:
+                        # Not in a pipeline: finished right away
+                        self._jobs.remove(job)
+                        finished = job
+                    self._cond.notify_all()
+                    break
+            else:
+                return False
+        if finished is not None:
+            print(f"[Scheduler] Cancelled bulk job {finished.id} at {finished.position}/{finished.total}")
+            if self.on_job_finished:
+                self.on_job_finished(finished)
+        return True
+
+    def cancel_all(self, abort: bool = False) -> None:
+        """Cancel every bulk job and queued interactive task."""
+        with self._cond:
+            ids = [task_id for task_id, _ in self._interactive] + [job.id for job in self._jobs]
+        for job_id in ids:
+            self.cancel(job_id, abort)
+
+    def pause(self) -> None:
+        """Hold all bulk work in place (interactive tasks still run)."""
+        with self._cond:
+            self._paused = True
+            for job in self._started_jobs():
+                job.pipeline.pause()
+        print("[Scheduler] Bulk work paused")
+
+    def resume(self) -> None:
+        with self._cond:
+            self._paused = False
+            for job in self._started_jobs():
+                job.pipeline.resume()
+            self._dispatch()
+            self._cond.notify_all()
+        print("[Scheduler] Bulk work resumed")
+
+    @property
+    def paused(self) -> bool:
+        with self._cond:
+            return self._paused
+
+    def shutdown(self, abort: bool = True) -> None:
+        """
+        Cancel everything and stop the threads once running work is done
+        (see wait_idle).
+
+        Args:
+            abort: Drop in-flight bulk images not yet through inference
+        """
+        self.cancel_all(abort)
+        with self._cond:
+            self._shutdown = True
+            self._cond.notify_all()
+
+    def wait_idle(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait until no bulk job or interactive task is left (e.g. after
+        shutdown, so in-flight writes finish before the process exits).
+
+        Returns:
+            Whether everything finished within the timeout
+        """
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: not self._jobs and self._interactive_pending == 0, timeout
+            )
+
+    # State
+
+    def jobs(self) -> List[BulkJob]:
+        """Bulk jobs not finished yet, in submission order."""
+        with self._cond:
+            return list(self._jobs)
+
+    def get_job(self, job_id: int) -> Optional[BulkJob]:
+        with self._cond:
+            return next((job for job in self._jobs if job.id == job_id), None)
+
+    @property
+    def bulk_busy(self) -> bool:
+        with self._cond:
+            return bool(self._jobs)
+
+    @property
+    def interactive_busy(self) -> bool:
+        with self._cond:
+            return self._interactive_pending > 0
+
+    def wait_for_interactive(self) -> None:
+        """Block while interactive work is queued or running (bulk inference gate)."""
+        with self._cond:
+            while self._interactive_pending > 0 and not self._shutdown:
+                self._cond.wait()
+
+    # Threads
+
+    def _ensure_thread(self, attr: str, target: Callable[[], None]) -> None:
+        """Start a worker thread on first use (caller holds the lock)."""
+        thread = getattr(self, attr)
+        if thread is None or not thread.is_alive():
+            thread = threading.Thread(target=target, daemon=True)
+            setattr(self, attr, thread)
+            thread.start()
+
+    def _interactive_loop(self) -> None:
+        while True:
+            with self._cond:
+                while not self._interactive and not self._shutdown:
+                    self._cond.wait()
+                if not self._interactive:
+                    return
+                _, task = self._interactive.popleft()
+            try:
+                task()
+            except Exception as e:
+                print(f"[Scheduler] Interactive task failed: {e}")
+            finally:
+                with self._cond:
+                    self._interactive_pending -= 1
+                    self._cond.notify_all()
+
+    def _started_jobs(self) -> List[BulkJob]:
+        """Jobs whose pipeline is running (caller holds the lock)."""
+        return [job for job in self._jobs if job.started and not job.finished]
+
+    @staticmethod
+    def _wants_turn(job: BulkJob) -> bool:
+        # Not started yet (even with no images: it still has to run and finish), or images left
+        return not job.finished and (job.remaining > 0 or not job.started)
+
+    def _next_job(self) -> Optional[BulkJob]:
+        """Bulk job waiting to feed with the lowest pass value (caller holds the lock)."""
+        waiting = [job for job in self._jobs if self._wants_turn(job)]
+        if not waiting:
+            return None
+        return min(waiting, key=lambda job: (job._pass, job.id))
+
+    def _dispatch(self) -> None:
+        """Give the feeding turn to the next job, starting it on its first turn (caller holds the lock)."""
+        if self._running is not None or self._paused or self._shutdown:
+            return
+        job = self._next_job()
+        if job is None:
+            return
+        self._running = job
+        job.state = RUNNING
+        job.slices += 1
+        if job._thread is None:
+            job._thread = threading.Thread(target=self._run_job, args=(job,), daemon=True)
+            job._thread.start()
+        self._cond.notify_all()
+
+    def _release_turn(self, job: BulkJob) -> None:
+        """End job's turn at feeding, if it has it (caller holds the lock)."""
+        if self._running is job:
+            self._running = None
+            self._dispatch()
+            self._cond.notify_all()
+
+    def _run_job(self, job: BulkJob) -> None:
+        """A job's thread: one pipeline run over all its images."""
+        print(f"[Scheduler] Starting bulk job {job.id} ({job.name})")
+        if self.on_job_started:
+            self.on_job_started(job)
+
+        try:
+            stats = job.pipeline.run(self._feed(job))
+        except Exception as e:
+            print(f"[Scheduler] Bulk job {job.id} failed: {e}")
+            stats = job.pipeline.get_stats()
+
+        with self._cond:
+            self._release_turn(job)
+            job._add_run(stats)
+            if job.state != CANCELLED:
+                job.state = DONE
+            self._jobs.remove(job)
+            self._cond.notify_all()
+
+        print(f"[Scheduler] Bulk job {job.id} {job.state} at {job.position}/{job.total}")
+        if self.on_job_finished:
+            self.on_job_finished(job)
+
+    def _feed(self, job: BulkJob):
+        """A job's paths, fed while it has the turn."""
+        fed = 0
+        while True:
+            with self._cond:
+                while self._running is not job and job.state != CANCELLED and not self._shutdown:
+                    self._cond.wait()
+                if job.state == CANCELLED or job.position >= job.total or self._shutdown:
+                    self._release_turn(job)
+                    return
+                if fed >= self.slice_size and any(
+                    other is not job and self._wants_turn(other) for other in self._jobs
+                ):
+                    # End of the slice: the job with the lowest pass feeds
+                    # next (maybe this one again); images in flight go on
+                    job.state = WAITING
+                    self._release_turn(job)
+                    fed = 0
+                    continue
+                path = job.paths[job.position]
+                job.position += 1
+                # Advanced as paths are fed, so a job submitted mid-slice
+                # starts level with the running one
+                job._pass += 1 / job.weight
+            fed += 1
+            yield path
@@ -0,0 +1,435 @@
+"""
+Image sequences - numbered frames (turntables, video exports) with keyframe inference.
+
+Files like shoe_0001.png ... shoe_0360.png are grouped into a sequence and
+processed in order. Every keyframe_interval-th frame (and the last) runs
+the model. Frames in between get their mask from the two surrounding
+keyframes:
+
+1. Motion compensation: the keyframe's subject is tracked into the frame
+   by phase correlation (utils.dedup) on a window around the subject,
+   weighted towards the subject, which follows camera shake, pans and a
+   subject moving over a still background.
+2. Verification: a keyframe is only used when the subject looks the same
+   after alignment (the residual is below max_residual).
+3. Temporal smoothing: the aligned keyframe masks are blended, weighted by
+   how close each keyframe is, so edges change gradually instead of
+   jumping at every keyframe.
+
+A frame that neither keyframe explains (fast motion, a cut) runs the model
+itself. Flicker - the mean change of the mask between consecutive frames -
+is reported with the throughput, so settings can be checked against the
+keyframe-per-frame baseline.
+
+In a BulkPipeline, group_sequences picks sequences out of the input stream
+in the feeder, and the inference stage runs each one with a SequenceRunner.
+Frames then go on through the pipeline's post and write stages like any
+other image, overlapping with the rest of the inputs.
+"""
+
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+from PIL import Image, ImageFilter
+from rembg.bg import fix_image_orientation
+
+try:
+    from core.metrics import get_metrics, span
+    from core.pipeline import PipelineItem, build_output_path
+    from utils.dedup import Fingerprint, align_masks, alignment_residual, phase_correlation
+except ImportError:
+    from .metrics import get_metrics, span
+    from .pipeline import PipelineItem, build_output_path
+    from ..utils.dedup import Fingerprint, align_masks, alignment_residual, phase_correlation
+
+
+# Shortest run of numbered files treated as a sequence
+MIN_SEQUENCE_LENGTH = 8
+
+# Frames between model runs
+KEYFRAME_INTERVAL = 8
+
+# Largest alignment residual (standard deviations, see utils.dedup) for a
+# keyframe mask to be carried over to a frame
+MAX_RESIDUAL = 0.25
+
+# Masks are compared at this size for the flicker metric
+FLICKER_SIZE = 128
+
+# Padding around the subject for motion tracking, as a fraction of its size
+TRACK_PADDING = 0.25
+
+# Width of the edge band around the subject that counts in tracking (alignment-copy pixels)
+TRACK_EDGE = 9
+
+# "name_0001", "name.0001", "0001"
+_NUMBERED = re.compile(r"^(.*?)(\d+)$")
+
+
+def find_sequences(
+    paths: Iterable,
+    min_length: int = MIN_SEQUENCE_LENGTH
+) -> Tuple[List[List[Path]], List[Path]]:
+    """
+    Split input paths into numbered sequences and everything else.
+
+    Files belong to one sequence when they share a folder, a name prefix,
+    a digit count and an extension (gaps in the numbering are allowed).
+
+    Returns:
+        (sequences, others) - each sequence sorted by frame number, others
+        in their original order
+    """
+    paths = [Path(p) for p in paths]
+    groups: Dict[tuple, List[Tuple[int, Path]]] = {}
+    for path in paths:
+        key, number = _sequence_key(path)
+        if key is not None:
+            groups.setdefault(key, []).append((number, path))
+
+    sequences = []
+    in_sequence = set()
+    for frames in groups.values():
+        if len(frames) >= min_length:
+            frames.sort()
+            sequences.append([path for _, path in frames])
+            in_sequence.update(path for _, path in frames)
+
+    return sequences, [path for path in paths if path not in in_sequence]
+
+
+def group_sequences(
+    paths: Iterable,
+    min_length: int = MIN_SEQUENCE_LENGTH,
+    exclude: Optional[Callable[[Path], bool]] = None
+) -> Iterator[Union[Path, List[Path]]]:
+    """
+    find_sequences for a stream: yields each sequence as a list of paths
+    (sorted by frame number) and everything else path by path, in input
+    order. Only the current run of numbered files is held back, so the
+    input is read lazily; frames of a sequence are expected next to each
+    other, as a folder listing gives them.
+
+    Args:
+        paths: Input paths
+        min_length: Shortest run treated as a sequence
+        exclude: Paths that are never frames (e.g. previous outputs)
+    """
+    run: List[Tuple[int, Path]] = []
+    run_key = None
+    for path in paths:
+        path = Path(path)
+        key, number = (None, 0) if exclude is not None and exclude(path) else _sequence_key(path)
+        if run and key != run_key:
+            yield from _flush_run(run, min_length)
+            run = []
+        if key is None:
+            yield path
+        else:
+            run_key = key
+            run.append((number, path))
+    yield from _flush_run(run, min_length)
+
+
+def _sequence_key(path: Path) -> Tuple[Optional[tuple], int]:
+    """(folder, prefix, digit count, extension) of a numbered file and its number, or (None, 0)."""
+    match = _NUMBERED.match(path.stem)
+    if not match:
+        return None, 0
+    prefix, digits = match.groups()
+    return (path.parent, prefix, len(digits), path.suffix.lower()), int(digits)
+
+
+def _flush_run(run: List[Tuple[int, Path]], min_length: int) -> Iterator[Union[Path, List[Path]]]:
+    if len(run) >= min_length:
+        yield [path for _, path in sorted(run)]
+    else:
+        for _, path in run:
+            yield path
+
+
+class _Stopped(Exception):
+    """The pipeline was aborted in the middle of a sequence."""
+
+
+class _Keyframe:
+    """
+    A frame whose masks came from the model, with what is needed to track
+    its subject into neighbouring frames.
+    """
+
+    def __init__(self, fingerprint: Fingerprint, masks: List[Image.Image]):
+        self.fingerprint = fingerprint
+        self.masks = masks
+
+        # Tracking runs on a window around the subject, weighted towards the
+        # subject and its edge, so a subject moving over a still background
+        # is followed instead of the background
+        h, w = fingerprint.small.shape
+        subject = masks[0].resize((w, h), Image.Resampling.BILINEAR) if masks else None
+        box = subject.point(lambda v: 255 if v > 127 else 0).getbbox() if subject else None
+        if box is None:
+            self.window = (slice(0, h), slice(0, w))
+            self.weight = None
+        else:
+            left, top, right, bottom = box
+            pad_x = max(8, round((right - left) * TRACK_PADDING))
+            pad_y = max(8, round((bottom - top) * TRACK_PADDING))
+            self.window = (
+                slice(max(0, top - pad_y), min(h, bottom + pad_y)),
+                slice(max(0, left - pad_x), min(w, right + pad_x)),
+            )
+            band = subject.filter(ImageFilter.MaxFilter(TRACK_EDGE)).filter(ImageFilter.GaussianBlur(TRACK_EDGE / 2))
+            self.weight = np.asarray(band, dtype=np.float32)[self.window] / 255.0
+
+        reference = fingerprint.small[self.window]
+        self.reference = reference - reference.mean()
+        if self.weight is not None:
+            self.reference = self.reference * self.weight
+
+    def track(self, fingerprint: Fingerprint) -> Tuple[float, float, float]:
+        """
+        Motion of the subject from this keyframe to another frame.
+
+        Returns:
+            (dx, dy, residual) in alignment-copy pixels; residual is the
+            subject-weighted difference after alignment (see utils.dedup)
+        """
+        moved = fingerprint.small[self.window]
+        dx, dy = phase_correlation(self.reference, moved - moved.mean())
+        residual = alignment_residual(
+            self.fingerprint.small[self.window], moved, round(dx), round(dy), self.weight
+        )
+        return dx, dy, residual
+
+
+class SequenceRunner:
+    """
+    Masks one sequence with a BulkPipeline's processor and options, on the
+    pipeline's inference thread, and hands each frame on to its post stage.
+    """
+
+    def __init__(
+        self,
+        pipeline,
+        keyframe_interval: int = KEYFRAME_INTERVAL,
+        max_residual: float = MAX_RESIDUAL
+    ):
+        """
+        Args:
+            pipeline: BulkPipeline whose settings and callbacks are used
+            keyframe_interval: Frames between model runs
+            max_residual: Largest alignment residual for carrying a mask over
+        """
+        self.pipeline = pipeline
+        self.keyframe_interval = max(1, keyframe_interval)
+        self.max_residual = max_residual
+        self._lock = threading.Lock()
+        self._keyframes = 0
+        self._propagated = 0
+        # Frames sent on or failed
+        self._handled = set()
+        # Small output masks waiting for a neighbour, and the differences so far
+        self._flicker_masks: Dict[int, np.ndarray] = {}
+        self._flicker_seen = set()
+        self._flicker: List[float] = []
+
+    def run(self, paths: List[Path]) -> dict:
+        """
+        Mask the frames in order, sending each on to the pipeline's post
+        stage (cutout, post-processing and writing happen there).
+
+        Returns:
+            Dict with frames, keyframes, propagated, elapsed_seconds,
+            frames_per_second (masking, up to the last frame sent on),
+            flicker_mean and flicker_max
+        """
+        self._keyframes = 0
+        self._propagated = 0
+        self._handled = set()
+        self._flicker_masks = {}
+        self._flicker_seen = set()
+        self._flicker = []
+        start = time.perf_counter()
+
+        keys = list(range(0, len(paths), self.keyframe_interval))
+        if keys[-1] != len(paths) - 1:
+            keys.append(len(paths) - 1)
+
+        try:
+            self._checkpoint()
+            previous = self._keyframe(paths, keys[0])
+            for a, b in zip(keys, keys[1:]):
+                self._checkpoint()
+                following = self._keyframe(paths, b)
+                for index in range(a + 1, b):
+                    self._checkpoint()
+                    self._propagate(paths, index, (a, previous), (b, following))
+                previous = following
+        except _Stopped:
+            # Aborted: frames already sent on are still written, the rest
+            # are dropped like any image not through inference yet
+            for index, path in self._unhandled(paths):
+                get_metrics().inc("inputs_cancelled")
+                with self._lock:
+                    self.pipeline._finish_item(
+                        "cancelled", PipelineItem(index, path, build_output_path(path, self.pipeline.suffix))
+                    )
+        except Exception as e:
+            # Every frame must end in an outcome
+            for index, path in self._unhandled(paths):
+                self._fail(PipelineItem(index, path, build_output_path(path, self.pipeline.suffix)), e)
+
+        elapsed = time.perf_counter() - start
+        flicker = self._flicker
+        metrics = get_metrics()
+        metrics.inc("sequence_frames", len(paths))
+        metrics.inc("sequence_keyframes", self._keyframes)
+        return {
+            "frames": len(paths),
+            "keyframes": self._keyframes,
+            "propagated": self._propagated,
+            "elapsed_seconds": round(elapsed, 3),
+            "frames_per_second": round(len(paths) / elapsed, 2) if elapsed > 0 else 0.0,
+            "flicker_mean": round(float(np.mean(flicker)), 5) if flicker else 0.0,
+            "flicker_max": round(float(np.max(flicker)), 5) if flicker else 0.0,
+        }
+
+    def _unhandled(self, paths: List[Path]) -> List[Tuple[int, Path]]:
+        return [(index, path) for index, path in enumerate(paths) if index not in self._handled]
+
+    def _checkpoint(self) -> None:
+        """
+        Wait while the pipeline is paused or interactive work goes first.
+        A sequence is one item in flight: a cancelled run finishes it, an
+        aborted one stops it.
+        """
+        if not self.pipeline._in_flight_may_continue():
+            raise _Stopped()
+        if self.pipeline.inference_gate is not None:
+            self.pipeline.inference_gate()
+
+    def _load(self, paths: List[Path], index: int) -> Tuple[PipelineItem, Optional[Image.Image]]:
+        path = paths[index]
+        item = PipelineItem(index, path, build_output_path(path, self.pipeline.suffix))
+        try:
+            with item.timings.activate():
+                with span("decode"):
+                    image = Image.open(path)
+                    image.load()
+                image = fix_image_orientation(image).convert("RGB")
+        except Exception as e:
+            self._fail(item, e)
+            return item, None
+        return item, image
+
+    def _keyframe(self, paths: List[Path], index: int) -> Optional[_Keyframe]:
+        """Run the model on a frame and queue its output. None if the frame failed."""
+        item, image = self._load(paths, index)
+        if image is None:
+            return None
+        masks = self._predict(item, image)
+        if masks is None:
+            return None
+        return _Keyframe(Fingerprint(image), masks)
+
+    def _predict(self, item: PipelineItem, image: Image.Image) -> Optional[List[Image.Image]]:
+        try:
+            with item.timings.activate():
+                masks = self.pipeline.processor.predict_masks(image, self.pipeline.options)
+        except Exception as e:
+            self._fail(item, e)
+            return None
+        self._keyframes += 1
+        self._emit(item, image, masks)
+        return masks
+
+    def _propagate(
+        self,
+        paths: List[Path],
+        index: int,
+        previous: Tuple[int, Optional[_Keyframe]],
+        following: Tuple[int, Optional[_Keyframe]]
+    ) -> None:
+        """Mask a frame from its surrounding keyframes, or with the model if they don't fit."""
+        item, image = self._load(paths, index)
+        if image is None:
+            return
+
+        # The nearer keyframe gets the larger weight
+        (a, previous_key), (b, following_key) = previous, following
+        anchors = [(previous_key, (b - index) / (b - a)), (following_key, (index - a) / (b - a))]
+
+        with item.timings.activate(), span("propagate"):
+            fingerprint = Fingerprint(image)
+            scale = image.width / fingerprint.small.shape[1]
+            aligned = []
+            for keyframe, weight in anchors:
+                if keyframe is None or not keyframe.fingerprint.same_frame(fingerprint):
+                    continue
+                dx, dy, residual = keyframe.track(fingerprint)
+                if residual <= self.max_residual:
+                    aligned.append((align_masks(keyframe.masks, image.size, dx * scale, dy * scale), weight))
+
+            masks = None
+            if aligned and all(len(m) == len(aligned[0][0]) for m, _ in aligned):
+                total = sum(weight for _, weight in aligned)
+                masks = []
+                for n in range(len(aligned[0][0])):
+                    blended = sum(np.asarray(m[n], dtype=np.float32) * (weight / total) for m, weight in aligned)
+                    masks.append(Image.fromarray(np.clip(blended + 0.5, 0, 255).astype(np.uint8), mode="L"))
+
+        if masks is None:
+            # Neither keyframe explains this frame - it gets its own model run
+            self._predict(item, image)
+        else:
+            self._propagated += 1
+            self._emit(item, image, masks)
+
+    def _emit(self, item: PipelineItem, image: Image.Image, masks: List[Image.Image]) -> None:
+        """Send a masked frame on to the pipeline's post stage (blocks while its queue is full)."""
+        if masks:
+            self._record_flicker(item.index, masks[0])
+        item.image = image
+        item.masks = masks
+        self._handled.add(item.index)
+        self.pipeline._send_to_post(item)
+
+    def _record_flicker(self, index: int, mask: Image.Image) -> None:
+        """Compare a frame's mask with its neighbours (frames finish out of order)."""
+        small = mask.copy()
+        small.thumbnail((FLICKER_SIZE, FLICKER_SIZE), Image.Resampling.BILINEAR)
+        small = np.asarray(small, dtype=np.float32) / 255.0
+        with self._lock:
+            for neighbour in (index - 1, index + 1):
+                other = self._flicker_masks.get(neighbour)
+                if other is not None and other.shape == small.shape:
+                    self._flicker.append(float(np.abs(small - other).mean()))
+            self._flicker_masks[index] = small
+            self._flicker_seen.add(index)
+            # A mask is no longer needed once both neighbours have been compared with it
+            for done in (index - 1, index, index + 1):
+                if done - 1 in self._flicker_seen and done + 1 in self._flicker_seen:
+                    self._flicker_masks.pop(done, None)
+
+    def _fail(self, item: PipelineItem, error: Exception) -> None:
+        self._handled.add(item.index)
+        item.release()
+        item.error = str(error) if str(error) else type(error).__name__
+        item.timings.status = "error"
+        get_metrics().record_image(item.timings)
+        with self._lock:
+            self.pipeline._finish_item("failed", item)
+
+
+def format_sequence_summary(name: str, stats: dict) -> str:
+    """One-line summary of a SequenceRunner.run() result."""
+    return (
+        f"{name}: {stats['frames']} frames, {stats['keyframes']} keyframes, "
+        f"{stats['frames_per_second']} frames/s, flicker {stats['flicker_mean']:.4f} "
+        f"(max {stats['flicker_max']:.4f})"
+    )
@@ -2,7 +2,10 @@
 Base processor interface - defines the contract for all image processors.
 """
 
+import asyncio
+import functools
 from abc import ABC, abstractmethod
+from concurrent.futures import Executor
 from pathlib import Path
 from PIL import Image
 from typing import Optional, Callable
@@ -33,6 +36,66 @@ class BaseProcessor(ABC):
         """
         pass
 
+    @abstractmethod
+    def process_image(
+        self,
+        image: Image.Image,
+        options: dict,
+        status_callback: Optional[Callable[[str], None]] = None
+    ) -> Image.Image:
+        """
+        Process an already decoded image to remove/modify background.
+
+        Used by the bulk pipeline so that file reading and decoding can
+        run on other threads while the model is busy.
+
+        Args:
+            image: Decoded PIL Image
+            options: Processing options dict
+            status_callback: Optional callback for status updates
+
+        Returns:
+            Processed PIL Image (RGBA)
+        """
+        pass
+
+    async def aprocess(
+        self,
+        input_path: Path,
+        output_path: Path,
+        options: dict,
+        status_callback: Optional[Callable[[str], None]] = None,
+        executor: Optional[Executor] = None
+    ) -> Image.Image:
+        """
+        process() for asyncio code: runs in an executor so the event loop
+        keeps running. For concurrency limits, timeouts and batches of
+        images see core.async_api.AsyncRemover.
+
+        Args:
+            executor: Where to run (default: the loop's default executor)
+
+        Returns:
+            Processed PIL Image (RGBA)
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            executor, functools.partial(self.process, input_path, output_path, options, status_callback)
+        )
+
+    async def aprocess_image(
+        self,
+        image: Image.Image,
+        options: dict,
+        status_callback: Optional[Callable[[str], None]] = None,
+        executor: Optional[Executor] = None
+    ) -> Image.Image:
+        """process_image() for asyncio code (see aprocess)."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            executor, functools.partial(self.process_image, image, options, status_callback)
+        )
+
     @abstractmethod
     def is_available(self) -> bool:
         """Check if this processor is available (dependencies installed)."""
@@ -0,0 +1,159 @@
+"""
+Micro-batching - concurrent mask requests coalesced into one model call.
+
+Callers on several threads submit one image each and block; a batching
+thread takes the first waiting image and collects more for up to
+max_latency_ms (or until max_batch_size), then runs them through
+RembgProcessor.predict_masks_batch in one call per model. Used by the HTTP
+server (one request per thread) and the bulk pipeline
+(inference_batch_size, one image per inference worker).
+"""
+
+import queue
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from PIL import Image
+
+from .rembg_processor import MASK_OPTIONS
+
+try:
+    from core.metrics import count_into, get_metrics
+    from core.profiling import profile_thread
+except ImportError:
+    from ..core.metrics import count_into, get_metrics
+    from ..core.profiling import profile_thread
+
+
+DEFAULT_MAX_BATCH_SIZE = 4
+DEFAULT_MAX_LATENCY_MS = 20
+
+
+class _Pending:
+    """A request waiting for its masks."""
+
+    def __init__(self, image: Image.Image, options: dict):
+        self.image = image
+        self.options = options
+        self.masks: Optional[List[Image.Image]] = None
+        self.error: Optional[Exception] = None
+        self.done = threading.Event()
+
+
+class MicroBatcher:
+    """
+    Coalesces concurrent mask requests into batches.
+
+    The first request of a batch waits at most max_latency_ms for others to
+    arrive, so a lone request pays only that bound and a burst is run as
+    one model call per model.
+    """
+
+    def __init__(self, processor, max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+                 max_latency_ms: float = DEFAULT_MAX_LATENCY_MS, metric_prefix: str = "server",
+                 profiler=None, counters=None):
+        """
+        Args:
+            processor: RembgProcessor (needs predict_masks_batch)
+            max_batch_size: Most images run in one model call
+            max_latency_ms: Longest the first image waits for others
+            metric_prefix: Counters are {prefix}_batches and
+                {prefix}_batched_images
+            profiler: core.profiling.RunProfiler for the batching thread
+                (stage "batch")
+            counters: core.metrics.RunCounters the batching thread also
+                counts into (for a batcher serving a single run)
+        """
+        self.processor = processor
+        self.metric_prefix = metric_prefix
+        self.profiler = profiler
+        self.counters = counters
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_latency = max(0.0, max_latency_ms) / 1000.0
+        self.batches = 0
+        self.batched_images = 0
+        self._queue: "queue.Queue[Optional[_Pending]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def submit(self, image: Image.Image, options: dict) -> List[Image.Image]:
+        """Queue an image and block until its masks are ready."""
+        pending = _Pending(image, options)
+        self._queue.put(pending)
+        pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.masks
+
+    def _collect(self, first: _Pending) -> Tuple[List[_Pending], bool]:
+        """Gather requests arriving within the latency bound. Returns (batch, stop)."""
+        batch = [first]
+        deadline = time.perf_counter() + self.max_latency
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                pending = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if pending is None:
+                return batch, True
+            batch.append(pending)
+        return batch, False
+
+    def _run(self) -> None:
+        with count_into(self.counters), profile_thread(self.profiler, "batch"):
+            while True:
+                first = self._queue.get()
+                if first is None:
+                    return
+                batch, stop = self._collect(first)
+                self._run_batch(batch)
+                if stop:
+                    return
+
+    @staticmethod
+    def _batch_key(options: dict) -> tuple:
+        """Requests can share a model call when every mask option matches."""
+        return tuple(options.get(name) for name in MASK_OPTIONS)
+
+    def _run_batch(self, batch: List[_Pending]) -> None:
+        # One model call per model; requests for the same model share it
+        groups: Dict[tuple, List[_Pending]] = {}
+        for pending in batch:
+            groups.setdefault(self._batch_key(pending.options), []).append(pending)
+
+        for group in groups.values():
+            try:
+                results = self.processor.predict_masks_batch(
+                    [p.image for p in group], group[0].options
+                )
+                for pending, masks in zip(group, results):
+                    pending.masks = masks
+            except Exception as e:
+                for pending in group:
+                    pending.error = e
+            finally:
+                for pending in group:
+                    pending.done.set()
+
+        self.batches += 1
+        self.batched_images += len(batch)
+        get_metrics().inc(f"{self.metric_prefix}_batches")
+        get_metrics().inc(f"{self.metric_prefix}_batched_images", len(batch))
@@ -2,22 +2,97 @@
 Rembg processor - CPU-based background removal using rembg library.
 """
 
-import io
+import threading
+from collections import OrderedDict
 from pathlib import Path
 from PIL import Image
-from typing import Optional, Callable
+from typing import List, Optional, Callable
 
-from rembg import remove, new_session
+import numpy as np
+from PIL import ImageChops
+
+from rembg.bg import alpha_matting_cutout, naive_cutout, get_concat_v_multi, fix_image_orientation
 
 from .base import BaseProcessor
+from .sessions import capture_model_feed, create_session, make_session_options, predict_from_outputs
+
+try:
+    from core.constants import CASCADE_FAST_MODEL
+    from core.metrics import get_metrics, span
+    from utils.animation import KEYFRAME_BATCH, KEYFRAME_THRESHOLD, Animation, load_frames, select_keyframes
+    from utils.dedup import MAX_HASH_DISTANCE, MAX_RESIDUAL, DuplicateIndex, Fingerprint
+    from utils.image import subject_bbox
+    from utils.keying import KEY_TOLERANCE, key_solid_background
+    from utils.mask import is_confident
+    from utils.matting import fast_matting_cutout
+    from utils.roi import ROI_MARGIN, find_roi, first_pass_image, paste_masks
+except ImportError:
+    from ..core.constants import CASCADE_FAST_MODEL
+    from ..core.metrics import get_metrics, span
+    from ..utils.animation import KEYFRAME_BATCH, KEYFRAME_THRESHOLD, Animation, load_frames, select_keyframes
+    from ..utils.dedup import MAX_HASH_DISTANCE, MAX_RESIDUAL, DuplicateIndex, Fingerprint
+    from ..utils.image import subject_bbox
+    from ..utils.keying import KEY_TOLERANCE, key_solid_background
+    from ..utils.mask import is_confident
+    from ..utils.matting import fast_matting_cutout
+    from ..utils.roi import ROI_MARGIN, find_roi, first_pass_image, paste_masks
+
+
+# Options predict_masks / predict_masks_batch read: images whose values all
+# match can share a model call (see processors.batching.MicroBatcher)
+MASK_OPTIONS = (
+    "model",
+    "cascade",
+    "cascade_fast_model",
+    "cascade_threshold",
+    "fast_path",
+    "fast_path_tolerance",
+    "dedup",
+    "dedup_max_distance",
+    "dedup_max_residual",
+    "roi",
+    "roi_margin",
+)
 
 
 class RembgProcessor(BaseProcessor):
     """Background removal using rembg with various ONNX models."""
 
-    def __init__(self):
-        self._session = None
-        self._current_model = None
+    def __init__(
+        self,
+        session_factory: Optional[Callable[[str], object]] = None,
+        max_sessions: int = 1,
+        shared_weights: bool = False,
+        intra_op_threads: int = 0
+    ):
+        """
+        Args:
+            session_factory: Creates a session for a model name. Defaults to
+                create_session (rembg models plus quantized variants);
+                benchmarks pass a stub here.
+            max_sessions: How many model sessions to keep loaded at once
+                (least recently used is dropped first). Cascade mode uses
+                two models; with 1, every escalation reloads them.
+            shared_weights: Memory-map model weights so worker processes on
+                one machine share them (see processors.sessions); ignored
+                with a session_factory
+            intra_op_threads: Threads per model call (0 = onnxruntime
+                default); ignored with a session_factory
+        """
+        if session_factory is None:
+            session_factory = lambda model: create_session(
+                model, make_session_options(intra_op_threads), shared_weights=shared_weights
+            )
+        self._session_factory = session_factory
+        self._sessions = OrderedDict()
+        self._max_sessions = max(1, max_sessions)
+        self._warned_cascade_sessions = False
+        # Models whose ONNX graph rejected a batched input
+        self._unbatchable = set()
+        # Near-duplicate index per model setup (masks are only reused within one)
+        self._duplicates = {}
+        # Sessions are shared between the UI thread and the bulk pipeline
+        self._lock = threading.Lock()
 
     def process(
         self,
@@ -35,46 +110,451 @@ class RembgProcessor(BaseProcessor):
             alpha_matting_foreground_threshold: int
             alpha_matting_background_threshold: int
             alpha_matting_erode_size: int
+            alpha_matting_method: str - "closed_form" (rembg/pymatting) or
+                "guided" (fast guided-filter refinement, see utils.matting)
+            cascade: bool - run cascade_fast_model first and use `model`
+                only for images whose fast mask is not confident
+            cascade_fast_model: str - fast model for the cascade
+            cascade_threshold: float - largest uncertain-pixel fraction a
+                fast mask may have and still be kept
+            fast_path: bool - key out near-uniform (studio) backgrounds
+                without a model; other images use the model as usual
+            fast_path_tolerance: float - RGB distance that still counts as
+                the background color
+            dedup: bool - reuse the mask of an earlier near-identical image
+                (aligned and verified) instead of running the model again
+            dedup_max_distance: int - largest perceptual hash distance (bits)
+            dedup_max_residual: float - largest verification residual
+            roi: bool - locate the subject on a downscaled copy, then run
+                the model on a crop around it (small subjects in large frames)
+            roi_margin: float - padding around the subject as a fraction
+                of its size
+        """
+        # Read input image
+        with span("decode"):
+            image = Image.open(input_path)
+            image.load()
+
+        return self.process_image(image, options, status_callback)
+
+    def process_image(
+        self,
+        image: Image.Image,
+        options: dict,
+        status_callback: Optional[Callable[[str], None]] = None
+    ) -> Image.Image:
+        """Process a decoded image using rembg (same options as process)."""
+        image = fix_image_orientation(image)
+
+        masks = self.predict_masks(image, options, status_callback)
+        output_img = self.cutout(image, masks, options)
+
+        return output_img.convert("RGBA")
+
+    def process_animation(
+        self,
+        image: Image.Image,
+        options: dict,
+        status_callback: Optional[Callable[[str], None]] = None
+    ) -> Animation:
         """
+        Process every frame of an animated image (GIF, APNG, WebP).
+
+        Only keyframes go to the model (see utils.animation.select_keyframes);
+        the frames in between reuse their keyframe's mask. Transparent areas
+        of the input frames stay transparent.
+
+        Options (besides those of process):
+            animation_keyframe_threshold: float - mean frame difference (0-1)
+                from the last keyframe that triggers a new inference
+        """
+        animation = load_frames(image)
+        keys = select_keyframes(
+            animation.frames, options.get("animation_keyframe_threshold", KEYFRAME_THRESHOLD)
+        )
+        keyframes = sorted(set(keys))
+
+        metrics = get_metrics()
+        metrics.inc("animation_frames", len(animation.frames))
+        metrics.inc("animation_keyframes", len(keyframes))
+        if status_callback:
+            status_callback(f"Animation: {len(animation.frames)} frames, {len(keyframes)} keyframes...")
+
+        frames_rgb = [frame.convert("RGB") for frame in animation.frames]
+        masks = {}
+        for start in range(0, len(keyframes), KEYFRAME_BATCH):
+            chunk = keyframes[start:start + KEYFRAME_BATCH]
+            masks.update(zip(chunk, self.predict_masks_batch([frames_rgb[i] for i in chunk], options)))
+
+        outputs = []
+        for frame, rgb, key in zip(animation.frames, frames_rgb, keys):
+            output = self.cutout(rgb, masks[key], options).convert("RGBA")
+            if output.size == frame.size:
+                output.putalpha(ImageChops.multiply(output.getchannel("A"), frame.getchannel("A")))
+            outputs.append(output)
+        return animation.with_frames(outputs)
+
+    def predict_masks(
+        self,
+        image: Image.Image,
+        options: dict,
+        status_callback: Optional[Callable[[str], None]] = None
+    ) -> List[Image.Image]:
+        """
+        Run the model on an image (or the fast path / cascade, if enabled).
+
+        Returns:
+            List of "L" mode masks at the image size (one for most models)
+        """
+        return self.predict_masks_batch([image], options, status_callback)[0]
+
+    def predict_masks_batch(
+        self,
+        images: List[Image.Image],
+        options: dict,
+        status_callback: Optional[Callable[[str], None]] = None
+    ) -> List[List[Image.Image]]:
+        """
+        Run the model on several images at once.
+
+        The images are stacked into one batched ONNX call when the model
+        accepts a batch dimension; otherwise (or if the batched call fails)
+        they are run one by one. Images should already be orientation-fixed.
+
+        Returns:
+            One mask list per image, as predict_masks would return
+        """
+        results: List[Optional[List[Image.Image]]] = [None] * len(images)
+        if options.get("fast_path", False):
+            results = self._predict_fast_path(images, options, status_callback)
+
+        pending = [i for i, masks in enumerate(results) if masks is None]
+        if pending and options.get("dedup", False):
+            self._predict_dedup(images, pending, results, options, status_callback)
+        elif pending:
+            predicted = self._predict_models([images[i] for i in pending], options, status_callback)
+            for i, masks in zip(pending, predicted):
+                results[i] = masks
+        return results
+
+    def _predict_dedup(
+        self,
+        images: List[Image.Image],
+        pending: List[int],
+        results: List[Optional[List[Image.Image]]],
+        options: dict,
+        status_callback: Optional[Callable[[str], None]] = None
+    ) -> None:
+        """
+        Fill results[i] for the pending images, running the model only on one
+        representative per group of near-duplicates (see utils.dedup).
+
+        Each round reuses verified masks from the index, sends the first image
+        of every remaining look-alike group to the model, and leaves the rest
+        for the next round - where they either match the new representative
+        or fail verification and become representatives themselves.
+        """
+        index = self._get_duplicate_index(options)
+        with span("dedup"):
+            fingerprints = {i: Fingerprint(images[i]) for i in pending}
+
+        reused = 0
+        remaining = list(pending)
+        while remaining:
+            representatives, waiting = [], []
+            with span("dedup"):
+                for i in remaining:
+                    masks = index.reuse(fingerprints[i])
+                    if masks is not None:
+                        results[i] = masks
+                        reused += 1
+                    elif any(index.similar(fingerprints[i], fingerprints[j]) for j in representatives):
+                        waiting.append(i)
+                    else:
+                        representatives.append(i)
+
+            if representatives:
+                predicted = self._predict_models(
+                    [images[i] for i in representatives], options, status_callback
+                )
+                for i, masks in zip(representatives, predicted):
+                    results[i] = masks
+                    index.add(fingerprints[i], masks)
+            remaining = waiting
+
+        metrics = get_metrics()
+        metrics.inc("dedup_images", len(pending))
+        metrics.inc("dedup_reused", reused)
+        if reused and status_callback:
+            status_callback("Near-duplicate - reused the previous mask")
+
+    def _get_duplicate_index(self, options: dict) -> DuplicateIndex:
+        """
+        The near-duplicate index for the options' mask setup. Keyed on every
+        mask option (as MicroBatcher groups requests), so a mask is only
+        reused under the settings it was computed with - ROI runs after
+        dedup, so even roi_margin matters.
+        """
+        key = tuple(options.get(name) for name in MASK_OPTIONS)
+        with self._lock:
+            index = self._duplicates.get(key)
+            if index is None:
+                index = self._duplicates[key] = DuplicateIndex(
+                    max_distance=options.get("dedup_max_distance", MAX_HASH_DISTANCE),
+                    max_residual=options.get("dedup_max_residual", MAX_RESIDUAL),
+                )
+            return index
+
+    def _predict_models(
+        self,
+        images: List[Image.Image],
+        options: dict,
+        status_callback: Optional[Callable[[str], None]] = None
+    ) -> List[List[Image.Image]]:
+        """Predict masks with the selected model, through the ROI passes and cascade if enabled."""
+        if options.get("roi", False):
+            return self._predict_roi(images, options, status_callback)
+        return self._predict_selected(images, options, status_callback)
+
+    def _predict_selected(
+        self,
+        images: List[Image.Image],
+        options: dict,
+        status_callback: Optional[Callable[[str], None]] = None
+    ) -> List[List[Image.Image]]:
+        """Predict masks with the selected model, through the cascade if enabled."""
         model = options.get("model", "birefnet-general")
+        fast_model = options.get("cascade_fast_model", CASCADE_FAST_MODEL)
+
+        if options.get("cascade", False) and fast_model != model:
+            return self._predict_cascade(images, model, fast_model, options, status_callback)
+        return self._run_model(model, images, status_callback)
+
+    def _predict_roi(
+        self,
+        images: List[Image.Image],
+        options: dict,
+        status_callback: Optional[Callable[[str], None]] = None
+    ) -> List[List[Image.Image]]:
+        """
+        Two passes (see utils.roi): locate the subject on downscaled copies,
+        then predict again on crops around subjects small enough to gain
+        from it. Other images keep their first pass mask, scaled up.
+        """
+        with span("roi"):
+            small = [first_pass_image(image) for image in images]
+        coarse = self._predict_selected(small, options, status_callback)
+
+        margin = options.get("roi_margin", ROI_MARGIN)
+        with span("roi"):
+            boxes = [find_roi(masks, image.size, margin) for image, masks in zip(images, coarse)]
+        cropped = [i for i, box in enumerate(boxes) if box is not None]
 
-        # Get or create session
-        if self._session is None or self._current_model != model:
+        metrics = get_metrics()
+        metrics.inc("roi_images", len(images))
+        metrics.inc("roi_cropped", len(cropped))
+
+        results = []
+        for image, masks in zip(images, coarse):
+            results.append([
+                mask if mask.size == image.size else mask.resize(image.size, Image.Resampling.LANCZOS)
+                for mask in masks
+            ])
+        if cropped:
             if status_callback:
-                status_callback(f"Loading model: {model}...")
-            self._session = new_session(model)
-            self._current_model = model
+                status_callback("Small subject - refining on a crop...")
+            refined = self._predict_selected([images[i].crop(boxes[i]) for i in cropped], options, status_callback)
+            for i, masks in zip(cropped, refined):
+                results[i] = paste_masks(masks, boxes[i], images[i].size)
+        return results
 
-        # Read input image
-        with open(input_path, 'rb') as f:
-            input_data = f.read()
+    def _predict_fast_path(
+        self,
+        images: List[Image.Image],
+        options: dict,
+        status_callback: Optional[Callable[[str], None]] = None
+    ) -> List[Optional[List[Image.Image]]]:
+        """
+        Key out solid backgrounds without a model (see utils.keying).
 
-        # Build kwargs
-        if status_callback:
-            status_callback("Removing background...")
+        Returns:
+            Mask list per image, or None for images that need the model
+        """
+        tolerance = options.get("fast_path_tolerance", KEY_TOLERANCE)
+        with span("fast_path"):
+            masks = [key_solid_background(image, tolerance) for image in images]
 
-        kwargs = {
-            "session": self._session,
-        }
+        taken = sum(mask is not None for mask in masks)
+        metrics = get_metrics()
+        metrics.inc("fast_path_images", len(images))
+        metrics.inc("fast_path_taken", taken)
+        if taken and status_callback:
+            status_callback("Solid background - keyed without the model")
+        return [[mask] if mask is not None else None for mask in masks]
 
-        if options.get("alpha_matting", False):
-            kwargs["alpha_matting"] = True
-            kwargs["alpha_matting_foreground_threshold"] = options.get(
-                "alpha_matting_foreground_threshold", 240
-            )
-            kwargs["alpha_matting_background_threshold"] = options.get(
-                "alpha_matting_background_threshold", 10
-            )
-            kwargs["alpha_matting_erode_size"] = options.get(
-                "alpha_matting_erode_size", 10
-            )
+    def _predict_cascade(
+        self,
+        images: List[Image.Image],
+        model: str,
+        fast_model: str,
+        options: dict,
+        status_callback: Optional[Callable[[str], None]] = None
+    ) -> List[List[Image.Image]]:
+        """
+        Run the fast model on every image and the main model only on images
+        whose fast mask is not confident (see utils.mask.is_confident).
+        """
+        if self._max_sessions < 2 and not self._warned_cascade_sessions:
+            # The configured cap is kept (it may be there to bound memory)
+            self._warned_cascade_sessions = True
+            print(f"[Rembg] Cascade with max_sessions={self._max_sessions}: "
+                  f"{fast_model} and {model} are reloaded in turn (use max_sessions=2 to keep both)")
+
+        results = self._run_model(fast_model, images, status_callback)
+        threshold = options.get("cascade_threshold", 0.03)
+        with span("confidence"):
+            escalate = [
+                i for i, masks in enumerate(results)
+                if not masks or not is_confident(masks[0], max_uncertain_fraction=threshold)
+            ]
+
+        metrics = get_metrics()
+        metrics.inc("cascade_images", len(images))
+        metrics.inc("cascade_escalated", len(escalate))
 
-        output_data = remove(input_data, **kwargs)
+        if escalate:
+            if status_callback:
+                status_callback(f"Low confidence - refining with {model}...")
+            refined = self._run_model(model, [images[i] for i in escalate], status_callback)
+            for i, masks in zip(escalate, refined):
+                results[i] = masks
+        return results
 
-        # Load the processed image
-        output_img = Image.open(io.BytesIO(output_data)).convert("RGBA")
+    def _run_model(
+        self,
+        model: str,
+        images: List[Image.Image],
+        status_callback: Optional[Callable[[str], None]] = None
+    ) -> List[List[Image.Image]]:
+        """Predict masks with one model, batched when possible."""
+        with self._lock:
+            session = self._get_session(model, status_callback)
 
-        return output_img
+            if status_callback:
+                status_callback("Removing background...")
+
+            with span("inference"):
+                if len(images) > 1 and model not in self._unbatchable:
+                    try:
+                        return self._predict_batched(session, images)
+                    except Exception as e:
+                        self._unbatchable.add(model)
+                        print(f"[Rembg] Batched inference unavailable for {model}, running images one by one: {e}")
+                return [session.predict(image) for image in images]
+
+    def _predict_batched(self, session, images: List[Image.Image]) -> List[List[Image.Image]]:
+        """One ONNX run for all images, reusing the session's own pre/postprocessing."""
+        inner_session = getattr(session, "inner_session", None)
+        if inner_session is None:
+            raise RuntimeError("session has no ONNX inner_session")
+        batch_dim = inner_session.get_inputs()[0].shape[0]
+        if isinstance(batch_dim, int) and batch_dim < len(images):
+            raise RuntimeError(f"model input has a fixed batch size of {batch_dim}")
+
+        feeds = [capture_model_feed(session, image) for image in images]
+        batch = {name: np.concatenate([feed[name] for feed in feeds]) for name in feeds[0]}
+        outputs = inner_session.run(None, batch)
+
+        return [
+            predict_from_outputs(session, image, [out[i:i + 1] for out in outputs])
+            for i, image in enumerate(images)
+        ]
+
+    def cutout(self, image: Image.Image, masks: List[Image.Image], options: dict) -> Image.Image:
+        """
+        Apply predicted masks to an image, with alpha matting if enabled.
+
+        Returns:
+            RGBA cutout (masks are stacked vertically when there are several)
+        """
+        matting_args = (
+            options.get("alpha_matting_foreground_threshold", 240),
+            options.get("alpha_matting_background_threshold", 10),
+            options.get("alpha_matting_erode_size", 10),
+        )
+
+        cutouts = []
+        for mask in masks:
+            if options.get("alpha_matting", False):
+                with span("matting"):
+                    cutout = self._matting_cutout(image, mask, options, matting_args)
+            else:
+                with span("cutout"):
+                    cutout = naive_cutout(image, mask)
+            cutouts.append(cutout)
+
+        if not cutouts:
+            return image
+        if len(cutouts) == 1:
+            return cutouts[0]
+        return get_concat_v_multi(cutouts)
+
+    def _matting_cutout(self, image: Image.Image, mask: Image.Image, options: dict, matting_args: tuple) -> Image.Image:
+        """
+        Alpha matting, limited to the box around everything that is not
+        sure background - the rest of the frame is transparent anyway.
+        """
+        background_threshold, erode_size = matting_args[1], matting_args[2]
+        box = subject_bbox(np.asarray(mask), margin=2 * erode_size + 16, threshold=background_threshold)
+        if box is None:
+            return naive_cutout(image, mask)
+        region = (box[2] - box[0]) * (box[3] - box[1])
+        if region < 0.9 * image.width * image.height:
+            full_size = image.size
+            image, mask = image.crop(box), mask.crop(box)
+        else:
+            box = None
+
+        if options.get("alpha_matting_method", "closed_form") == "guided":
+            cutout = fast_matting_cutout(image, mask, *matting_args)
+        else:
+            try:
+                cutout = alpha_matting_cutout(image, mask, *matting_args)
+            except ValueError:
+                # Matting fails on masks without a usable trimap
+                cutout = naive_cutout(image, mask)
+
+        if box is None:
+            return cutout
+        full = Image.new("RGBA", full_size, (0, 0, 0, 0))
+        full.paste(cutout.convert("RGBA"), box[:2])
+        return full
+
+    def load_model(self, model: str, status_callback: Optional[Callable[[str], None]] = None) -> None:
+        """Load a model's session ahead of the first image (warm start)."""
+        with self._lock:
+            self._get_session(model, status_callback)
+
+    def get_loaded_models(self) -> List[str]:
+        """Names of the models with a loaded session, least recently used first."""
+        with self._lock:
+            return list(self._sessions)
+
+    def _get_session(self, model: str, status_callback: Optional[Callable[[str], None]] = None):
+        """Get or create the session for a model (caller holds the lock)."""
+        session = self._sessions.get(model)
+        if session is None:
+            if status_callback:
+                status_callback(f"Loading model: {model}...")
+            # Drop the least recently used session first so two models are
+            # never loaded at once beyond the limit
+            while len(self._sessions) >= self._max_sessions:
+                self._sessions.popitem(last=False)
+            with span("model_load"):
+                session = self._session_factory(model)
+            self._sessions[model] = session
+        self._sessions.move_to_end(model)
+        return session
 
     def is_available(self) -> bool:
         """Rembg is always available (it's a required dependency)."""
@@ -83,7 +563,15 @@ class RembgProcessor(BaseProcessor):
     def get_name(self) -> str:
         return "rembg"
 
+    def set_max_sessions(self, max_sessions: int) -> None:
+        """Change how many sessions stay loaded (e.g. 2 when cascade is turned on)."""
+        with self._lock:
+            self._max_sessions = max(1, max_sessions)
+            while len(self._sessions) > self._max_sessions:
+                self._sessions.popitem(last=False)
+
     def clear_session(self) -> None:
-        """Clear the cached model session."""
-        self._session = None
-        self._current_model = None
+        """Clear the cached model sessions (and the masks kept for dedup)."""
+        with self._lock:
+            self._sessions.clear()
+            self._duplicates.clear()
@@ -10,9 +10,11 @@ import numpy as np
 try:
     from processors.base import BaseProcessor
     from core.config import get_hf_token, set_hf_token
+    from core.metrics import span
 except ImportError:
     from .base import BaseProcessor
     from ..core.config import get_hf_token, set_hf_token
+    from ..core.metrics import span
 
 
 # Check for SAM3 availability
@@ -50,6 +52,20 @@ class Sam3Processor(BaseProcessor):
             keep_subject: bool - True to keep matched object, False to remove it
             hf_token: str - Hugging Face token for model access
         """
+        print(f"[SAM3] Loading image: {input_path}")
+        with span("decode"):
+            image = Image.open(input_path)
+            image.load()
+
+        return self.process_image(image, options, status_callback)
+
+    def process_image(
+        self,
+        image: Image.Image,
+        options: dict,
+        status_callback: Optional[Callable[[str], None]] = None
+    ) -> Image.Image:
+        """Process a decoded image using SAM3 (same options as process)."""
         if not SAM3_AVAILABLE:
             raise RuntimeError("SAM3 is not installed. Run: pip install sam3")
 
@@ -66,8 +82,9 @@ class Sam3Processor(BaseProcessor):
                 set_hf_token(hf_token)
 
             try:
-                self._model = build_sam3_image_model()
-                self._processor = Sam3ProcessorClass(self._model)
+                with span("model_load"):
+                    self._model = build_sam3_image_model()
+                    self._processor = Sam3ProcessorClass(self._model)
                 print("[SAM3] Model loaded successfully")
             except Exception as e:
                 error_msg = str(e)
@@ -86,13 +103,13 @@ class Sam3Processor(BaseProcessor):
         # Load image
         if status_callback:
             status_callback("Processing with SAM3...")
-        print(f"[SAM3] Loading image: {input_path}")
-        image = Image.open(input_path).convert("RGBA")
+        image = image.convert("RGBA")
         print(f"[SAM3] Image size: {image.size}")
 
         # Set image in processor
         print("[SAM3] Setting image in processor...")
-        inference_state = self._processor.set_image(image.convert("RGB"))
+        with span("inference"):
+            inference_state = self._processor.set_image(image.convert("RGB"))
         print(f"[SAM3] Inference state type: {type(inference_state)}")
 
         # Get text prompt
@@ -105,7 +122,8 @@ class Sam3Processor(BaseProcessor):
         print(f"[SAM3] Running with prompt: '{prompt}'")
 
         # Run text-based segmentation
-        output = self._processor.set_text_prompt(state=inference_state, prompt=prompt)
+        with span("inference"):
+            output = self._processor.set_text_prompt(state=inference_state, prompt=prompt)
         print(f"[SAM3] Output keys: {output.keys() if isinstance(output, dict) else type(output)}")
 
         masks = output.get("masks", []) if isinstance(output, dict) else []
@@ -0,0 +1,562 @@
+"""
+Model sessions - rembg sessions plus locally quantized INT8 variants.
+
+A quantized variant is selected like any other model, by name: the base
+model name plus a variant suffix, e.g. "birefnet-general-int8". The file
+is created once with quantize_model (or `bg_remover.py quantize MODEL`)
+and stored next to the FP32 model in the model cache; the session then
+uses the base model's own pre/postprocessing with the INT8 weights.
+
+    int8         Dynamic quantization: INT8 weights, activations quantized
+                 on the fly. No calibration data needed.
+    int8-static  Static quantization (QDQ): activation ranges calibrated on
+                 sample images. Usually faster, needs representative images.
+
+Shared weights: every worker process that creates a session normally reads
+the whole ONNX file and keeps its own private copy of the weights (close to
+1GB for the large models). With shared_weights, the model is optimized once
+and saved next to the original with its weights in a separate, page-aligned
+".data" file; sessions then load that file with graph optimization and
+weight prepacking off, and onnxruntime memory-maps the weights instead of
+copying them. The mapped pages live in the OS page cache, so all processes
+on a machine use one copy and each extra worker only adds its activations.
+Prepacked weights are faster for some kernels (MatMul), so this trades
+some speed for memory; GPU providers copy the weights to the device anyway.
+"""
+
+import os
+import platform
+import time
+import uuid
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+from rembg import new_session
+
+try:
+    from core.constants import REMBG_MODELS
+except ImportError:
+    from ..core.constants import REMBG_MODELS
+
+
+# Model name suffix -> quantization mode
+QUANTIZED_VARIANTS = {
+    "-int8": "dynamic",
+    "-int8-static": "static",
+}
+
+# Masks are binarized at this level for IoU
+IOU_THRESHOLD = 128
+
+# Initializers at least this large go to the memory-mapped data file
+SHARED_MIN_TENSOR_BYTES = 1024
+
+# SessionOptions carried over to a shared-weights session
+_COPIED_SESSION_OPTIONS = (
+    "intra_op_num_threads", "inter_op_num_threads", "execution_mode",
+    "enable_cpu_mem_arena", "enable_mem_pattern", "log_severity_level",
+)
+
+
+class _CapturedRun(Exception):
+    """Raised by _CaptureRun to stop a session's predict after its model input is built."""
+
+
+class _CaptureRun:
+    """
+    Stands in for a session's ONNX InferenceSession and records the input feed
+    of its run call, so predict() does the model-specific preprocessing.
+    """
+
+    def __init__(self, inner_session):
+        self._inner_session = inner_session
+        self.feed = None
+
+    def run(self, output_names, input_feed, *args, **kwargs):
+        self.feed = input_feed
+        raise _CapturedRun()
+
+    def __getattr__(self, name):
+        return getattr(self._inner_session, name)
+
+
+class _ReplayRun:
+    """
+    Stands in for a session's ONNX InferenceSession and returns precomputed
+    outputs, so predict() does the model-specific postprocessing.
+    """
+
+    def __init__(self, inner_session, outputs):
+        self._inner_session = inner_session
+        self._outputs = outputs
+        self._used = False
+
+    def run(self, *args, **kwargs):
+        if self._used:
+            # Models that call run more than once (e.g. SAM) can't be replayed
+            raise RuntimeError("session runs the model more than once per image")
+        self._used = True
+        return self._outputs
+
+    def __getattr__(self, name):
+        return getattr(self._inner_session, name)
+
+
+def capture_model_feed(session, image: Image.Image) -> Dict[str, np.ndarray]:
+    """
+    Get the ONNX input feed a rembg session would build for an image.
+
+    Raises:
+        RuntimeError: If the session has no single ONNX run per image
+    """
+    inner_session = getattr(session, "inner_session", None)
+    if inner_session is None:
+        raise RuntimeError("session has no ONNX inner_session")
+
+    capture = _CaptureRun(inner_session)
+    session.inner_session = capture
+    try:
+        session.predict(image)
+    except _CapturedRun:
+        pass
+    finally:
+        session.inner_session = inner_session
+
+    if capture.feed is None:
+        raise RuntimeError("session did not run the model")
+    return capture.feed
+
+
+def predict_from_outputs(session, image: Image.Image, outputs: List[np.ndarray]) -> List[Image.Image]:
+    """Run a session's postprocessing on precomputed ONNX outputs for one image."""
+    inner_session = session.inner_session
+    session.inner_session = _ReplayRun(inner_session, outputs)
+    try:
+        return session.predict(image)
+    finally:
+        session.inner_session = inner_session
+
+
+def split_model_name(model: str) -> Tuple[str, Optional[str]]:
+    """
+    Split a model name into (base model, quantization mode or None).
+
+    "birefnet-general-int8" -> ("birefnet-general", "dynamic")
+    """
+    # Longest suffix first so "-int8-static" is not read as "-int8"
+    for suffix in sorted(QUANTIZED_VARIANTS, key=len, reverse=True):
+        if model.endswith(suffix):
+            return model[:-len(suffix)], QUANTIZED_VARIANTS[suffix]
+    return model, None
+
+
+def variant_name(model: str, mode: str) -> str:
+    """Model name of a base model's quantized variant."""
+    for suffix, variant_mode in QUANTIZED_VARIANTS.items():
+        if variant_mode == mode:
+            return model + suffix
+    raise ValueError(f"Unknown quantization mode: {mode}")
+
+
+def find_session_class(model: str):
+    """Get the rembg session class for a (base) model name."""
+    from rembg.sessions import sessions_class
+
+    for session_class in sessions_class:
+        if session_class.name() == model:
+            return session_class
+    raise ValueError(f"No session class found for model '{model}'")
+
+
+def get_model_path(model: str) -> Path:
+    """Path of a base model's FP32 ONNX file (downloaded if missing)."""
+    return Path(find_session_class(model).download_models())
+
+
+def get_model_home() -> Path:
+    """rembg's model cache directory (U2NET_HOME, default ~/.u2net)."""
+    from rembg.sessions.base import BaseSession
+
+    return Path(BaseSession.u2net_home())
+
+
+def quantized_model_path(model: str, mode: str) -> Path:
+    """Where a new quantized file for a base model is written (next to the FP32 file)."""
+    return get_model_path(model).with_name(f"{model}.int8-{mode}.onnx")
+
+
+def find_quantized_model(model: str, mode: str) -> Optional[Path]:
+    """Path of an existing quantized file for a base model, or None."""
+    home = get_model_home()
+    if not home.is_dir():
+        return None
+    matches = sorted(home.rglob(f"{model}.int8-{mode}.onnx"))
+    return matches[0] if matches else None
+
+
+def get_quantized_models() -> Dict[str, str]:
+    """
+    Quantized variants that have been created locally.
+
+    Returns:
+        Dict of model name -> description, for listing next to REMBG_MODELS
+    """
+    models = {}
+    try:
+        home = get_model_home()
+        existing = {path.name for path in home.rglob("*.int8-*.onnx")} if home.is_dir() else set()
+    except Exception:
+        return models
+    for model, description in REMBG_MODELS.items():
+        for suffix, mode in QUANTIZED_VARIANTS.items():
+            if f"{model}.int8-{mode}.onnx" in existing:
+                models[model + suffix] = f"INT8 ({mode}) - {description}"
+    return models
+
+
+def get_model_description(model: str) -> str:
+    """Description of a model or quantized variant."""
+    if model in REMBG_MODELS:
+        return REMBG_MODELS[model]
+    base, mode = split_model_name(model)
+    if mode and base in REMBG_MODELS:
+        return f"INT8 ({mode}) - {REMBG_MODELS[base]}"
+    return ""
+
+
+def shared_model_path(path: Path) -> Path:
+    """
+    Where the shared-weights copy of an ONNX file is stored (next to it).
+
+    The optimized graph depends on the onnxruntime version and the CPU, so
+    both are part of the name.
+    """
+    import onnxruntime as ort
+
+    return path.with_name(f"{path.stem}.shared-{ort.__version__}-{platform.machine().lower()}.onnx")
+
+
+def prepare_shared_model(path: Path, rebuild: bool = False) -> Path:
+    """
+    Create the shared-weights copy of an ONNX file if it does not exist.
+
+    onnxruntime optimizes the graph and writes the result with the
+    weights in "<name>.data". Concurrent workers may build it at the
+    same time; each writes to its own temporary folder and renames the
+    files into place, data file first, so a model file never points at a
+    missing or partial data file.
+
+    Args:
+        path: Source ONNX file
+        rebuild: Recreate the copy even if it exists (e.g. it failed to load)
+
+    Returns:
+        Path of the shared-weights model file
+    """
+    import onnxruntime as ort
+
+    target = shared_model_path(path)
+    data_name = target.name + ".data"
+    if target.exists() and (target.parent / data_name).exists() and not rebuild:
+        return target
+
+    print(f"[Sessions] Preparing shared weights: {target.name}")
+    work_dir = target.with_name(f".{target.name}.{uuid.uuid4().hex[:8]}.tmp")
+    work_dir.mkdir()
+    try:
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.optimized_model_filepath = str(work_dir / target.name)
+        options.add_session_config_entry("session.optimized_model_external_initializers_file_name", data_name)
+        # Small tensors (shapes, scalars) stay in the graph: shape inference
+        # reads them, and they cost nothing per process
+        options.add_session_config_entry(
+            "session.optimized_model_external_initializers_min_size_in_bytes", str(SHARED_MIN_TENSOR_BYTES)
+        )
+        # Building the session writes the optimized model
+        ort.InferenceSession(str(path), options, providers=["CPUExecutionProvider"])
+
+        os.replace(work_dir / data_name, target.parent / data_name)
+        os.replace(work_dir / target.name, target)
+    finally:
+        for leftover in work_dir.iterdir():
+            leftover.unlink()
+        work_dir.rmdir()
+    return target
+
+
+def make_session_options(intra_op_threads: int = 0):
+    """
+    onnxruntime SessionOptions for a thread count.
+
+    Args:
+        intra_op_threads: Threads one model call uses (0 = onnxruntime's
+            default, all cores, or OMP_NUM_THREADS if set)
+
+    Returns:
+        SessionOptions, or None for the defaults
+    """
+    if intra_op_threads <= 0:
+        return None
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = intra_op_threads
+    return options
+
+
+def shared_session_options(sess_opts=None):
+    """
+    Session options that keep a shared-weights model's initializers
+    memory-mapped (no re-optimization, no prepacked copies).
+    """
+    import onnxruntime as ort
+
+    # A copy, so the caller's options still work for a normal load
+    options = ort.SessionOptions()
+    if sess_opts is not None:
+        for name in _COPIED_SESSION_OPTIONS:
+            setattr(options, name, getattr(sess_opts, name))
+    # The file is already optimized; optimizing again would create new
+    # (private) initializers
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_DISABLE_ALL
+    options.add_session_config_entry("session.disable_prepacking", "1")
+    return options
+
+
+def _session_with_file(base: str, path: Path, sess_opts):
+    """A base model's session (same pre/postprocessing) that loads another ONNX file."""
+    import onnxruntime as ort
+
+    base_class = find_session_class(base)
+
+    class FileSession(base_class):
+        @classmethod
+        def download_models(cls, *args, **kwargs):
+            return str(path)
+
+    return FileSession(base, sess_opts or ort.SessionOptions())
+
+
+def _create_shared_session(base: str, path: Path, sess_opts):
+    """
+    Session over the shared-weights copy of path, rebuilt once if it fails
+    to load. Returns None when it can't be created (e.g. a read-only model
+    cache); the caller then loads the model normally.
+    """
+    for rebuild in (False, True):
+        try:
+            return _session_with_file(base, prepare_shared_model(path, rebuild), shared_session_options(sess_opts))
+        except Exception as e:
+            # A copy from another onnxruntime build or CPU, or a partial file
+            print(f"[Sessions] Shared weights failed{' again' if rebuild else ''}: {e}")
+    return None
+
+
+def supports_shared_weights(model: str) -> bool:
+    """
+    Whether a model can load shared weights: its session must load one
+    ONNX file through rembg's BaseSession (not SAM or the custom-path models).
+    """
+    from rembg.sessions.base import BaseSession
+
+    try:
+        session_class = find_session_class(split_model_name(model)[0])
+    except ValueError:
+        return False
+    return session_class.__init__ is BaseSession.__init__
+
+
+def create_session(model: str, sess_opts=None, shared_weights: bool = False):
+    """
+    Create a session for a model name, including quantized variants.
+
+    Args:
+        model: Model name
+        sess_opts: onnxruntime SessionOptions
+        shared_weights: Memory-map the weights so worker processes share
+            one copy (see the module docstring); models that can't are
+            loaded normally
+
+    Raises:
+        FileNotFoundError: If a quantized variant has not been created yet
+    """
+    base, mode = split_model_name(model)
+    if shared_weights and not supports_shared_weights(model):
+        print(f"[Sessions] {model} can't share weights, loading it normally")
+        shared_weights = False
+
+    if mode is None:
+        session = _create_shared_session(base, get_model_path(base), sess_opts) if shared_weights else None
+        return session or new_session(model, sess_opts=sess_opts)
+
+    path = find_quantized_model(base, mode)
+    if path is None:
+        raise FileNotFoundError(
+            f"{model} has not been created yet - run: bg_remover.py quantize {base}"
+            + (" --static --calibration <image folder>" if mode == "static" else "")
+        )
+
+    session = _create_shared_session(base, path, sess_opts) if shared_weights else None
+    # Same pre/postprocessing as the base model, loading the INT8 file
+    return session or _session_with_file(base, path, sess_opts)
+
+
+class _ImageCalibrationReader:
+    """Feeds preprocessed sample images to onnxruntime's static calibration."""
+
+    def __init__(self, session, images: List[Image.Image]):
+        self._feeds = iter([capture_model_feed(session, image) for image in images])
+
+    def get_next(self):
+        return next(self._feeds, None)
+
+
+def quantize_model(
+    model: str,
+    mode: str = "dynamic",
+    calibration_images: Optional[List[Image.Image]] = None,
+    status_callback: Optional[Callable[[str], None]] = None
+) -> Path:
+    """
+    Create the INT8 variant of a model in the model cache.
+
+    Args:
+        model: Base rembg model name (downloaded if needed)
+        mode: "dynamic" or "static"
+        calibration_images: Sample images for static calibration
+        status_callback: Progress messages
+
+    Returns:
+        Path of the quantized ONNX file
+    """
+    try:
+        from onnxruntime.quantization import QuantFormat, QuantType, quantize_dynamic, quantize_static
+    except ImportError as e:
+        raise RuntimeError(f"Quantization needs the onnx package (pip install onnx): {e}")
+
+    if status_callback:
+        status_callback(f"Loading {model}...")
+    fp32_path = get_model_path(model)
+    output_path = quantized_model_path(model, mode)
+    tmp_path = output_path.with_name(output_path.name + ".tmp")
+
+    if mode == "static" and not calibration_images:
+        raise ValueError("Static quantization needs calibration images")
+    if mode not in QUANTIZED_VARIANTS.values():
+        raise ValueError(f"Unknown quantization mode: {mode}")
+
+    # Shape inference and graph cleanup first, as onnxruntime recommends;
+    # quantize the original if that fails
+    source_path = fp32_path
+    prep_path = output_path.with_name(output_path.name + ".prep")
+    try:
+        from onnxruntime.quantization.shape_inference import quant_pre_process
+        quant_pre_process(str(fp32_path), str(prep_path))
+        source_path = prep_path
+    except Exception as e:
+        print(f"[Quantize] Pre-processing skipped: {e}")
+
+    if status_callback:
+        status_callback(f"Quantizing {model} ({mode})...")
+
+    try:
+        if mode == "dynamic":
+            # Unsigned weights: ConvInteger has no signed-weight CPU kernel
+            quantize_dynamic(str(source_path), str(tmp_path), weight_type=QuantType.QUInt8)
+        else:
+            reader = _ImageCalibrationReader(new_session(model), calibration_images)
+            quantize_static(
+                str(source_path), str(tmp_path), reader,
+                quant_format=QuantFormat.QDQ,
+                activation_type=QuantType.QUInt8,
+                weight_type=QuantType.QInt8,
+                per_channel=True,
+            )
+    finally:
+        if prep_path.exists():
+            prep_path.unlink()
+
+    # Only a finished file appears under the final name
+    tmp_path.replace(output_path)
+    if status_callback:
+        status_callback(f"Saved {output_path}")
+    return output_path
+
+
+def compare_masks(reference: Image.Image, candidate: Image.Image) -> Dict[str, float]:
+    """
+    Compare two masks.
+
+    Returns:
+        {"iou": IoU of the masks binarized at 128 (1.0 when both are empty),
+         "mae": mean absolute alpha difference as a fraction of 255}
+    """
+    a = np.asarray(reference.convert("L"), dtype=np.int16)
+    b = np.asarray(candidate.convert("L").resize(reference.size), dtype=np.int16)
+    fg_a = a >= IOU_THRESHOLD
+    fg_b = b >= IOU_THRESHOLD
+    union = np.logical_or(fg_a, fg_b).sum()
+    iou = float(np.logical_and(fg_a, fg_b).sum() / union) if union else 1.0
+    return {"iou": iou, "mae": float(np.abs(a - b).mean() / 255.0)}
+
+
+def evaluate_variant(
+    model: str,
+    images: Iterable[Image.Image],
+    status_callback: Optional[Callable[[str], None]] = None
+) -> dict:
+    """
+    Compare a quantized variant's masks and speed against its FP32 model.
+
+    Args:
+        model: Quantized model name, e.g. "birefnet-general-int8"
+        images: Sample images
+
+    Returns:
+        Dict with mean/min IoU, mean/max MAE, mean seconds per image for
+        both models, the speedup, and per-image results
+    """
+    base, mode = split_model_name(model)
+    if mode is None:
+        raise ValueError(f"{model} is not a quantized variant")
+
+    fp32 = create_session(base)
+    int8 = create_session(model)
+
+    per_image = []
+    for i, image in enumerate(images):
+        image = image.convert("RGB")
+        start = time.perf_counter()
+        reference = fp32.predict(image)[0]
+        fp32_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        candidate = int8.predict(image)[0]
+        int8_seconds = time.perf_counter() - start
+
+        result = compare_masks(reference, candidate)
+        result.update(fp32_seconds=fp32_seconds, int8_seconds=int8_seconds)
+        per_image.append(result)
+        if status_callback:
+            status_callback(f"[{i + 1}] IoU {result['iou']:.4f}, MAE {result['mae']:.4f}")
+
+    if not per_image:
+        raise ValueError("No sample images to compare")
+
+    fp32_mean = float(np.mean([r["fp32_seconds"] for r in per_image]))
+    int8_mean = float(np.mean([r["int8_seconds"] for r in per_image]))
+    return {
+        "model": model,
+        "base_model": base,
+        "images": len(per_image),
+        "iou_mean": float(np.mean([r["iou"] for r in per_image])),
+        "iou_min": float(np.min([r["iou"] for r in per_image])),
+        "mae_mean": float(np.mean([r["mae"] for r in per_image])),
+        "mae_max": float(np.max([r["mae"] for r in per_image])),
+        "fp32_seconds_mean": fp32_mean,
+        "int8_seconds_mean": int8_mean,
+        "speedup": fp32_mean / int8_mean if int8_mean else 0.0,
+        "per_image": per_image,
+    }
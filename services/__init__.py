@@ -0,0 +1 @@
+# Services module - headless modes (HTTP server, watch folder)
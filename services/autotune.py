@@ -0,0 +1,317 @@
+"""
+Throughput autotuner - sweeps worker processes x ONNX threads x batch size.
+
+    python bg_remover.py autotune [--model birefnet-general] [--images FOLDER]
+
+The fastest mix of processes, intra-op threads per model call and images
+per model call depends on the model and the machine: a large model may want
+one process using every core, a small one several processes with a few
+threads each. The sweep measures it instead of guessing.
+
+Each trial spawns its processes (as `worker --processes` does), each loads
+the model with the trial's thread count and processes one warm-up image,
+then all start together on their own copy of the sample images through a
+BulkPipeline with the trial's inference_batch_size, outputs included.
+Model loading is not timed. Throughput is all images over the slowest
+process's time; memory is the processes' summed PSS after the run (RSS
+where PSS is unknown, which counts shared weights once per process).
+
+The fastest trial within the memory limit goes into the config as
+worker_processes, onnx_intra_op_threads and pipeline_inference_batch.
+"""
+
+import multiprocessing
+import os
+import queue
+import shutil
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+try:
+    from core.config import build_processing_options, build_post_options
+    from utils.memory import get_memory_breakdown, get_peak_rss_bytes
+except ImportError:
+    from ..core.config import build_processing_options, build_post_options
+    from ..utils.memory import get_memory_breakdown, get_peak_rss_bytes
+
+
+DEFAULT_BATCH_SIZES = [1, 2, 4]
+
+# Synthetic sample images when no folder is given
+DEFAULT_SAMPLE_COUNT = 16
+DEFAULT_SAMPLE_SIZE = (1024, 768)
+
+# Longest one trial may take, model loading included
+TRIAL_TIMEOUT_SECONDS = 900
+
+
+class Trial:
+    """One point of the sweep and what it measured."""
+
+    def __init__(self, processes: int, threads: int, batch_size: int):
+        self.processes = processes
+        self.threads = threads
+        self.batch_size = batch_size
+        self.images = 0
+        self.failed = 0
+        self.seconds = 0.0
+        self.memory_bytes: Optional[int] = None
+        self.peak_rss_bytes: Optional[int] = None
+        self.error: Optional[str] = None
+
+    @property
+    def images_per_sec(self) -> float:
+        return self.images / self.seconds if self.seconds > 0 else 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "processes": self.processes,
+            "threads": self.threads,
+            "batch_size": self.batch_size,
+            "images": self.images,
+            "failed": self.failed,
+            "seconds": round(self.seconds, 3),
+            "images_per_sec": round(self.images_per_sec, 3),
+            "memory_bytes": self.memory_bytes,
+            "peak_rss_bytes": self.peak_rss_bytes,
+            "error": self.error,
+        }
+
+
+def default_grid(cpu_count: Optional[int] = None,
+                 batch_sizes: Optional[List[int]] = None) -> List[Trial]:
+    """
+    Trials worth running on this machine: 1, 2 and 4 processes (as many as
+    there are cores), each with all or half of its share of the cores as
+    threads, times each batch size.
+    """
+    cpus = max(1, cpu_count or os.cpu_count() or 1)
+    trials = []
+    for processes in [p for p in (1, 2, 4) if p <= cpus]:
+        share = cpus // processes
+        for threads in sorted({share, max(1, share // 2)}, reverse=True):
+            for batch_size in batch_sizes or DEFAULT_BATCH_SIZES:
+                trials.append(Trial(processes, threads, batch_size))
+    return trials
+
+
+def make_grid(processes: List[int], threads: List[int], batch_sizes: List[int]) -> List[Trial]:
+    """Every combination of the given values."""
+    return [Trial(p, t, b) for p in processes for t in threads for b in batch_sizes]
+
+
+def make_sample_images(folder: Path, count: int = DEFAULT_SAMPLE_COUNT,
+                       size: Tuple[int, int] = DEFAULT_SAMPLE_SIZE) -> List[Path]:
+    """
+    Write synthetic photos (noisy gradient, a subject in the middle) as JPEGs.
+
+    Returns:
+        The image paths
+    """
+    width, height = size
+    yy, xx = np.mgrid[0:height, 0:width].astype(np.float32)
+    paths = []
+    for i in range(count):
+        rng = np.random.default_rng(i)
+        cx, cy = width * rng.uniform(0.35, 0.65), height * rng.uniform(0.35, 0.65)
+        inside = ((xx - cx) / (width / 4)) ** 2 + ((yy - cy) / (height / 3)) ** 2 < 1
+        rgb = np.stack([150 + 60 * xx / width, 170 + 40 * yy / height, np.full_like(xx, 190)], axis=2)
+        rgb[inside] = rng.uniform(30, 120, 3)
+        rgb += rng.normal(0, 6, rgb.shape)
+        path = folder / f"sample_{i:03d}.jpg"
+        Image.fromarray(np.clip(rgb, 0, 255).astype(np.uint8), "RGB").save(path, quality=92)
+        paths.append(path)
+    return paths
+
+
+def _trial_process(config: dict, threads: int, batch_size: int, input_dir: str,
+                   barrier, results) -> None:
+    """One process of a trial (runs in a spawned process)."""
+    try:
+        from core.pipeline import BulkPipeline
+        from processors.rembg_processor import RembgProcessor
+    except ImportError:
+        from ..core.pipeline import BulkPipeline
+        from ..processors.rembg_processor import RembgProcessor
+
+    try:
+        options = build_processing_options(config)
+        processor = RembgProcessor(
+            shared_weights=config.get("shared_weights", False),
+            intra_op_threads=threads,
+        )
+        paths = sorted(Path(input_dir).iterdir())
+        # Warm-up: first-call allocations are not part of the throughput
+        processor.process_image(Image.open(paths[0]), options)
+        pipeline = BulkPipeline(
+            processor,
+            options,
+            build_post_options(config),
+            suffix="_autotune",
+            decode_workers=config.get("pipeline_decode_workers", 2),
+            inference_batch_size=batch_size,
+            post_workers=config.get("pipeline_post_workers", 2),
+            write_workers=config.get("pipeline_write_workers", 1),
+            queue_size=config.get("pipeline_queue_size", 4),
+        )
+    except Exception as e:
+        barrier.abort()
+        results.put({"error": str(e) or type(e).__name__})
+        return
+
+    try:
+        barrier.wait()
+    except threading.BrokenBarrierError:
+        results.put({"error": "another process of the trial failed"})
+        return
+
+    try:
+        start = time.perf_counter()
+        pipeline.run(paths)
+        seconds = time.perf_counter() - start
+        memory = get_memory_breakdown()
+        report = {
+            "images": len(pipeline.results["completed"]),
+            "failed": len(pipeline.results["failed"]),
+            "seconds": seconds,
+            "memory_bytes": memory.get("pss_bytes") or memory.get("rss_bytes"),
+            "peak_rss_bytes": get_peak_rss_bytes(),
+        }
+    except Exception as e:
+        # The parent waits for one report per process
+        report = {"error": str(e) or type(e).__name__}
+    results.put(report)
+
+
+def run_trial(trial: Trial, config: dict, sample_paths: List[Path],
+              timeout: float = TRIAL_TIMEOUT_SECONDS) -> Trial:
+    """
+    Run one trial and fill in its measurements (or its error).
+
+    Args:
+        trial: Processes, threads and batch size to measure
+        config: Settings (model, pipeline workers, post-processing)
+        sample_paths: Images each process runs through once
+        timeout: Longest the trial may take
+    """
+    # Spawned, not forked: forking a process with model threads running is unsafe
+    ctx = multiprocessing.get_context("spawn")
+    barrier = ctx.Barrier(trial.processes, timeout=timeout)
+    results = ctx.Queue()
+
+    with tempfile.TemporaryDirectory(prefix="bg_autotune_") as tmp_dir:
+        processes = []
+        for i in range(trial.processes):
+            # Each process gets its own copy, so outputs don't collide
+            input_dir = Path(tmp_dir) / f"p{i}"
+            input_dir.mkdir()
+            for path in sample_paths:
+                shutil.copy(path, input_dir / path.name)
+            process = ctx.Process(
+                target=_trial_process,
+                args=(config, trial.threads, trial.batch_size, str(input_dir), barrier, results),
+                daemon=True,
+            )
+            process.start()
+            processes.append(process)
+
+        reports = []
+        deadline = time.monotonic() + timeout
+        try:
+            while len(reports) < trial.processes:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    trial.error = f"timed out after {timeout:.0f}s"
+                    break
+                try:
+                    reports.append(results.get(timeout=min(1.0, remaining)))
+                except queue.Empty:
+                    # A process killed outright (out of memory, crash) never reports
+                    if not any(process.is_alive() for process in processes):
+                        # Reports sent just before exiting may have arrived meanwhile
+                        try:
+                            while len(reports) < trial.processes:
+                                reports.append(results.get(timeout=0.5))
+                        except queue.Empty:
+                            codes = [process.exitcode for process in processes]
+                            trial.error = f"trial process exited without a report (exit codes {codes})"
+                        break
+        finally:
+            for process in processes:
+                process.join(5)
+                if process.is_alive():
+                    process.terminate()
+
+    errors = [report["error"] for report in reports if "error" in report]
+    if errors and trial.error is None:
+        trial.error = errors[0]
+    if trial.error is None:
+        trial.images = sum(report["images"] for report in reports)
+        trial.failed = sum(report["failed"] for report in reports)
+        trial.seconds = max(report["seconds"] for report in reports)
+        memory = [report["memory_bytes"] for report in reports]
+        trial.memory_bytes = sum(memory) if None not in memory else None
+        peaks = [report["peak_rss_bytes"] or 0 for report in reports]
+        trial.peak_rss_bytes = max(peaks) or None
+    return trial
+
+
+def autotune(
+    config: dict,
+    sample_paths: List[Path],
+    trials: List[Trial],
+    max_memory_mb: int = 0,
+    on_trial: Optional[Callable[[Trial], None]] = None
+) -> Dict[str, object]:
+    """
+    Run every trial and pick the fastest.
+
+    Args:
+        config: Settings; config["model"] is the model tuned for
+        sample_paths: Images each process runs through once per trial
+        trials: Points of the sweep (see default_grid / make_grid)
+        max_memory_mb: Only trials using at most this much memory can win
+            (0 = no limit)
+        on_trial: Called after each trial
+
+    Returns:
+        Dict with "trials" (Trial objects, in run order) and "best" (the
+        winning Trial, or None if every trial failed or was over the limit)
+    """
+    for trial in trials:
+        print(f"[Autotune] {trial.processes} processes x {trial.threads} threads, batch {trial.batch_size}...")
+        run_trial(trial, config, sample_paths)
+        if on_trial:
+            on_trial(trial)
+
+    limit = max_memory_mb * 1024 * 1024
+    eligible = [
+        trial for trial in trials
+        if trial.error is None and trial.images > 0
+        and not (limit and trial.memory_bytes and trial.memory_bytes > limit)
+    ]
+    best = max(eligible, key=lambda trial: trial.images_per_sec, default=None)
+    return {"trials": trials, "best": best}
+
+
+def apply_best(config: dict, best: Trial, model: str) -> dict:
+    """Config with the winning trial's settings (and a record of the run for model)."""
+    return dict(
+        config,
+        worker_processes=best.processes,
+        onnx_intra_op_threads=best.threads,
+        pipeline_inference_batch=best.batch_size,
+        autotune={
+            "model": model,
+            "cpu_count": os.cpu_count(),
+            "images_per_sec": round(best.images_per_sec, 3),
+            "memory_bytes": best.memory_bytes,
+            "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+        },
+    )
@@ -0,0 +1,430 @@
+"""
+Distributed workers - several machines share one job through a SQLite file.
+
+    python bg_remover.py enqueue //nas/jobs/catalog.db //nas/shoots/catalog --recursive
+    python bg_remover.py worker //nas/jobs/catalog.db        (on every node)
+
+The job store is a single SQLite database on a shared mount; there is no
+coordinator process. A worker claims a chunk of images by writing its id
+and a lease expiry into their rows in one transaction, keeps the lease
+alive with heartbeats while it works, and marks each image done or failed.
+A worker that dies stops heartbeating; once its lease runs out the images
+are claimable again, and the next worker picks them up. Failed images are
+retried up to max_attempts times.
+
+An image can therefore be processed twice (a slow worker whose lease
+expired). Outputs are written to a temporary file and renamed into place
+(see core.pipeline.write_output), so a re-run replaces the file atomically and
+readers never see a partial PNG.
+
+SQLite's WAL mode does not work on network filesystems, so the database
+uses the default rollback journal and relies on file locking - keep it on
+a share that supports locks (SMB, NFSv4). Input paths are stored as given,
+so every node must see the images at the same path.
+"""
+
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+DEFAULT_CHUNK_SIZE = 8
+DEFAULT_LEASE_SECONDS = 120.0
+DEFAULT_MAX_ATTEMPTS = 3
+
+# How long to wait for another node's transaction before giving up
+BUSY_TIMEOUT_SECONDS = 30.0
+
+# Wait between claim attempts while other workers hold the remaining jobs
+POLL_SECONDS = 5.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    input TEXT NOT NULL UNIQUE,
+    state TEXT NOT NULL DEFAULT 'pending',
+    owner TEXT,
+    lease_until REAL NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    updated REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, lease_until);
+CREATE TABLE IF NOT EXISTS settings (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+def default_worker_id() -> str:
+    """host:pid:random - unique across nodes and restarts."""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+
+class JobStore:
+    """
+    Lease table of images to process.
+
+    Thread-safe; every method is one short transaction.
+    """
+
+    def __init__(self, path, max_attempts: int = DEFAULT_MAX_ATTEMPTS):
+        """
+        Args:
+            path: SQLite database file (created if missing)
+            max_attempts: Claims of an image before it is marked failed
+        """
+        self.path = Path(path)
+        self.max_attempts = max(1, max_attempts)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(
+            str(self.path), timeout=BUSY_TIMEOUT_SECONDS, isolation_level=None, check_same_thread=False
+        )
+        with self._lock:
+            self._db.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    def _transaction(self, work):
+        """Run work(cursor) in an immediate (write-locked) transaction."""
+        with self._lock:
+            cursor = self._db.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                result = work(cursor)
+            except BaseException:
+                cursor.execute("ROLLBACK")
+                raise
+            cursor.execute("COMMIT")
+            return result
+
+    def add(self, paths: Iterable, suffix: str = "_nobg") -> int:
+        """
+        Queue images (paths already in the store are left alone).
+
+        Args:
+            paths: Input images
+            suffix: Output filename suffix for the whole job; only the
+                first add sets it, so all outputs follow one naming scheme
+
+        Returns:
+            Number of images added
+        """
+        now = time.time()
+        rows = [(str(p), now) for p in paths]
+
+        def work(cursor):
+            cursor.execute("INSERT OR IGNORE INTO settings (key, value) VALUES ('suffix', ?)", (suffix,))
+            before = self._db.total_changes
+            cursor.executemany("INSERT OR IGNORE INTO jobs (input, updated) VALUES (?, ?)", rows)
+            return self._db.total_changes - before
+
+        return self._transaction(work)
+
+    @property
+    def suffix(self) -> str:
+        """Output filename suffix of the job (set by the first add)."""
+        with self._lock:
+            row = self._db.execute("SELECT value FROM settings WHERE key = 'suffix'").fetchone()
+        return row[0] if row else "_nobg"
+
+    def claim(
+        self,
+        worker_id: str,
+        count: int = DEFAULT_CHUNK_SIZE,
+        lease_seconds: float = DEFAULT_LEASE_SECONDS
+    ) -> List[Tuple[int, str]]:
+        """
+        Lease up to count pending images (or images whose lease expired).
+
+        Returns:
+            (job id, input path) per claimed image
+        """
+        def work(cursor):
+            now = time.time()
+            jobs = cursor.execute(
+                "SELECT id, input FROM jobs "
+                "WHERE (state = 'pending' OR (state = 'leased' AND lease_until < ?)) AND attempts < ? "
+                "ORDER BY id LIMIT ?",
+                (now, self.max_attempts, count),
+            ).fetchall()
+            cursor.executemany(
+                "UPDATE jobs SET state = 'leased', owner = ?, lease_until = ?, "
+                "attempts = attempts + 1, updated = ? WHERE id = ?",
+                [(worker_id, now + lease_seconds, now, job[0]) for job in jobs],
+            )
+            # Expired leases that used up their attempts will never finish
+            cursor.execute(
+                "UPDATE jobs SET state = 'failed', error = COALESCE(error, 'lease expired'), updated = ? "
+                "WHERE state = 'leased' AND lease_until < ? AND attempts >= ?",
+                (now, now, self.max_attempts),
+            )
+            return jobs
+
+        return self._transaction(work)
+
+    def heartbeat(
+        self,
+        worker_id: str,
+        job_ids: Iterable[int],
+        lease_seconds: float = DEFAULT_LEASE_SECONDS
+    ) -> int:
+        """
+        Extend a worker's leases on the given images. Rows the worker holds
+        but no longer works on are left to expire.
+
+        Returns:
+            Number of images still leased by the worker among job_ids
+        """
+        def work(cursor):
+            now = time.time()
+            cursor.executemany(
+                "UPDATE jobs SET lease_until = ?, updated = ? WHERE id = ? AND state = 'leased' AND owner = ?",
+                [(now + lease_seconds, now, job_id, worker_id) for job_id in job_ids],
+            )
+            return cursor.rowcount
+
+        return self._transaction(work)
+
+    def complete(self, worker_id: str, job_id: int) -> bool:
+        """
+        Mark an image done. A no-op when another worker has taken it over
+        (it writes the same output).
+
+        Returns:
+            Whether this worker still held the image
+        """
+        def work(cursor):
+            cursor.execute(
+                "UPDATE jobs SET state = 'done', error = NULL, updated = ? "
+                "WHERE id = ? AND owner = ? AND state = 'leased'",
+                (time.time(), job_id, worker_id),
+            )
+            return cursor.rowcount > 0
+
+        return self._transaction(work)
+
+    def fail(self, worker_id: str, job_id: int, error: str) -> None:
+        """Record a failure; the image is retried until it runs out of attempts."""
+        def work(cursor):
+            cursor.execute(
+                "UPDATE jobs SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                "owner = NULL, lease_until = 0, error = ?, updated = ? "
+                "WHERE id = ? AND owner = ? AND state = 'leased'",
+                (self.max_attempts, error, time.time(), job_id, worker_id),
+            )
+
+        self._transaction(work)
+
+    def release(self, worker_id: str) -> int:
+        """
+        Give back a worker's unfinished images (clean shutdown), without
+        counting the attempt.
+
+        Returns:
+            Number of images released
+        """
+        def work(cursor):
+            cursor.execute(
+                "UPDATE jobs SET state = 'pending', owner = NULL, lease_until = 0, "
+                "attempts = MAX(0, attempts - 1), updated = ? WHERE state = 'leased' AND owner = ?",
+                (time.time(), worker_id),
+            )
+            return cursor.rowcount
+
+        return self._transaction(work)
+
+    def retry_failed(self) -> int:
+        """Reset failed images to pending with fresh attempts."""
+        def work(cursor):
+            cursor.execute(
+                "UPDATE jobs SET state = 'pending', attempts = 0, owner = NULL, updated = ? "
+                "WHERE state = 'failed'",
+                (time.time(),),
+            )
+            return cursor.rowcount
+
+        return self._transaction(work)
+
+    def leased_by_others(self, worker_id: str) -> int:
+        """Number of images leased by workers other than worker_id."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT COUNT(*) FROM jobs WHERE state = 'leased' AND owner IS NOT ?", (worker_id,)
+            ).fetchone()
+        return row[0]
+
+    def counts(self) -> Dict[str, int]:
+        """Number of images per state (pending, leased, done, failed)."""
+        with self._lock:
+            rows = self._db.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall()
+        counts = {"pending": 0, "leased": 0, "done": 0, "failed": 0}
+        counts.update(dict(rows))
+        return counts
+
+    def failures(self, limit: int = 20) -> List[Tuple[str, str]]:
+        """(input path, last error) of failed images."""
+        with self._lock:
+            return self._db.execute(
+                "SELECT input, error FROM jobs WHERE state = 'failed' ORDER BY id LIMIT ?", (limit,)
+            ).fetchall()
+
+
+class DistributedWorker:
+    """
+    Pulls chunks from a JobStore into a long-running BulkPipeline until
+    the job is finished.
+    """
+
+    def __init__(
+        self,
+        store: JobStore,
+        worker_id: Optional[str] = None,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        lease_seconds: float = DEFAULT_LEASE_SECONDS,
+        poll_seconds: float = POLL_SECONDS
+    ):
+        """
+        Args:
+            store: Shared job store
+            worker_id: Unique id of this worker (default: host:pid:random)
+            chunk_size: Images claimed per transaction
+            lease_seconds: How long a claim lasts without a heartbeat
+            poll_seconds: Wait between claims while other workers hold
+                the remaining images
+        """
+        self.store = store
+        self.worker_id = worker_id or default_worker_id()
+        self.chunk_size = max(1, chunk_size)
+        self.lease_seconds = lease_seconds
+        self.poll_seconds = poll_seconds
+        self.completed = 0
+        self.failed = 0
+        self._jobs: Dict[str, int] = {}
+        # (job id, input path, error or None for done) of results the store
+        # could not take yet; the heartbeat thread retries them
+        self._unrecorded: List[Tuple[int, str, Optional[str]]] = []
+        self._jobs_lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def stop(self) -> None:
+        """Stop claiming; images already claimed are finished."""
+        self._stop.set()
+
+    def paths(self) -> Iterator[Path]:
+        """
+        Claimed input paths, chunk by chunk, for BulkPipeline.run. Ends
+        on stop() or when nothing is pending and no other worker holds a
+        lease - this worker's own in-flight images finish in the pipeline.
+        """
+        while not self._stop.is_set():
+            jobs = self.store.claim(self.worker_id, self.chunk_size, self.lease_seconds)
+            if jobs:
+                with self._jobs_lock:
+                    for job_id, input_path in jobs:
+                        self._jobs[input_path] = job_id
+                print(f"[Worker] Claimed {len(jobs)} images")
+                for _, input_path in jobs:
+                    yield Path(input_path)
+                continue
+
+            counts = self.store.counts()
+            if not counts["pending"] and not self.store.leased_by_others(self.worker_id):
+                return
+            # Others hold the rest; their leases may still expire
+            self._stop.wait(self.poll_seconds)
+
+    def on_item_complete(self, item) -> None:
+        job_id = self._pop_job(item.input_path)
+        if job_id is not None:
+            self._record(job_id, str(item.input_path), None)
+
+    def on_item_error(self, item) -> None:
+        job_id = self._pop_job(item.input_path)
+        if job_id is not None:
+            self._record(job_id, str(item.input_path), item.error or "error")
+
+    def _pop_job(self, input_path: Path) -> Optional[int]:
+        with self._jobs_lock:
+            return self._jobs.pop(str(input_path), None)
+
+    def _record(self, job_id: int, input_path: str, error: Optional[str]) -> bool:
+        """
+        Mark an image done (error None) or failed in the store.
+
+        Runs on the pipeline's write thread; a locked database is routine on
+        a share, so a result the store cannot take is queued and retried by
+        the heartbeat thread, which keeps its lease alive meanwhile.
+
+        Returns:
+            Whether the result was recorded
+        """
+        try:
+            if error is None:
+                self.store.complete(self.worker_id, job_id)
+            else:
+                self.store.fail(self.worker_id, job_id, error)
+        except sqlite3.Error as e:
+            print(f"[Worker] Could not record {input_path} yet: {e}")
+            with self._jobs_lock:
+                self._unrecorded.append((job_id, input_path, error))
+            return False
+        if error is None:
+            self.completed += 1
+        else:
+            self.failed += 1
+        return True
+
+    def _record_pending(self) -> None:
+        """Retry results the store could not take earlier."""
+        with self._jobs_lock:
+            pending, self._unrecorded = self._unrecorded, []
+        for index, (job_id, input_path, error) in enumerate(pending):
+            if not self._record(job_id, input_path, error):
+                # Still locked; keep the rest for the next round
+                with self._jobs_lock:
+                    self._unrecorded.extend(pending[index + 1:])
+                return
+
+    def _held_job_ids(self) -> List[int]:
+        """Images in the pipeline or waiting to be recorded."""
+        with self._jobs_lock:
+            return list(self._jobs.values()) + [job[0] for job in self._unrecorded]
+
+    def run(self, pipeline) -> dict:
+        """
+        Process claimed images with a BulkPipeline until the job is done.
+        The pipeline's on_item_complete / on_item_error / on_item_skipped
+        callbacks must forward to this worker's on_item_complete / on_item_error.
+
+        Returns:
+            The pipeline's stats
+        """
+        heartbeat = threading.Thread(target=self._heartbeat, daemon=True)
+        heartbeat.start()
+        try:
+            return pipeline.run(self.paths())
+        finally:
+            self._stop.set()
+            heartbeat.join()
+            # Last chance for results the store could not take; whatever is
+            # still unrecorded is released and processed again later
+            self._record_pending()
+            self.store.release(self.worker_id)
+
+    def _heartbeat(self) -> None:
+        interval = self.lease_seconds / 3
+        while not self._stop.wait(interval):
+            self._record_pending()
+            try:
+                self.store.heartbeat(self.worker_id, self._held_job_ids(), self.lease_seconds)
+            except sqlite3.Error as e:
+                # A missed heartbeat only shortens the lease; the next one retries
+                print(f"[Worker] Heartbeat failed: {e}")
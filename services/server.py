@@ -0,0 +1,274 @@
+"""
+Local HTTP inference server - warm model sessions with dynamic micro-batching.
+
+    python bg_remover.py serve --port 7860
+
+Endpoints:
+
+    POST /remove      Image file as the raw request body, PNG back.
+                      Query parameters override the saved settings, using the
+                      processing option names (model, alpha_matting,
+                      alpha_matting_method, ...) and post-processing option
+                      names (auto_crop, sticker_mode, background, ...), plus
+                      output=cutout (default) or output=mask.
+    GET  /health      JSON status: loaded models, queue depth, batching stats
+    GET  /metrics     Prometheus text (same registry as core.metrics)
+    GET  /metrics.json
+
+Each request is decoded on its own HTTP thread, then queued for the model.
+A single batching thread (processors.batching.MicroBatcher) takes the first
+waiting request and collects more for up to max_latency_ms (or until
+max_batch_size), then runs them through RembgProcessor.predict_masks_batch
+in one call per model. Cutout, matting and
+post-processing run back on the request threads, in parallel.
+
+Example:
+
+    curl --data-binary @photo.jpg "http://127.0.0.1:7860/remove?model=u2net" -o photo_nobg.png
+"""
+
+import io
+import json
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Tuple
+from urllib.parse import parse_qsl, urlparse
+
+from PIL import Image
+from rembg.bg import fix_image_orientation, get_concat_v_multi
+
+try:
+    from core.config import build_processing_options, build_post_options
+    from core.constants import BACKGROUND_OPTIONS
+    from core.metrics import ImageTimings, get_metrics, span
+    from processors.batching import DEFAULT_MAX_BATCH_SIZE, DEFAULT_MAX_LATENCY_MS, MicroBatcher
+    from utils.image import apply_post_processing, apply_background_color
+except ImportError:
+    from ..core.config import build_processing_options, build_post_options
+    from ..core.constants import BACKGROUND_OPTIONS
+    from ..core.metrics import ImageTimings, get_metrics, span
+    from ..processors.batching import DEFAULT_MAX_BATCH_SIZE, DEFAULT_MAX_LATENCY_MS, MicroBatcher
+    from ..utils.image import apply_post_processing, apply_background_color
+
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 7860
+
+# Largest accepted request body
+MAX_UPLOAD_BYTES = 64 * 1024 * 1024
+
+OUTPUT_MODES = ("cutout", "mask")
+
+
+class RequestError(Exception):
+    """A client error, returned as HTTP 400."""
+
+
+def _coerce(value: str, default):
+    """Convert a query string value to the type of the option's default."""
+    if isinstance(default, bool):
+        lowered = value.lower()
+        if lowered in ("1", "true", "yes", "on"):
+            return True
+        if lowered in ("0", "false", "no", "off"):
+            return False
+        raise RequestError(f"expected true/false, got {value!r}")
+    if isinstance(default, (int, float)):
+        try:
+            return type(default)(value)
+        except ValueError:
+            raise RequestError(f"expected a number, got {value!r}")
+    return value
+
+
+def parse_request_options(params: Dict[str, str], config: dict) -> Tuple[dict, dict, str]:
+    """
+    Merge query parameters over the saved settings.
+
+    Returns:
+        (options, post_options, output) where output is "cutout" or "mask"
+    """
+    options = build_processing_options(config)
+    post_options = build_post_options(config)
+    output = params.pop("output", "cutout")
+    if output not in OUTPUT_MODES:
+        raise RequestError(f"output must be one of {', '.join(OUTPUT_MODES)}")
+
+    for key, value in params.items():
+        if key in options:
+            options[key] = _coerce(value, options[key])
+        elif key in post_options:
+            post_options[key] = _coerce(value, post_options[key])
+        else:
+            raise RequestError(f"unknown option {key!r}")
+
+    if post_options["background"] not in BACKGROUND_OPTIONS:
+        raise RequestError(f"unknown background {post_options['background']!r}")
+    return options, post_options, output
+
+
+class InferenceServer:
+    """HTTP front end for a warm RembgProcessor."""
+
+    def __init__(
+        self,
+        processor,
+        config: dict,
+        host: str = DEFAULT_HOST,
+        port: int = DEFAULT_PORT,
+        max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+        max_latency_ms: float = DEFAULT_MAX_LATENCY_MS,
+    ):
+        """
+        Args:
+            processor: RembgProcessor (needs predict_masks_batch and cutout)
+            config: Saved settings, the defaults for request options
+            host / port: Address to listen on
+            max_batch_size: Most requests run in one model call
+            max_latency_ms: Longest a request waits for others to batch with
+        """
+        self.processor = processor
+        self.config = config
+        self.batcher = MicroBatcher(processor, max_batch_size, max_latency_ms)
+        self.started = time.time()
+        self._httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self._httpd.daemon_threads = True
+
+    @property
+    def address(self) -> Tuple[str, int]:
+        return self._httpd.server_address[:2]
+
+    def warm_up(self, models: List[str]) -> None:
+        """Load model sessions before the first request."""
+        for model in models:
+            print(f"[Server] Loading model: {model}")
+            self.processor.load_model(model)
+
+    def remove(self, body: bytes, params: Dict[str, str]) -> bytes:
+        """Handle one /remove request. Returns PNG bytes."""
+        options, post_options, output = parse_request_options(params, self.config)
+        timings = ImageTimings("http")
+
+        try:
+            with timings.activate():
+                with span("decode"):
+                    try:
+                        image = Image.open(io.BytesIO(body))
+                        image.load()
+                    except Exception as e:
+                        raise RequestError(f"could not decode image: {e}")
+                image = fix_image_orientation(image)
+
+                with span("batch"):
+                    masks = self.batcher.submit(image, options)
+
+                if output == "mask":
+                    result = masks[0] if len(masks) == 1 else get_concat_v_multi(masks)
+                else:
+                    result = self.processor.cutout(image, masks, options).convert("RGBA")
+                    result = apply_post_processing(result, post_options)
+                    bg_color = BACKGROUND_OPTIONS[post_options["background"]][1]
+                    with span("background"):
+                        result = apply_background_color(result, bg_color)
+
+                with span("encode"):
+                    buffer = io.BytesIO()
+                    result.save(buffer, "PNG")
+        except Exception:
+            timings.status = "error"
+            raise
+        finally:
+            get_metrics().record_image(timings)
+
+        return buffer.getvalue()
+
+    def health(self) -> dict:
+        batcher = self.batcher
+        return {
+            "status": "ok",
+            "processor": self.processor.get_name(),
+            "models_loaded": self.processor.get_loaded_models(),
+            "queue_depth": batcher.queue_depth,
+            "max_batch_size": batcher.max_batch_size,
+            "max_latency_ms": round(batcher.max_latency * 1000, 3),
+            "batches": batcher.batches,
+            "mean_batch_size": round(batcher.batched_images / batcher.batches, 3) if batcher.batches else 0.0,
+            "uptime_seconds": round(time.time() - self.started, 1),
+        }
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _send(self, status: int, body: bytes, content_type: str):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _send_json(self, status: int, data: dict):
+                self._send(status, json.dumps(data).encode(), "application/json")
+
+            def do_GET(self):
+                path = urlparse(self.path).path
+                if path == "/health":
+                    self._send_json(200, server.health())
+                elif path == "/metrics":
+                    self._send(200, get_metrics().to_prometheus().encode(), "text/plain; version=0.0.4")
+                elif path == "/metrics.json":
+                    self._send_json(200, get_metrics().snapshot())
+                else:
+                    self._send_json(404, {"error": "not found"})
+
+            def do_POST(self):
+                url = urlparse(self.path)
+                if url.path != "/remove":
+                    self._send_json(404, {"error": "not found"})
+                    return
+
+                get_metrics().inc("server_requests")
+                try:
+                    length = int(self.headers.get("Content-Length") or 0)
+                except ValueError:
+                    get_metrics().inc("server_errors")
+                    self._send_json(400, {"error": "invalid Content-Length"})
+                    return
+                if length <= 0:
+                    self._send_json(400, {"error": "request body must be an image file"})
+                    return
+                if length > MAX_UPLOAD_BYTES:
+                    self._send_json(413, {"error": "image too large"})
+                    return
+
+                try:
+                    body = self.rfile.read(length)
+                    png = server.remove(body, dict(parse_qsl(url.query)))
+                except RequestError as e:
+                    get_metrics().inc("server_errors")
+                    self._send_json(400, {"error": str(e)})
+                    return
+                except Exception as e:
+                    get_metrics().inc("server_errors")
+                    self._send_json(500, {"error": str(e) or type(e).__name__})
+                    return
+                self._send(200, png, "image/png")
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def serve_forever(self) -> None:
+        """Serve until shutdown() is called (or Ctrl+C)."""
+        self.batcher.start()
+        host, port = self.address
+        print(f"[Server] Listening on http://{host}:{port} (POST /remove, GET /health, GET /metrics)")
+        try:
+            self._httpd.serve_forever()
+        finally:
+            self._httpd.server_close()
+            self.batcher.stop()
+
+    def shutdown(self) -> None:
+        self._httpd.shutdown()
@@ -0,0 +1,355 @@
+"""
+Watch-folder daemon - processes images as they land in hot folders.
+
+    python bg_remover.py watch D:/shoots/incoming [more folders...]
+
+New files are found by the best available source:
+
+1. watchdog, if installed (native events on every platform)
+2. inotify through libc on Linux
+3. An mtime scan: a directory is only re-listed when its own mtime changes
+   (a file was added, removed or renamed), so idle folders cost one stat
+   per poll.
+
+A new file is not processed until its size and mtime have stayed the same
+for the debounce period, so copies still in progress are never read. Files
+that already have a {stem}{suffix}.png output, and the outputs themselves,
+are skipped. Ready files are fed to one long-running BulkPipeline, so the
+model stays loaded between files.
+"""
+
+import ctypes
+import ctypes.util
+import os
+import queue
+import select
+import struct
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Set
+
+try:
+    from core.constants import VALID_EXTENSIONS
+    from core.pipeline import build_output_path, is_output_file
+except ImportError:
+    from ..core.constants import VALID_EXTENSIONS
+    from ..core.pipeline import build_output_path, is_output_file
+
+
+DEFAULT_DEBOUNCE_SECONDS = 2.0
+DEFAULT_POLL_SECONDS = 1.0
+
+# How often pending files are re-checked while waiting to settle
+SETTLE_INTERVAL = 0.25
+
+
+class _WatchdogSource:
+    """File events from the optional watchdog package."""
+
+    def __init__(self, dirs: List[Path], recursive: bool):
+        from watchdog.events import FileSystemEventHandler
+        from watchdog.observers import Observer
+
+        events: "queue.Queue[Path]" = queue.Queue()
+
+        class Handler(FileSystemEventHandler):
+            def on_created(self, event):
+                if not event.is_directory:
+                    events.put(Path(event.src_path))
+
+            def on_modified(self, event):
+                if not event.is_directory:
+                    events.put(Path(event.src_path))
+
+            def on_moved(self, event):
+                if not event.is_directory:
+                    events.put(Path(event.dest_path))
+
+        self._events = events
+        self._observer = Observer()
+        for directory in dirs:
+            self._observer.schedule(Handler(), str(directory), recursive=recursive)
+        self._observer.start()
+
+    def read(self, timeout: float) -> List[Path]:
+        paths = []
+        try:
+            paths.append(self._events.get(timeout=timeout))
+            while True:
+                paths.append(self._events.get_nowait())
+        except queue.Empty:
+            pass
+        return paths
+
+    def close(self) -> None:
+        self._observer.stop()
+        self._observer.join()
+
+
+class _InotifySource:
+    """File events from Linux inotify, via libc."""
+
+    IN_MODIFY = 0x00000002
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_ISDIR = 0x40000000
+    MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+    _EVENT = struct.Struct("iIII")
+
+    def __init__(self, dirs: List[Path], recursive: bool):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or None, use_errno=True)
+        self._libc = libc
+        self._recursive = recursive
+        self._fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._watches: Dict[int, Path] = {}
+        for directory in dirs:
+            self._add_watch(directory)
+            if recursive:
+                for root, subdirs, _ in os.walk(directory):
+                    for name in subdirs:
+                        self._add_watch(Path(root) / name)
+
+    def _add_watch(self, directory: Path) -> None:
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(str(directory)), self.MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {directory}")
+        self._watches[wd] = directory
+
+    def read(self, timeout: float) -> List[Path]:
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+
+        paths = []
+        offset = 0
+        while offset + self._EVENT.size <= len(data):
+            wd, mask, _cookie, length = self._EVENT.unpack_from(data, offset)
+            offset += self._EVENT.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+            directory = self._watches.get(wd)
+            if directory is None or not name:
+                continue
+            path = directory / os.fsdecode(name)
+            if mask & self.IN_ISDIR:
+                if self._recursive and mask & (self.IN_CREATE | self.IN_MOVED_TO):
+                    self._add_watch(path)
+            else:
+                paths.append(path)
+        return paths
+
+    def close(self) -> None:
+        os.close(self._fd)
+
+
+class _ScanSource:
+    """Polls directory mtimes and lists a directory only when it changed."""
+
+    def __init__(self, dirs: List[Path], recursive: bool, poll_seconds: float):
+        self._roots = dirs
+        self._recursive = recursive
+        self._poll_seconds = poll_seconds
+        self._dir_mtimes: Dict[Path, int] = {}
+        self._known: Dict[Path, Set[str]] = {}
+
+        # Record what is already there so only later files are reported
+        # (each pass lists subdirectories found by the previous one)
+        while True:
+            found = len(self._dir_mtimes)
+            self.read(0)
+            if len(self._dir_mtimes) == found:
+                break
+
+    def _directories(self) -> List[Path]:
+        if not self._recursive:
+            return list(self._roots)
+        # Subdirectories are picked up from the listings below
+        return list(self._roots) + [d for d in self._dir_mtimes if d not in self._roots]
+
+    def read(self, timeout: float) -> List[Path]:
+        time.sleep(min(timeout, self._poll_seconds))
+        paths = []
+        for directory in self._directories():
+            try:
+                mtime = directory.stat().st_mtime_ns
+            except OSError:
+                continue
+            if self._dir_mtimes.get(directory) == mtime:
+                continue
+            self._dir_mtimes[directory] = mtime
+
+            names = set()
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_dir():
+                        if self._recursive:
+                            self._dir_mtimes.setdefault(Path(entry.path), 0)
+                    else:
+                        names.add(entry.name)
+            known = self._known.get(directory, set())
+            paths.extend(directory / name for name in names - known)
+            self._known[directory] = names
+        return paths
+
+    def close(self) -> None:
+        pass
+
+
+class FolderWatcher:
+    """
+    Watches directories and yields new, fully written images.
+
+    Usage:
+
+        watcher = FolderWatcher([Path("incoming")], "_nobg")
+        watcher.start()
+        pipeline.run(watcher.paths())   # runs until watcher.stop()
+    """
+
+    def __init__(
+        self,
+        dirs: List[Path],
+        suffix: str = "_nobg",
+        debounce_seconds: float = DEFAULT_DEBOUNCE_SECONDS,
+        poll_seconds: float = DEFAULT_POLL_SECONDS,
+        recursive: bool = False,
+        include_existing: bool = True,
+        backend: str = "auto",
+    ):
+        """
+        Args:
+            dirs: Directories to watch
+            suffix: Output suffix - used to skip finished and output files
+            debounce_seconds: How long size and mtime must stay unchanged
+            poll_seconds: Scan interval for the mtime-scan backend
+            recursive: Also watch subdirectories
+            include_existing: Queue unprocessed images already in the folders
+            backend: "auto", "watchdog", "inotify" or "scan"
+        """
+        self.dirs = [Path(d) for d in dirs]
+        self.suffix = suffix or "_nobg"
+        self.debounce_seconds = debounce_seconds
+        self.poll_seconds = poll_seconds
+        self.recursive = recursive
+        self.include_existing = include_existing
+        self.backend = backend
+        self.backend_name = ""
+        self.queued = 0
+        self.skipped = 0
+
+        # path -> (size, mtime_ns, time of last change)
+        self._pending: Dict[Path, tuple] = {}
+        # path -> mtime_ns when queued, so a file is queued once per version
+        self._queued: Dict[Path, int] = {}
+        self._ready: "queue.Queue[Optional[Path]]" = queue.Queue()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._source = None
+
+    def _open_source(self):
+        backends = ["watchdog", "inotify", "scan"] if self.backend == "auto" else [self.backend]
+        for name in backends:
+            try:
+                if name == "watchdog":
+                    source = _WatchdogSource(self.dirs, self.recursive)
+                elif name == "inotify":
+                    if not sys.platform.startswith("linux"):
+                        continue
+                    source = _InotifySource(self.dirs, self.recursive)
+                else:
+                    source = _ScanSource(self.dirs, self.recursive, self.poll_seconds)
+            except (ImportError, OSError, AttributeError) as e:
+                if self.backend != "auto":
+                    raise
+                if name != "watchdog":
+                    print(f"[Watch] {name} unavailable: {e}")
+                continue
+            self.backend_name = name
+            return source
+        raise RuntimeError(f"No usable watch backend ({self.backend})")
+
+    def start(self) -> None:
+        for directory in self.dirs:
+            if not directory.is_dir():
+                raise FileNotFoundError(f"Not a directory: {directory}")
+        self._source = self._open_source()
+        print(f"[Watch] Watching {', '.join(str(d) for d in self.dirs)} ({self.backend_name})")
+
+        if self.include_existing:
+            for directory in self.dirs:
+                pattern = "**/*" if self.recursive else "*"
+                for path in sorted(directory.glob(pattern)):
+                    if path.is_file():
+                        self._track(path)
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop watching; paths() ends after the files already queued."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._ready.put(None)
+
+    def paths(self) -> Iterator[Path]:
+        """Yield ready files until stop() is called."""
+        while True:
+            path = self._ready.get()
+            if path is None:
+                return
+            yield path
+
+    def _track(self, path: Path) -> None:
+        if path.suffix.lower() not in VALID_EXTENSIONS or is_output_file(path, self.suffix):
+            return
+        if path not in self._pending:
+            self._pending[path] = (-1, -1, time.monotonic())
+
+    def _settle(self) -> None:
+        """Queue pending files whose size and mtime stopped changing."""
+        now = time.monotonic()
+        for path, (size, mtime, changed) in list(self._pending.items()):
+            try:
+                stat = path.stat()
+            except OSError:
+                # Deleted or renamed before it settled
+                del self._pending[path]
+                continue
+
+            if (stat.st_size, stat.st_mtime_ns) != (size, mtime):
+                self._pending[path] = (stat.st_size, stat.st_mtime_ns, now)
+                continue
+            if now - changed < self.debounce_seconds or stat.st_size == 0:
+                continue
+
+            del self._pending[path]
+            if self._queued.get(path) == stat.st_mtime_ns:
+                continue
+            if build_output_path(path, self.suffix).exists():
+                self.skipped += 1
+                continue
+            self._queued[path] = stat.st_mtime_ns
+            self.queued += 1
+            self._ready.put(path)
+
+    def _run(self) -> None:
+        try:
+            while not self._stop.is_set():
+                timeout = SETTLE_INTERVAL if self._pending else self.poll_seconds
+                for path in self._source.read(timeout):
+                    self._track(path)
+                self._settle()
+        finally:
+            self._source.close()
@@ -0,0 +1,827 @@
+"""
+Command line interface - headless modes of the app.
+
+    python bg_remover.py process FILE_OR_FOLDER [...] [--model u2net] [--fast-path] [--report FILE] [--profile]
+    python bg_remover.py serve [--port 7860] [--model birefnet-general]
+    python bg_remover.py watch FOLDER [FOLDER...] [--recursive] [--track-memory]
+    python bg_remover.py enqueue JOBS.db FILE_OR_FOLDER [...]   (then on each node:)
+    python bg_remover.py worker JOBS.db [--shared-weights] [--processes 4]
+    python bg_remover.py quantize MODEL [--static --calibration FOLDER] [--compare FOLDER]
+    python bg_remover.py autotune [--model u2net] [--images FOLDER] [--max-memory-mb 4096]
+
+process, watch and worker take --profile: the processing threads are
+profiled (cProfile, or stack sampling from Python 3.12) and a .prof file
+plus a per-stage summary are written (see core.profiling).
+
+Running bg_remover.py without arguments starts the GUI. Settings not given
+on the command line come from bg_remover_config.json, as in the GUI.
+"""
+
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import threading
+from pathlib import Path
+from typing import List, Optional
+
+try:
+    from core.config import load_config
+    from core.metrics import configure_metrics, flush_metrics
+except ImportError:
+    from ..core.config import load_config
+    from ..core.metrics import configure_metrics, flush_metrics
+
+
+def _collect_images(inputs: List[str], recursive: bool) -> List[Path]:
+    """Expand files and folders into the list of images to process."""
+    try:
+        from core.constants import VALID_EXTENSIONS
+    except ImportError:
+        from ..core.constants import VALID_EXTENSIONS
+
+    paths = []
+    for name in inputs:
+        path = Path(name)
+        if path.is_dir():
+            found = path.rglob("*") if recursive else path.iterdir()
+            paths.extend(sorted(p for p in found if p.is_file() and p.suffix.lower() in VALID_EXTENSIONS))
+        elif path.suffix.lower() in VALID_EXTENSIONS and path.exists():
+            paths.append(path)
+        else:
+            print(f"[Process] Skipping {name} (not an image or folder)")
+    return paths
+
+
+def _make_profiler(args):
+    """A RunProfiler when --profile was given, else None."""
+    if not args.profile:
+        return None
+    try:
+        from core.profiling import RunProfiler
+    except ImportError:
+        from ..core.profiling import RunProfiler
+    return RunProfiler(top_n=args.profile_top)
+
+
+def _save_profile(profiler, args, tag: str) -> None:
+    """Write a run's profile (see core.profiling) and say where."""
+    if profiler is None:
+        return
+    try:
+        from core.profiling import default_profile_path
+    except ImportError:
+        from ..core.profiling import default_profile_path
+
+    path = Path(args.profile_file) if args.profile_file else default_profile_path(prefix=f"bg_remover-{tag}")
+    written = profiler.save(path)
+    if written:
+        print(f"[Profile] Wrote {', '.join(str(p) for p in written)}")
+    else:
+        print("[Profile] Nothing was profiled")
+
+
+def _run_until_done(target, on_interrupt):
+    """
+    Run target on a thread, calling on_interrupt on each Ctrl+C, until it
+    returns. Waits on an event rather than join(): a join interrupted by
+    Ctrl+C can report the thread finished while it still runs.
+
+    Returns:
+        What target returned
+
+    Raises:
+        What target raised, once it has stopped
+    """
+    outcome = {}
+    done = threading.Event()
+
+    def run():
+        try:
+            outcome["result"] = target()
+        except BaseException as e:
+            outcome["error"] = e
+        finally:
+            done.set()
+
+    threading.Thread(target=run, daemon=True).start()
+    while not done.is_set():
+        try:
+            done.wait(0.5)
+        except KeyboardInterrupt:
+            on_interrupt()
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome.get("result")
+
+
+def _make_memory_tracker(args, config: dict, processor, pipeline=None):
+    """
+    A started MemoryTracker when --track-memory was given (or
+    memory_tracking is set), else None. Past the recycle threshold the
+    processor's model sessions are dropped and reloaded on the next image;
+    while the pipeline is inferring, the recycle waits for the next checkpoint.
+    """
+    if not (args.track_memory or config.get("memory_tracking", False)):
+        return None
+    try:
+        from core.memory_tracker import MemoryTracker
+    except ImportError:
+        from ..core.memory_tracker import MemoryTracker
+
+    tracker = MemoryTracker(
+        top_n=config.get("memory_top_n", 10),
+        recycle_mb=args.recycle_mb if args.recycle_mb is not None else config.get("memory_recycle_mb", 0),
+        on_recycle=lambda: _recycle_sessions(processor, pipeline),
+        log_path=config.get("memory_log") or None,
+    )
+    tracker.start()
+    return tracker
+
+
+def _recycle_sessions(processor, pipeline=None) -> bool:
+    """
+    MemoryTracker on_recycle: drop the model sessions.
+
+    Returns:
+        False while the pipeline is inferring (retried at the next checkpoint)
+    """
+    if pipeline is not None and pipeline.inference_busy:
+        return False
+    processor.clear_session()
+    return True
+
+
+def _apply_routing_args(args, config: dict) -> dict:
+    """Override the saved model and routing settings with command line flags."""
+    overrides = {}
+    if args.model:
+        overrides["model"] = args.model
+    if args.fast_path is not None:
+        overrides["fast_path"] = args.fast_path
+    if args.cascade is not None:
+        overrides["cascade"] = args.cascade
+    if args.dedup is not None:
+        overrides["dedup"] = args.dedup
+    if args.roi is not None:
+        overrides["roi"] = args.roi
+    return dict(config, **overrides)
+
+
+def cmd_process(args, config: dict) -> int:
+    """Process files and folders once through the bulk pipeline."""
+    try:
+        from core.config import build_processing_options, build_post_options
+        from core.pipeline import BulkPipeline, format_routing_summary, format_stage_summary
+        from core.sequence import format_sequence_summary
+        from processors.rembg_processor import RembgProcessor
+    except ImportError:
+        from ..core.config import build_processing_options, build_post_options
+        from ..core.pipeline import BulkPipeline, format_routing_summary, format_stage_summary
+        from ..core.sequence import format_sequence_summary
+        from ..processors.rembg_processor import RembgProcessor
+
+    config = _apply_routing_args(args, config)
+    if args.sequence is not None:
+        config["sequence_mode"] = args.sequence
+    if args.keyframe_interval:
+        config["sequence_keyframe_interval"] = args.keyframe_interval
+    paths = _collect_images(args.inputs, args.recursive)
+    if not paths:
+        print("[Process] No images to process")
+        return 1
+
+    failed = []
+    skipped = []
+
+    def on_skipped(item):
+        skipped.append(item)
+        print(f"[Process] Skipped: {item.input_path} ({item.skipped})")
+
+    def on_error(item):
+        failed.append(item)
+        print(f"[Process] Failed: {item.input_path}: {item.error}")
+
+    pipeline = BulkPipeline(
+        RembgProcessor(
+            max_sessions=2 if config.get("cascade", False) else 1,
+            shared_weights=config.get("shared_weights", False),
+            intra_op_threads=config.get("onnx_intra_op_threads", 0),
+        ),
+        build_processing_options(config),
+        build_post_options(config),
+        suffix=args.suffix or config.get("suffix") or "_nobg",
+        decode_workers=config.get("pipeline_decode_workers", 2),
+        post_workers=config.get("pipeline_post_workers", 2),
+        write_workers=config.get("pipeline_write_workers", 1),
+        queue_size=config.get("pipeline_queue_size", 4),
+        inference_batch_size=config.get("pipeline_inference_batch", 1),
+        memory_budget_mb=config.get("memory_budget_mb", 0),
+        decode_processes=config.get("pipeline_decode_processes", 0),
+        shared_slot_mb=config.get("pipeline_shared_slot_mb", 64),
+        skip_processed=config.get("skip_processed", True),
+        cutout_post_process=config.get("cutout_post_process", False),
+        sequence_mode=config.get("sequence_mode", False),
+        sequence_keyframe_interval=config.get("sequence_keyframe_interval", 8),
+        sequence_max_residual=config.get("sequence_max_residual", 0.25),
+        on_item_complete=lambda item: print(f"[Process] Saved: {item.output_path}"),
+        on_item_error=on_error,
+        on_item_skipped=on_skipped,
+        profiler=_make_profiler(args),
+    )
+
+    # Run on a thread so Ctrl+C can stop it gracefully: the first press
+    # finishes the images in flight, a second drops those not yet through
+    # the model. Outputs are renamed into place whole either way.
+    def stop():
+        if pipeline.cancelled:
+            print("[Process] Aborting - dropping images not yet through the model")
+            pipeline.cancel(abort=True)
+        else:
+            print("[Process] Stopping - finishing images in flight (Ctrl+C again to abort)")
+            pipeline.cancel()
+
+    # A failed run raises here, once its thread has stopped
+    stats = _run_until_done(lambda: pipeline.run(paths), stop)
+
+    report = {name: [str(path) for path in found] for name, found in pipeline.results.items()}
+    finished = {path for found in report.values() for path in found}
+    report["not_started"] = [str(path) for path in paths if str(path) not in finished]
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"[Process] Report written to {args.report}")
+
+    saved = len(report["completed"])
+    print(f"[Process] {saved}/{len(paths)} images in {stats['elapsed_seconds']}s")
+    if pipeline.cancelled:
+        print(f"[Process] Stopped early: {saved} saved, {len(failed)} failed, {len(skipped)} skipped, "
+              f"{len(report['cancelled'])} dropped in flight, {len(report['not_started'])} not started")
+    for name, sequence in stats.get("sequences", {}).items():
+        print(f"[Sequence] {format_sequence_summary(name, sequence)}")
+    routing = format_routing_summary(stats.get("counters", {}))
+    if routing:
+        print(f"[Process] {routing}")
+    print(f"[Process] {format_stage_summary(stats)}")
+    _save_profile(pipeline.profiler, args, "process")
+    return 1 if failed or pipeline.cancelled else 0
+
+
+def cmd_serve(args, config: dict) -> int:
+    """Run the local HTTP inference server."""
+    try:
+        from processors.rembg_processor import RembgProcessor
+        from services.server import InferenceServer
+    except ImportError:
+        from ..processors.rembg_processor import RembgProcessor
+        from ..services.server import InferenceServer
+
+    models = args.model or [config["model"]]
+    config = dict(config, model=models[0])
+    processor = RembgProcessor(
+        max_sessions=max(len(models), config.get("server_max_sessions", 1)),
+        shared_weights=config.get("shared_weights", False),
+        intra_op_threads=config.get("onnx_intra_op_threads", 0),
+    )
+
+    try:
+        server = InferenceServer(
+            processor,
+            config,
+            host=args.host or config.get("server_host", "127.0.0.1"),
+            port=args.port if args.port is not None else config.get("server_port", 7860),
+            max_batch_size=args.max_batch_size or config.get("server_max_batch_size", 4),
+            max_latency_ms=(args.max_latency_ms if args.max_latency_ms is not None
+                            else config.get("server_max_latency_ms", 20)),
+        )
+    except OSError as e:
+        print(f"[Server] Could not listen: {e}")
+        return 1
+
+    server.warm_up(models)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("[Server] Stopping")
+    return 0
+
+
+def cmd_watch(args, config: dict) -> int:
+    """Process images as they appear in watched folders."""
+    try:
+        from core.config import build_processing_options, build_post_options
+        from core.pipeline import BulkPipeline, format_routing_summary
+        from processors.rembg_processor import RembgProcessor
+        from services.watch import FolderWatcher
+    except ImportError:
+        from ..core.config import build_processing_options, build_post_options
+        from ..core.pipeline import BulkPipeline, format_routing_summary
+        from ..processors.rembg_processor import RembgProcessor
+        from ..services.watch import FolderWatcher
+
+    config = _apply_routing_args(args, config)
+    suffix = args.suffix or config.get("suffix") or "_nobg"
+    dirs = args.dirs or config.get("watch_dirs", [])
+    if not dirs:
+        print("[Watch] No folders given (pass them as arguments or set watch_dirs)")
+        return 1
+
+    watcher = FolderWatcher(
+        dirs,
+        suffix,
+        debounce_seconds=(args.debounce if args.debounce is not None
+                          else config.get("watch_debounce_seconds", 2.0)),
+        poll_seconds=config.get("watch_poll_seconds", 1.0),
+        recursive=args.recursive or config.get("watch_recursive", False),
+        include_existing=not args.new_only,
+        backend=args.backend or config.get("watch_backend", "auto"),
+    )
+
+    processor = RembgProcessor(
+        max_sessions=2 if config.get("cascade", False) else 1,
+        shared_weights=config.get("shared_weights", False),
+        intra_op_threads=config.get("onnx_intra_op_threads", 0),
+    )
+    options = build_processing_options(config)
+    print(f"[Watch] Loading model: {options['model']}")
+    processor.load_model(options["model"])
+
+    # Growth is checked every memory_check_images images, on its own thread:
+    # callbacks run on the pipeline's write thread, and snapshots take a moment
+    tracker = None
+    check_every = max(1, config.get("memory_check_images", 25))
+    finished = itertools.count(1)
+    checkpoints: List[threading.Thread] = []
+
+    def on_finished(item, message: str) -> None:
+        print(message)
+        if tracker is not None and next(finished) % check_every == 0:
+            thread = threading.Thread(target=tracker.checkpoint, args=(f"{check_every} images",), daemon=True)
+            thread.start()
+            checkpoints[:] = [t for t in checkpoints if t.is_alive()] + [thread]
+
+    pipeline = BulkPipeline(
+        processor,
+        options,
+        build_post_options(config),
+        suffix=suffix,
+        decode_workers=config.get("pipeline_decode_workers", 2),
+        post_workers=config.get("pipeline_post_workers", 2),
+        write_workers=config.get("pipeline_write_workers", 1),
+        queue_size=config.get("pipeline_queue_size", 4),
+        inference_batch_size=config.get("pipeline_inference_batch", 1),
+        memory_budget_mb=config.get("memory_budget_mb", 0),
+        decode_processes=config.get("pipeline_decode_processes", 0),
+        shared_slot_mb=config.get("pipeline_shared_slot_mb", 64),
+        skip_processed=config.get("skip_processed", True),
+        cutout_post_process=config.get("cutout_post_process", False),
+        on_item_complete=lambda item: on_finished(item, f"[Watch] Saved: {item.output_path}"),
+        on_item_error=lambda item: on_finished(item, f"[Watch] Failed: {item.input_path}: {item.error}"),
+        on_item_skipped=lambda item: on_finished(item, f"[Watch] Skipped: {item.input_path} ({item.skipped})"),
+        profiler=_make_profiler(args),
+    )
+    tracker = _make_memory_tracker(args, config, processor, pipeline)
+
+    try:
+        watcher.start()
+    except (OSError, RuntimeError) as e:
+        print(f"[Watch] {e}")
+        return 1
+
+    # The pipeline runs until the watcher stops feeding it
+    def stop():
+        print("[Watch] Stopping - finishing images already queued")
+        watcher.stop()
+
+    _run_until_done(lambda: pipeline.run(watcher.paths()), stop)
+    print(f"[Watch] {watcher.queued} queued, {watcher.skipped} skipped (output exists)")
+    routing = format_routing_summary(pipeline.counters)
+    if routing:
+        print(f"[Watch] {routing}")
+    _save_profile(pipeline.profiler, args, "watch")
+    if tracker is not None:
+        for thread in checkpoints:
+            thread.join()
+        tracker.checkpoint("watch")
+        tracker.stop()
+    return 0
+
+
+def _load_sample_images(folder: str, limit: int) -> list:
+    """Load up to limit images from a folder, sorted by name."""
+    try:
+        from core.constants import VALID_EXTENSIONS
+    except ImportError:
+        from ..core.constants import VALID_EXTENSIONS
+    from PIL import Image
+
+    paths = sorted(p for p in Path(folder).iterdir() if p.suffix.lower() in VALID_EXTENSIONS)
+    images = []
+    for path in paths[:limit]:
+        with Image.open(path) as image:
+            images.append(image.convert("RGB"))
+    return images
+
+
+def cmd_enqueue(args, config: dict) -> int:
+    """Add images to a shared job database (or show its progress)."""
+    try:
+        from services.distributed import JobStore
+    except ImportError:
+        from ..services.distributed import JobStore
+
+    store = JobStore(args.db, config.get("distributed_max_attempts", 3))
+    try:
+        if args.retry_failed:
+            print(f"[Queue] {store.retry_failed()} failed images queued again")
+        if args.inputs:
+            paths = [p.resolve() for p in _collect_images(args.inputs, args.recursive)]
+            suffix = args.suffix or config.get("suffix") or "_nobg"
+            print(f"[Queue] Added {store.add(paths, suffix)} of {len(paths)} images")
+        counts = store.counts()
+        print("[Queue] " + ", ".join(f"{n} {state}" for state, n in counts.items()))
+        for input_path, error in store.failures():
+            print(f"[Queue] Failed: {input_path}: {error}")
+    finally:
+        store.close()
+    return 0
+
+
+def cmd_worker(args, config: dict) -> int:
+    """Process images from a shared job database until it is finished."""
+    try:
+        from core.config import build_processing_options, build_post_options
+        from core.pipeline import BulkPipeline, format_stage_summary
+        from processors.rembg_processor import RembgProcessor
+        from services.distributed import DistributedWorker, JobStore
+        from utils.memory import format_memory_breakdown, get_memory_breakdown
+    except ImportError:
+        from ..core.config import build_processing_options, build_post_options
+        from ..core.pipeline import BulkPipeline, format_stage_summary
+        from ..processors.rembg_processor import RembgProcessor
+        from ..services.distributed import DistributedWorker, JobStore
+        from ..utils.memory import format_memory_breakdown, get_memory_breakdown
+
+    config = _apply_routing_args(args, config)
+    if args.shared_weights is not None:
+        config = dict(config, shared_weights=args.shared_weights)
+    processes = args.processes or config.get("worker_processes", 1)
+    if processes > 1:
+        return _run_worker_processes(args, config, processes)
+    store = JobStore(args.db, config.get("distributed_max_attempts", 3))
+    worker = DistributedWorker(
+        store,
+        worker_id=args.worker_id,
+        chunk_size=args.chunk_size or config.get("distributed_chunk_size", 8),
+        lease_seconds=args.lease or config.get("distributed_lease_seconds", 120.0),
+    )
+    print(f"[Worker] {worker.worker_id} on {args.db}")
+
+    def on_complete(item):
+        print(f"[Worker] Saved: {item.output_path}")
+        worker.on_item_complete(item)
+
+    def on_error(item):
+        print(f"[Worker] Failed: {item.input_path}: {item.error}")
+        worker.on_item_error(item)
+
+    processor = RembgProcessor(
+        max_sessions=2 if config.get("cascade", False) else 1,
+        shared_weights=config.get("shared_weights", False),
+        intra_op_threads=config.get("onnx_intra_op_threads", 0),
+    )
+    options = build_processing_options(config)
+    print(f"[Worker] Loading model: {options['model']}")
+    processor.load_model(options["model"])
+    print(f"[Worker] Memory after loading: {format_memory_breakdown(get_memory_breakdown())}")
+
+    # Outputs are named with the suffix the job was queued with
+    pipeline = BulkPipeline(
+        processor,
+        options,
+        build_post_options(config),
+        suffix=store.suffix,
+        decode_workers=config.get("pipeline_decode_workers", 2),
+        post_workers=config.get("pipeline_post_workers", 2),
+        write_workers=config.get("pipeline_write_workers", 1),
+        queue_size=config.get("pipeline_queue_size", 4),
+        inference_batch_size=config.get("pipeline_inference_batch", 1),
+        memory_budget_mb=config.get("memory_budget_mb", 0),
+        decode_processes=config.get("pipeline_decode_processes", 0),
+        shared_slot_mb=config.get("pipeline_shared_slot_mb", 64),
+        skip_processed=config.get("skip_processed", True),
+        cutout_post_process=config.get("cutout_post_process", False),
+        on_item_complete=on_complete,
+        on_item_error=on_error,
+        on_item_skipped=worker.on_item_complete,
+        profiler=_make_profiler(args),
+    )
+
+    def stop():
+        print("[Worker] Stopping - finishing images already claimed")
+        worker.stop()
+
+    result = _run_until_done(lambda: worker.run(pipeline), stop)
+
+    print(f"[Worker] {worker.completed} done, {worker.failed} failed by this worker")
+    if result:
+        print(f"[Worker] {format_stage_summary(result)}")
+    print(f"[Worker] Memory: {format_memory_breakdown(get_memory_breakdown())}")
+    counts = store.counts()
+    print("[Worker] Job: " + ", ".join(f"{n} {state}" for state, n in counts.items()))
+    store.close()
+    _save_profile(pipeline.profiler, args, f"worker-{os.getpid()}")
+    return 0
+
+
+def _worker_process(args, config: dict) -> None:
+    """One of several local workers (runs in a spawned process)."""
+    # The parent owns the metrics HTTP port
+    configure_metrics(dict(config, metrics_http_port=0))
+    try:
+        cmd_worker(args, config)
+    finally:
+        flush_metrics()
+
+
+def _run_worker_processes(args, config: dict, processes: int) -> int:
+    """Start processes workers on the same job database and wait for them."""
+    print(f"[Worker] Starting {processes} worker processes on {args.db}")
+    # Spawned, not forked: forking a process with model threads running is unsafe
+    ctx = multiprocessing.get_context("spawn")
+    children = []
+    for i in range(processes):
+        child_args = argparse.Namespace(**vars(args))
+        child_args.processes = 1
+        if args.worker_id:
+            child_args.worker_id = f"{args.worker_id}-{i + 1}"
+        if args.profile_file:
+            profile_file = Path(args.profile_file)
+            child_args.profile_file = str(profile_file.with_name(f"{profile_file.stem}-{i + 1}{profile_file.suffix}"))
+        child = ctx.Process(target=_worker_process, args=(child_args, config))
+        child.start()
+        children.append(child)
+
+    # Ctrl+C reaches the children too; each finishes what it has claimed
+    for child in children:
+        while child.is_alive():
+            try:
+                child.join(0.5)
+            except KeyboardInterrupt:
+                print("[Worker] Stopping - waiting for worker processes to finish their claims")
+    return max(child.exitcode or 0 for child in children)
+
+
+def cmd_autotune(args, config: dict) -> int:
+    """Find the fastest processes x threads x batch size for a model on this machine."""
+    try:
+        from core.config import save_config
+        from services.autotune import (
+            DEFAULT_BATCH_SIZES, apply_best, autotune, default_grid, make_grid, make_sample_images
+        )
+    except ImportError:
+        from ..core.config import save_config
+        from ..services.autotune import (
+            DEFAULT_BATCH_SIZES, apply_best, autotune, default_grid, make_grid, make_sample_images
+        )
+    import tempfile
+
+    if args.model:
+        config = dict(config, model=args.model)
+    batch_sizes = _int_list(args.batch) if args.batch else DEFAULT_BATCH_SIZES
+    if args.processes or args.threads:
+        trials = make_grid(
+            _int_list(args.processes) if args.processes else [1],
+            _int_list(args.threads) if args.threads else [0],
+            batch_sizes,
+        )
+    else:
+        trials = default_grid(batch_sizes=batch_sizes)
+
+    mb = lambda value: f"{value / (1024 * 1024):.0f} MB" if value else "?"
+
+    def on_trial(trial):
+        if trial.error:
+            print(f"[Autotune]   failed: {trial.error}")
+        else:
+            print(f"[Autotune]   {trial.images_per_sec:.2f} images/s, memory {mb(trial.memory_bytes)}")
+
+    with tempfile.TemporaryDirectory(prefix="bg_autotune_samples_") as tmp_dir:
+        if args.images:
+            paths = _collect_images([args.images], False)[:args.limit]
+            if not paths:
+                print(f"[Autotune] No images in {args.images}")
+                return 1
+        else:
+            paths = make_sample_images(Path(tmp_dir), args.limit)
+        print(f"[Autotune] {config['model']}: {len(trials)} trials on {len(paths)} images")
+        result = autotune(config, paths, trials, args.max_memory_mb, on_trial)
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump({
+                "model": config["model"],
+                "trials": [trial.to_dict() for trial in result["trials"]],
+            }, f, indent=2)
+        print(f"[Autotune] Report written to {args.report}")
+
+    best = result["best"]
+    if best is None:
+        print("[Autotune] No trial succeeded" + (" within the memory limit" if args.max_memory_mb else ""))
+        return 1
+    print(f"[Autotune] Best: {best.processes} processes x {best.threads} threads, batch {best.batch_size} - "
+          f"{best.images_per_sec:.2f} images/s, memory {mb(best.memory_bytes)}")
+    if args.dry_run:
+        return 0
+    # Saved over the file's own settings, not the ones changed for the sweep
+    save_config(apply_best(load_config(), best, config["model"]))
+    print("[Autotune] Saved as worker_processes, onnx_intra_op_threads and pipeline_inference_batch")
+    return 0
+
+
+def _int_list(value: str) -> List[int]:
+    """Parse "1,2,4" into [1, 2, 4]."""
+    return [int(part) for part in value.split(",") if part.strip()]
+
+
+def cmd_quantize(args, config: dict) -> int:
+    """Create an INT8 variant of a model and compare it with the FP32 model."""
+    try:
+        from processors.sessions import (
+            evaluate_variant, find_quantized_model, quantize_model, split_model_name, variant_name
+        )
+    except ImportError:
+        from ..processors.sessions import (
+            evaluate_variant, find_quantized_model, quantize_model, split_model_name, variant_name
+        )
+
+    base, _ = split_model_name(args.model)
+    mode = "static" if args.static else "dynamic"
+    name = variant_name(base, mode)
+    status = lambda msg: print(f"[Quantize] {msg}")
+
+    if args.static and not args.calibration:
+        print("[Quantize] --static needs --calibration <image folder>")
+        return 1
+
+    existing = find_quantized_model(base, mode)
+    if existing is not None and not args.force:
+        status(f"{name} already exists ({existing}); use --force to recreate")
+    else:
+        calibration = _load_sample_images(args.calibration, args.limit) if args.calibration else None
+        try:
+            quantize_model(base, mode, calibration, status)
+        except (RuntimeError, ValueError) as e:
+            status(str(e))
+            return 1
+
+    sample_folder = args.compare or args.calibration
+    if not sample_folder:
+        status(f"Select '{name}' as the model to use it (pass --compare <image folder> to check accuracy)")
+        return 0
+
+    report = evaluate_variant(name, _load_sample_images(sample_folder, args.limit), status)
+    status(
+        f"{name} vs {base} on {report['images']} images: "
+        f"IoU mean {report['iou_mean']:.4f} (min {report['iou_min']:.4f}), "
+        f"MAE mean {report['mae_mean']:.4f} (max {report['mae_max']:.4f}), "
+        f"{report['fp32_seconds_mean'] * 1000:.0f} ms -> {report['int8_seconds_mean'] * 1000:.0f} ms "
+        f"({report['speedup']:.2f}x)"
+    )
+    if args.report:
+        Path(args.report).write_text(json.dumps(report, indent=2))
+        status(f"Report written to {args.report}")
+    return 0
+
+
+def _add_profile_args(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--profile", action="store_true",
+                        help="Profile the processing threads and write a .prof file and summary")
+    parser.add_argument("--profile-file",
+                        help="Where to write the profile (default: bg_remover-COMMAND-profile-TIME.prof here)")
+    parser.add_argument("--profile-top", type=int, default=25,
+                        help="Functions per stage in the profile summary")
+
+
+def _add_routing_args(parser: argparse.ArgumentParser) -> None:
+    """Model and routing flags shared by process and watch."""
+    parser.add_argument("--model", help="Model to use (default: saved setting)")
+    parser.add_argument("--fast-path", action=argparse.BooleanOptionalAction, default=None,
+                        help="Key out plain studio backgrounds without the model")
+    parser.add_argument("--cascade", action=argparse.BooleanOptionalAction, default=None,
+                        help="Try the fast model first, use --model only when unsure")
+    parser.add_argument("--dedup", action=argparse.BooleanOptionalAction, default=None,
+                        help="Reuse masks across near-identical frames (bracketing, retakes)")
+    parser.add_argument("--roi", action=argparse.BooleanOptionalAction, default=None,
+                        help="Refine small subjects on a crop around them (large frames)")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="bg_remover",
+        description="BrainDead Background Remover (run without arguments for the GUI)",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    process = commands.add_parser("process", help="Process images and folders once")
+    process.add_argument("inputs", nargs="+", help="Image files and/or folders")
+    process.add_argument("--recursive", action="store_true", help="Include images in subfolders")
+    process.add_argument("--suffix", help="Output filename suffix (default: saved setting)")
+    _add_routing_args(process)
+    process.add_argument("--sequence", action=argparse.BooleanOptionalAction, default=None,
+                         help="Treat numbered frames (frame_0001.png, ...) as sequences: "
+                              "run the model on keyframes and carry masks to the frames between")
+    process.add_argument("--keyframe-interval", type=int,
+                         help="Frames between model runs in --sequence mode (default: 8)")
+    process.add_argument("--report",
+                         help="Write the input paths by outcome (completed, failed, skipped, "
+                              "cancelled, not_started) as JSON here")
+    _add_profile_args(process)
+    process.set_defaults(func=cmd_process)
+
+    serve = commands.add_parser("serve", help="Local HTTP inference server with warm models")
+    serve.add_argument("--host", help="Address to listen on (default: server_host setting)")
+    serve.add_argument("--port", type=int, help="Port to listen on (default: server_port setting)")
+    serve.add_argument("--model", action="append",
+                       help="Model to load at startup and use by default; repeat to keep several warm")
+    serve.add_argument("--max-batch-size", type=int, help="Most requests coalesced into one model call")
+    serve.add_argument("--max-latency-ms", type=float,
+                       help="Longest a request waits for others to batch with")
+    serve.set_defaults(func=cmd_serve)
+
+    watch = commands.add_parser("watch", help="Process images as they land in hot folders")
+    watch.add_argument("dirs", nargs="*", help="Folders to watch (default: watch_dirs setting)")
+    watch.add_argument("--suffix", help="Output filename suffix (default: saved setting)")
+    _add_routing_args(watch)
+    watch.add_argument("--debounce", type=float,
+                       help="Seconds a file's size must stay unchanged before it is processed")
+    watch.add_argument("--recursive", action="store_true", help="Also watch subfolders")
+    watch.add_argument("--new-only", action="store_true",
+                       help="Ignore images already in the folders at startup")
+    watch.add_argument("--backend", choices=["auto", "watchdog", "inotify", "scan"],
+                       help="File event source (default: best available)")
+    watch.add_argument("--track-memory", action="store_true",
+                       help="Log memory growth and top allocators every memory_check_images images")
+    watch.add_argument("--recycle-mb", type=int,
+                       help="With --track-memory: reload the model once memory has grown this much")
+    _add_profile_args(watch)
+    watch.set_defaults(func=cmd_watch)
+
+    enqueue = commands.add_parser("enqueue", help="Add images to a job database shared by workers")
+    enqueue.add_argument("db", help="Job database (SQLite file on a shared mount)")
+    enqueue.add_argument("inputs", nargs="*", help="Image files and/or folders (none: show progress)")
+    enqueue.add_argument("--recursive", action="store_true", help="Include images in subfolders")
+    enqueue.add_argument("--suffix", help="Output filename suffix for the job (default: saved setting)")
+    enqueue.add_argument("--retry-failed", action="store_true", help="Queue failed images again")
+    enqueue.set_defaults(func=cmd_enqueue)
+
+    worker = commands.add_parser("worker", help="Process images from a shared job database")
+    worker.add_argument("db", help="Job database created by enqueue")
+    _add_routing_args(worker)
+    worker.add_argument("--chunk-size", type=int, help="Images claimed at a time (default: 8)")
+    worker.add_argument("--lease", type=float,
+                        help="Seconds a claim lasts without a heartbeat (default: 120)")
+    worker.add_argument("--worker-id", help="Name of this worker (default: host:pid:random)")
+    worker.add_argument("--shared-weights", action=argparse.BooleanOptionalAction, default=None,
+                        help="Share one memory-mapped copy of the model weights between workers on this machine")
+    worker.add_argument("--processes", type=int,
+                        help="Worker processes to start on this machine (default: worker_processes setting)")
+    _add_profile_args(worker)
+    worker.set_defaults(func=cmd_worker)
+
+    quantize = commands.add_parser("quantize", help="Create an INT8 model variant and check its accuracy")
+    quantize.add_argument("model", help="Model to quantize, e.g. birefnet-general")
+    quantize.add_argument("--static", action="store_true",
+                          help="Static (calibrated) quantization instead of dynamic")
+    quantize.add_argument("--calibration", help="Folder of sample images for static calibration")
+    quantize.add_argument("--compare", help="Folder of sample images to compare FP32 and INT8 masks on")
+    quantize.add_argument("--limit", type=int, default=32, help="Most sample images to use")
+    quantize.add_argument("--report", help="Write the comparison as JSON here")
+    quantize.add_argument("--force", action="store_true", help="Recreate the variant if it exists")
+    quantize.set_defaults(func=cmd_quantize)
+
+    tune = commands.add_parser("autotune", help="Find the fastest processes, threads and batch size here")
+    tune.add_argument("--model", help="Model to tune for (default: saved setting)")
+    tune.add_argument("--images", help="Folder of sample images (default: synthetic images)")
+    tune.add_argument("--limit", type=int, default=16, help="Sample images per trial")
+    tune.add_argument("--processes", help="Process counts to try, e.g. 1,2,4 (default: by core count)")
+    tune.add_argument("--threads", help="Intra-op thread counts to try, e.g. 2,4,8 (default: by core count)")
+    tune.add_argument("--batch", help="Batch sizes to try, e.g. 1,2,4 (default: 1,2,4)")
+    tune.add_argument("--max-memory-mb", type=int, default=0,
+                      help="Only pick configurations using at most this much memory")
+    tune.add_argument("--report", help="Write every trial's measurements as JSON here")
+    tune.add_argument("--dry-run", action="store_true", help="Print the best configuration without saving it")
+    tune.set_defaults(func=cmd_autotune)
+
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    config = load_config()
+    configure_metrics(config)
+    try:
+        return args.func(args, config)
+    finally:
+        flush_metrics()
@@ -6,6 +6,7 @@ import os
 import sys
 import re
 import threading
+import time
 from pathlib import Path
 from typing import Optional, List
 
@@ -16,27 +17,55 @@ from PIL import Image, ImageTk
 
 try:
     from core.constants import (
-        REMBG_MODELS, SUFFIX_OPTIONS, BACKGROUND_OPTIONS,
+        REMBG_MODELS, SUFFIX_OPTIONS, BACKGROUND_OPTIONS, MATTING_METHODS, CASCADE_FAST_MODEL,
         VALID_EXTENSIONS, WINDOW_WIDTH, WINDOW_HEIGHT,
-        MIN_WINDOW_WIDTH, MIN_WINDOW_HEIGHT, PREVIEW_MAX_WIDTH, PREVIEW_MAX_HEIGHT
+        MIN_WINDOW_WIDTH, MIN_WINDOW_HEIGHT, PREVIEW_MAX_WIDTH, PREVIEW_MAX_HEIGHT,
+        CLOSE_TIMEOUT_SECONDS
+    )
+    from core.config import (
+        load_config, save_config, set_hf_token, get_hf_token, build_processing_options, build_post_options
     )
-    from core.config import load_config, save_config, set_hf_token, get_hf_token
     from processors.rembg_processor import RembgProcessor
+    from processors.sessions import get_model_description, get_quantized_models
     from processors.sam3_processor import Sam3Processor, is_sam3_available, get_sam3_import_error
     from utils.gpu import check_nvidia_gpu
-    from utils.image import auto_crop_image, add_sticker_outline, create_checkerboard_preview, apply_background_color
+    from core.metrics import ImageTimings, configure_metrics, get_metrics, flush_metrics, span
+    from core.sequence import format_sequence_summary
+    from core.scheduler import CANCELLED, JobScheduler
+    from core.profiling import RunProfiler, default_profile_path
+    from core.memory_tracker import MemoryTracker
+    from core.pipeline import (
+        BulkPipeline, build_output_path, cutout_input_action, format_routing_summary, format_stage_summary,
+        is_output_file, write_output
+    )
+    from utils.animation import Animation, is_animated, load_frames, post_process_animation
+    from utils.image import create_checkerboard_preview, apply_background_color, apply_post_processing
     from ui.dialogs import show_sam3_install_dialog, show_hf_token_dialog, run_sam3_installation
 except ImportError:
     from ..core.constants import (
-        REMBG_MODELS, SUFFIX_OPTIONS, BACKGROUND_OPTIONS,
+        REMBG_MODELS, SUFFIX_OPTIONS, BACKGROUND_OPTIONS, MATTING_METHODS, CASCADE_FAST_MODEL,
         VALID_EXTENSIONS, WINDOW_WIDTH, WINDOW_HEIGHT,
-        MIN_WINDOW_WIDTH, MIN_WINDOW_HEIGHT, PREVIEW_MAX_WIDTH, PREVIEW_MAX_HEIGHT
+        MIN_WINDOW_WIDTH, MIN_WINDOW_HEIGHT, PREVIEW_MAX_WIDTH, PREVIEW_MAX_HEIGHT,
+        CLOSE_TIMEOUT_SECONDS
+    )
+    from ..core.config import (
+        load_config, save_config, set_hf_token, get_hf_token, build_processing_options, build_post_options
     )
-    from ..core.config import load_config, save_config, set_hf_token, get_hf_token
     from ..processors.rembg_processor import RembgProcessor
+    from ..processors.sessions import get_model_description, get_quantized_models
     from ..processors.sam3_processor import Sam3Processor, is_sam3_available, get_sam3_import_error
     from ..utils.gpu import check_nvidia_gpu
-    from ..utils.image import auto_crop_image, add_sticker_outline, create_checkerboard_preview, apply_background_color
+    from ..core.metrics import ImageTimings, configure_metrics, get_metrics, flush_metrics, span
+    from ..core.sequence import format_sequence_summary
+    from ..core.scheduler import CANCELLED, JobScheduler
+    from ..core.profiling import RunProfiler, default_profile_path
+    from ..core.memory_tracker import MemoryTracker
+    from ..core.pipeline import (
+        BulkPipeline, build_output_path, cutout_input_action, format_routing_summary, format_stage_summary,
+        is_output_file, write_output
+    )
+    from ..utils.animation import Animation, is_animated, load_frames, post_process_animation
+    from ..utils.image import create_checkerboard_preview, apply_background_color, apply_post_processing
     from .dialogs import show_sam3_install_dialog, show_hf_token_dialog, run_sam3_installation
 
 
@@ -51,22 +80,47 @@ class BackgroundRemoverApp:
 
         # Load config
         self.config = load_config()
+        configure_metrics(self.config)
 
         # Initialize processors
-        self.rembg_processor = RembgProcessor()
+        # Cascade runs two models; both stay loaded only while it is on
+        self.rembg_processor = RembgProcessor(
+            max_sessions=2 if self.config.get("cascade", False) else 1,
+            intra_op_threads=self.config.get("onnx_intra_op_threads", 0),
+        )
         self.sam3_processor = Sam3Processor()
 
-        # Processing state
+        # Processing state: processing is the single (interactive) image;
+        # bulk jobs queue in the scheduler and yield to it
         self.processing = False
         self.current_image_path: Optional[str] = None
         self.image_queue: List[str] = []
         self.bulk_processing = False
         self.last_result_image: Optional[Image.Image] = None
+        self.scheduler = JobScheduler(
+            slice_size=self.config.get("scheduler_slice_size", 32),
+            on_job_finished=lambda job: self.root.after(0, lambda: self._on_bulk_complete(job)),
+        )
 
-        # Bulk processing stats
+        # Bulk processing stats, over all queued bulk jobs
+        self.bulk_jobs = 0
+        self.bulk_last_path: Optional[str] = None
+        # Profiler of the current bulk session (profile_runs setting)
+        self.bulk_profiler: Optional[RunProfiler] = None
+        self._ui_profile = None
         self.bulk_total = 0
         self.bulk_completed = 0
         self.bulk_errors = 0
+        self.bulk_skipped = 0
+        # Dropped in flight by Cancel, and never started
+        self.bulk_cancelled = 0
+        self.bulk_not_started = 0
+
+        # Memory growth per batch (memory_tracking setting)
+        self.memory_tracker: Optional[MemoryTracker] = None
+        self._images_since_memory_check = 0
+        if self.config.get("memory_tracking", False):
+            self._start_memory_tracking()
 
         # Setup UI
         self._setup_ui()
@@ -282,7 +336,8 @@ class BackgroundRemoverApp:
         self.model_combo = ttk.Combobox(
             self.model_frame,
             textvariable=self.model_var,
-            values=list(REMBG_MODELS.keys()),
+            # Locally created INT8 variants are listed after the stock models
+            values=list(REMBG_MODELS.keys()) + list(get_quantized_models().keys()),
             state="readonly",
             width=25
         )
@@ -290,7 +345,7 @@ class BackgroundRemoverApp:
         self.model_combo.bind("<<ComboboxSelected>>", self._on_model_change)
 
         # Model description
-        self.model_desc_var = tk.StringVar(value=REMBG_MODELS.get(self.config["model"], ""))
+        self.model_desc_var = tk.StringVar(value=get_model_description(self.config["model"]))
         self.model_desc_label = ttk.Label(
             settings_frame,
             textvariable=self.model_desc_var,
@@ -299,10 +354,55 @@ class BackgroundRemoverApp:
         )
         self.model_desc_label.pack(anchor=tk.W, pady=(0, 5))
 
+        # Cascade: fast model first, selected model only when unsure
+        self.cascade_var = tk.BooleanVar(value=self.config.get("cascade", False))
+        self.cascade_check = ttk.Checkbutton(
+            settings_frame,
+            text=f"Cascade (try {self.config.get('cascade_fast_model', CASCADE_FAST_MODEL)} first, "
+                 f"use this model only when unsure)",
+            variable=self.cascade_var,
+            command=self._on_cascade_change
+        )
+        self.cascade_check.pack(anchor=tk.W, pady=(0, 5))
+
+        # Fast path: solid studio backgrounds are keyed without the model
+        self.fast_path_var = tk.BooleanVar(value=self.config.get("fast_path", False))
+        self.fast_path_check = ttk.Checkbutton(
+            settings_frame,
+            text="Fast path for plain backgrounds (skip the model on seamless white/green shots)",
+            variable=self.fast_path_var,
+            command=self._on_setting_change
+        )
+        self.fast_path_check.pack(anchor=tk.W, pady=(0, 5))
+
+        # Dedup: near-identical frames reuse the first frame's mask
+        self.dedup_var = tk.BooleanVar(value=self.config.get("dedup", False))
+        self.dedup_check = ttk.Checkbutton(
+            settings_frame,
+            text="Reuse masks for near-identical frames (bracketing, retakes)",
+            variable=self.dedup_var,
+            command=self._on_setting_change
+        )
+        self.dedup_check.pack(anchor=tk.W, pady=(0, 5))
+
+        # ROI: second pass on a crop around small subjects in large frames
+        self.roi_var = tk.BooleanVar(value=self.config.get("roi", False))
+        self.roi_check = ttk.Checkbutton(
+            settings_frame,
+            text="Refine small subjects on a crop (large photos, subject far away)",
+            variable=self.roi_var,
+            command=self._on_setting_change
+        )
+        self.roi_check.pack(anchor=tk.W, pady=(0, 5))
+
         # Hide if SAM3 mode
         if self.config.get("use_sam3"):
             self.model_frame.pack_forget()
             self.model_desc_label.pack_forget()
+            self.cascade_check.pack_forget()
+            self.fast_path_check.pack_forget()
+            self.dedup_check.pack_forget()
+            self.roi_check.pack_forget()
 
         # Suffix selection
         suffix_frame = ttk.Frame(settings_frame)
@@ -406,8 +506,71 @@ class BackgroundRemoverApp:
 
         self._setup_sticker_settings()
 
+        # Inputs that are already cutouts (previous outputs, transparent PNGs)
+        self.skip_processed_var = tk.BooleanVar(value=self.config.get("skip_processed", True))
+        ttk.Checkbutton(
+            settings_frame,
+            text="Skip images that are already cutouts (transparent or named like an output)",
+            variable=self.skip_processed_var,
+            command=self._on_setting_change
+        ).pack(anchor=tk.W, pady=5)
+        self.cutout_post_var = tk.BooleanVar(value=self.config.get("cutout_post_process", False))
+        ttk.Checkbutton(
+            settings_frame,
+            text="Post-process transparent inputs instead (crop, sticker, background)",
+            variable=self.cutout_post_var,
+            command=self._on_setting_change
+        ).pack(anchor=tk.W, padx=(20, 0))
+
+        # Numbered frames (turntables, video exports) in bulk mode
+        self.sequence_var = tk.BooleanVar(value=self.config.get("sequence_mode", False))
+        ttk.Checkbutton(
+            settings_frame,
+            text="Treat numbered frames as a sequence (model on keyframes only)",
+            variable=self.sequence_var,
+            command=self._on_setting_change
+        ).pack(anchor=tk.W, pady=5)
+
+        # cProfile of bulk runs, for finding where the time goes
+        self.profile_var = tk.BooleanVar(value=self.config.get("profile_runs", False))
+        ttk.Checkbutton(
+            settings_frame,
+            text="Profile bulk runs (writes a .prof file next to the outputs)",
+            variable=self.profile_var,
+            command=self._on_setting_change
+        ).pack(anchor=tk.W)
+        self.memory_tracking_var = tk.BooleanVar(value=self.config.get("memory_tracking", False))
+        ttk.Checkbutton(
+            settings_frame,
+            text="Track memory growth per batch (console log; slows processing slightly)",
+            variable=self.memory_tracking_var,
+            command=self._on_memory_tracking_change
+        ).pack(anchor=tk.W, pady=(0, 5))
+
     def _setup_alpha_sliders(self):
         """Setup alpha matting sliders."""
+        # Matting method
+        method_frame = ttk.Frame(self.alpha_settings_frame)
+        method_frame.pack(fill=tk.X, pady=2)
+        ttk.Label(method_frame, text="Method:").pack(side=tk.LEFT)
+        self.matting_method_var = tk.StringVar(value=self.config.get("alpha_matting_method", "closed_form"))
+        method_combo = ttk.Combobox(
+            method_frame,
+            textvariable=self.matting_method_var,
+            values=list(MATTING_METHODS.keys()),
+            state="readonly",
+            width=12
+        )
+        method_combo.pack(side=tk.LEFT, padx=10)
+        method_combo.bind("<<ComboboxSelected>>", self._on_setting_change)
+        self.matting_method_desc_var = tk.StringVar(value=MATTING_METHODS.get(self.matting_method_var.get(), ""))
+        ttk.Label(
+            method_frame,
+            textvariable=self.matting_method_desc_var,
+            font=("Segoe UI", 8),
+            foreground="gray"
+        ).pack(side=tk.LEFT)
+
         # FG threshold
         fg_frame = ttk.Frame(self.alpha_settings_frame)
         fg_frame.pack(fill=tk.X, pady=2)
@@ -519,6 +682,23 @@ class BackgroundRemoverApp:
             command=self._open_output_folder
         ).pack(side=tk.LEFT, padx=5)
 
+        # Bulk controls, enabled while bulk jobs run
+        self.cancel_btn = ttk.Button(
+            btn_frame,
+            text="Cancel",
+            command=self._cancel_bulk,
+            state=tk.DISABLED
+        )
+        self.cancel_btn.pack(side=tk.RIGHT, padx=5)
+
+        self.pause_btn = ttk.Button(
+            btn_frame,
+            text="Pause",
+            command=self._toggle_bulk_pause,
+            state=tk.DISABLED
+        )
+        self.pause_btn.pack(side=tk.RIGHT, padx=5)
+
     def _setup_info(self, parent):
         """Setup info labels at bottom."""
         info_frame = ttk.Frame(parent)
@@ -615,6 +795,17 @@ class BackgroundRemoverApp:
             self.status_var.set(f"Error: No valid image files found")
             return
 
+        # Previous outputs dropped along with the rest of a folder are finished work
+        if len(valid_files) > 1 and self.skip_processed_var.get():
+            suffix = self.suffix_var.get() or "_nobg"
+            outputs = [fp for fp in valid_files if is_output_file(Path(fp), suffix)]
+            valid_files = [fp for fp in valid_files if fp not in outputs]
+            if outputs:
+                print(f"[Drop] Skipping {len(outputs)} previous outputs")
+            if not valid_files:
+                self.status_var.set(f"All {len(outputs)} dropped images are already processed")
+                return
+
         if len(valid_files) == 1:
             self._load_image(valid_files[0])
         else:
@@ -624,10 +815,11 @@ class BackgroundRemoverApp:
         file_paths = filedialog.askopenfilenames(
             title="Select Image(s)",
             filetypes=[
-                ("Image files", "*.png *.jpg *.jpeg *.webp *.bmp *.tiff *.tif"),
+                ("Image files", "*.png *.jpg *.jpeg *.webp *.bmp *.tiff *.tif *.gif *.apng"),
                 ("PNG", "*.png"),
                 ("JPEG", "*.jpg *.jpeg"),
                 ("WebP", "*.webp"),
+                ("Animated", "*.gif *.apng *.png *.webp"),
                 ("All files", "*.*")
             ]
         )
@@ -653,6 +845,10 @@ class BackgroundRemoverApp:
 
         try:
             img = Image.open(file_path)
+            width, height = img.size
+            if self._low_memory:
+                # JPEGs can decode at reduced scale - enough for a preview
+                img.draft("RGB", (PREVIEW_MAX_WIDTH * 2, PREVIEW_MAX_HEIGHT * 2))
 
             # Create preview with checkerboard background for transparency
             preview_img = create_checkerboard_preview(
@@ -672,8 +868,8 @@ class BackgroundRemoverApp:
 
             self.preview_container.pack(expand=True, fill=tk.BOTH, pady=10)
 
-            orig_img = Image.open(file_path)
-            self.status_var.set(f"Loaded: {path.name} ({orig_img.width}x{orig_img.height})")
+            img = None
+            self.status_var.set(f"Loaded: {path.name} ({width}x{height})")
 
             self.process_btn.config(state=tk.NORMAL)
 
@@ -697,12 +893,20 @@ class BackgroundRemoverApp:
             self.sam3_frame.pack(fill=tk.X, pady=5, after=self.progress)
             self.model_frame.pack_forget()
             self.model_desc_label.pack_forget()
+            self.cascade_check.pack_forget()
+            self.fast_path_check.pack_forget()
+            self.dedup_check.pack_forget()
+            self.roi_check.pack_forget()
             self.alpha_check.pack_forget()
             self.alpha_settings_frame.pack_forget()
         else:
             self.sam3_frame.pack_forget()
             self.model_frame.pack(fill=tk.X, pady=2)
             self.model_desc_label.pack(anchor=tk.W, pady=(0, 5))
+            self.cascade_check.pack(anchor=tk.W, pady=(0, 5), after=self.model_desc_label)
+            self.fast_path_check.pack(anchor=tk.W, pady=(0, 5), after=self.cascade_check)
+            self.dedup_check.pack(anchor=tk.W, pady=(0, 5), after=self.fast_path_check)
+            self.roi_check.pack(anchor=tk.W, pady=(0, 5), after=self.dedup_check)
             self.alpha_check.pack(anchor=tk.W, pady=5)
             if self.alpha_var.get():
                 self.alpha_settings_frame.pack(fill=tk.X, pady=5, padx=(20, 0))
@@ -711,10 +915,14 @@ class BackgroundRemoverApp:
 
     def _on_model_change(self, event=None):
         model = self.model_var.get()
-        self.model_desc_var.set(REMBG_MODELS.get(model, ""))
+        self.model_desc_var.set(get_model_description(model))
         self.rembg_processor.clear_session()
         self._save_current_config()
 
+    def _on_cascade_change(self):
+        self.rembg_processor.set_max_sessions(2 if self.cascade_var.get() else 1)
+        self._on_setting_change()
+
     def _on_setting_change(self, event=None):
         # Update background preview
         bg_choice = self.bg_color_var.get()
@@ -726,6 +934,7 @@ class BackgroundRemoverApp:
         else:
             preview_color = "#cccccc"
         self.bg_preview.config(bg=preview_color)
+        self.matting_method_desc_var.set(MATTING_METHODS.get(self.matting_method_var.get(), ""))
         self._save_current_config()
 
     def _on_alpha_toggle(self):
@@ -797,43 +1006,76 @@ class BackgroundRemoverApp:
         self.progress.start(10)
         self.status_var.set("Processing... (first run downloads model)")
 
-        thread = threading.Thread(target=self._process_image_thread)
-        thread.daemon = True
-        thread.start()
+        # Runs ahead of any queued bulk work
+        input_path = self.current_image_path
+        self.scheduler.submit_interactive(lambda: self._process_image_thread(input_path))
 
-    def _process_image_thread(self):
+    def _process_image_thread(self, image_path: str):
+        timings = ImageTimings(str(image_path))
         try:
-            input_path = Path(self.current_image_path)
-            suffix = self.suffix_var.get() or "_nobg"
-            output_path = input_path.parent / f"{input_path.stem}{suffix}.png"
+            input_path = Path(image_path)
+            output_path = build_output_path(input_path, self.suffix_var.get())
 
             # Build options
             options = self._build_processing_options()
 
-            # Process
-            if self.mode_var.get() == "sam3":
-                result = self.sam3_processor.process(
-                    input_path, output_path, options,
-                    lambda msg: self.root.after(0, lambda: self.status_var.set(msg))
-                )
-            else:
-                result = self.rembg_processor.process(
-                    input_path, output_path, options,
-                    lambda msg: self.root.after(0, lambda: self.status_var.set(msg))
-                )
-
-            # Post-process
-            result = self._apply_post_processing(result)
+            with timings.activate():
+                with span("decode"):
+                    image = Image.open(input_path)
+                    image.load()
+
+                # Same decision as bulk runs for inputs that are already cutouts
+                action = cutout_input_action(image, self.skip_processed_var.get(), self.cutout_post_var.get())
+                if action == "skip":
+                    image = None
+                    get_metrics().inc("inputs_skipped")
+                    self.root.after(0, lambda: self._on_process_skipped(input_path))
+                    return
+
+                # Process
+                if action == "post_process":
+                    # Already a cutout: keep its alpha, skip the model
+                    self.root.after(0, lambda: self.status_var.set("Already transparent - post-processing only"))
+                    result = load_frames(image) if is_animated(image) else image.convert("RGBA")
+                elif self.mode_var.get() == "sam3":
+                    image = None
+                    result = self.sam3_processor.process(
+                        input_path, output_path, options,
+                        lambda msg: self.root.after(0, lambda: self.status_var.set(msg))
+                    )
+                elif is_animated(image):
+                    result = self.rembg_processor.process_animation(
+                        image, options,
+                        lambda msg: self.root.after(0, lambda: self.status_var.set(msg))
+                    )
+                else:
+                    result = self.rembg_processor.process_image(
+                        image, options,
+                        lambda msg: self.root.after(0, lambda: self.status_var.set(msg))
+                    )
+                image = None
+
+                bg_choice = self.bg_color_var.get()
+                bg_color = BACKGROUND_OPTIONS.get(bg_choice, (None, None))[1]
+                if isinstance(result, Animation):
+                    # Every frame, saved as an animated PNG
+                    final = post_process_animation(result, self._build_post_options(), bg_color)
+                else:
+                    # Post-process
+                    result = self._apply_post_processing(result)
 
-            # Apply background and save
-            bg_choice = self.bg_color_var.get()
-            bg_color = BACKGROUND_OPTIONS.get(bg_choice, (None, None))[1]
-            final = apply_background_color(result, bg_color)
-            final.save(output_path, "PNG")
+                    # Apply background and save
+                    with span("background"):
+                        final = apply_background_color(result, bg_color)
+                write_output(final, output_path)
 
+            get_metrics().record_image(timings)
+            flush_metrics()
             self.root.after(0, lambda: self._on_process_complete(output_path))
 
         except Exception as e:
+            timings.status = "error"
+            get_metrics().record_image(timings)
             error_msg = str(e) if str(e) else type(e).__name__
             try:
                 import traceback
@@ -842,48 +1084,38 @@ class BackgroundRemoverApp:
                 pass
             self.root.after(0, lambda err=error_msg: self._on_process_error(err))
 
+    @property
+    def _low_memory(self) -> bool:
+        """Low-memory mode: a memory budget is set, so don't hold full-size copies."""
+        return self.config.get("memory_budget_mb", 0) > 0
+
     def _build_processing_options(self) -> dict:
         """Build options dict for processors."""
-        return {
-            "model": self.model_var.get(),
-            "alpha_matting": self.alpha_var.get(),
-            "alpha_matting_foreground_threshold": self.fg_threshold_var.get(),
-            "alpha_matting_background_threshold": self.bg_threshold_var.get(),
-            "alpha_matting_erode_size": self.erode_var.get(),
-            "prompt": self.prompt_var.get().strip(),
-            "keep_subject": self.keep_subject_var.get(),
-            "hf_token": self.config.get("hf_token", ""),
-        }
+        return build_processing_options(self._current_settings())
+
+    def _build_post_options(self) -> dict:
+        """Build options dict for post-processing (see apply_post_processing)."""
+        return build_post_options(self._current_settings())
 
     def _apply_post_processing(self, image: Image.Image) -> Image.Image:
         """Apply post-processing effects (crop, sticker)."""
-        result = image
+        return apply_post_processing(image, self._build_post_options())
 
-        # Auto-crop
-        if self.autocrop_var.get():
-            margin = self.margin_var.get()
-            result = auto_crop_image(result, margin)
-
-        # Sticker mode
-        if self.sticker_var.get():
-            width = self.sticker_width_var.get()
-            color_hex = self.sticker_color_var.get()
-            # Convert hex to RGB
-            color = tuple(int(color_hex.lstrip('#')[i:i+2], 16) for i in (0, 2, 4))
-            result = add_sticker_outline(result, width, color)
-
-        return result
+    def _stop_progress_if_idle(self):
+        if not self.processing and not self.bulk_processing:
+            self.progress.stop()
 
     def _on_process_complete(self, output_path: Path):
         self.processing = False
-        self.progress.stop()
+        self._stop_progress_if_idle()
         self.process_btn.config(state=tk.NORMAL)
         self.status_var.set(f"Saved: {output_path.name}")
 
         # Show result preview
         try:
             result_img = Image.open(output_path)
-            self.last_result_image = result_img.copy()
+            if not self._low_memory:
+                self.last_result_image = result_img.copy()
 
             result_preview = create_checkerboard_preview(
                 result_img,
@@ -896,13 +1128,24 @@ class BackgroundRemoverApp:
         except Exception:
             pass
 
+        self._images_since_memory_check += 1
+        if self._images_since_memory_check >= self.config.get("memory_check_images", 25):
+            self._memory_checkpoint(f"{self._images_since_memory_check} images")
+
         # Flash success
         self.drop_frame.config(highlightbackground="#00ff00")
         self.root.after(1000, lambda: self.drop_frame.config(highlightbackground="#4a9eff"))
 
+    def _on_process_skipped(self, input_path: Path):
+        self.processing = False
+        self._stop_progress_if_idle()
+        self.process_btn.config(state=tk.NORMAL)
+        self.status_var.set(f"Skipped: {input_path.name} is already a cutout "
+                            "(uncheck 'Skip images that are already cutouts' to process it)")
+
     def _on_process_error(self, error: str):
         self.processing = False
-        self.progress.stop()
+        self._stop_progress_if_idle()
         self.process_btn.config(state=tk.NORMAL)
         self.status_var.set(f"Error: {error}")
         self.drop_frame.config(highlightbackground="#ff0000")
@@ -917,98 +1160,248 @@ class BackgroundRemoverApp:
                 self.image_queue = file_paths
                 return
 
-        self.image_queue = file_paths.copy()
-        self.bulk_processing = True
-        self.bulk_total = len(file_paths)
-        self.bulk_completed = 0
-        self.bulk_errors = 0
+        # Settings are taken now; later changes apply to the next drop
+        processor = self.sam3_processor if self.mode_var.get() == "sam3" else self.rembg_processor
+        options = self._build_processing_options()
+        post_options = self._build_post_options()
+        suffix = self.suffix_var.get() or "_nobg"
+        skip_processed = self.skip_processed_var.get()
+        cutout_post_process = self.cutout_post_var.get()
+        sequence_mode = self.sequence_var.get()
+
+        def make_pipeline(job):
+            return BulkPipeline(
+                processor,
+                options,
+                post_options,
+                suffix=suffix,
+                decode_workers=self.config.get("pipeline_decode_workers", 2),
+                post_workers=self.config.get("pipeline_post_workers", 2),
+                write_workers=self.config.get("pipeline_write_workers", 1),
+                queue_size=self.config.get("pipeline_queue_size", 4),
+                inference_batch_size=self.config.get("pipeline_inference_batch", 1),
+                memory_budget_mb=self.config.get("memory_budget_mb", 0),
+                decode_processes=self.config.get("pipeline_decode_processes", 0),
+                shared_slot_mb=self.config.get("pipeline_shared_slot_mb", 64),
+                skip_processed=skip_processed,
+                cutout_post_process=cutout_post_process,
+                sequence_mode=sequence_mode,
+                sequence_keyframe_interval=self.config.get("sequence_keyframe_interval", 8),
+                sequence_max_residual=self.config.get("sequence_max_residual", 0.25),
+                on_item_complete=lambda item: self.root.after(
+                    0, lambda: self._on_bulk_item_complete(item.input_path)
+                ),
+                on_item_error=lambda item: self.root.after(
+                    0, lambda: self._on_bulk_item_error(str(item.input_path), item.error)
+                ),
+                on_item_skipped=lambda item: self.root.after(
+                    0, lambda: self._on_bulk_item_skipped(item.input_path)
+                ),
+                on_item_cancelled=lambda item: self.root.after(0, self._on_bulk_item_cancelled),
+                inference_gate=self.scheduler.wait_for_interactive,
+                profiler=self.bulk_profiler,
+            )
 
-        self.process_btn.config(state=tk.DISABLED)
-        self.status_var.set(f"Bulk processing: 0/{self.bulk_total} images...")
+        if not self.bulk_processing:
+            self.bulk_total = 0
+            self.bulk_completed = 0
+            self.bulk_errors = 0
+            self.bulk_skipped = 0
+            self.bulk_cancelled = 0
+            self.bulk_not_started = 0
+            self.pause_btn.config(state=tk.NORMAL)
+            self.cancel_btn.config(state=tk.NORMAL)
+            if self.profile_var.get():
+                # One profile per bulk session, however many jobs it has;
+                # the Tk thread too (progress callbacks, previews)
+                self.bulk_profiler = RunProfiler(top_n=self.config.get("profile_top_n", 25))
+                self._ui_profile = self.bulk_profiler.start("ui")
+        self.bulk_processing = True
+        self.bulk_jobs += 1
+        self.bulk_total += len(file_paths)
 
         # Hide preview container, show drop label for bulk progress
-        self.preview_container.pack_forget()
-        self.drop_label.config(text=f"Processing {self.bulk_total} images...\n\n0/{self.bulk_total} completed")
-        self.drop_label.pack(expand=True, fill=tk.BOTH)
-
+        if not self.processing:
+            self.preview_container.pack_forget()
+            self.drop_label.pack(expand=True, fill=tk.BOTH)
+        self._update_bulk_progress()
         self.progress.start(10)
-        self._process_next_in_queue()
-
-    def _process_next_in_queue(self):
-        if not self.image_queue:
-            self._on_bulk_complete()
-            return
-
-        if self.processing:
-            self.root.after(100, self._process_next_in_queue)
-            return
-
-        file_path = self.image_queue.pop(0)
-        self.current_image_path = file_path
-
-        self.status_var.set(f"Processing: {Path(file_path).name} ({self.bulk_completed + 1}/{self.bulk_total})")
-        self.drop_label.config(text=f"Processing {self.bulk_total} images...\n\n{self.bulk_completed}/{self.bulk_total} completed")
-
-        self.processing = True
-        thread = threading.Thread(target=self._process_bulk_image_thread, args=(file_path,))
-        thread.daemon = True
-        thread.start()
 
-    def _process_bulk_image_thread(self, file_path: str):
-        try:
-            input_path = Path(file_path)
-            suffix = self.suffix_var.get() or "_nobg"
-            output_path = input_path.parent / f"{input_path.stem}{suffix}.png"
-
-            options = self._build_processing_options()
+        name = Path(file_paths[0]).parent.name or str(Path(file_paths[0]).parent)
+        self.scheduler.submit_bulk(name, file_paths, make_pipeline)
 
-            if self.mode_var.get() == "sam3":
-                result = self.sam3_processor.process(input_path, output_path, options)
-            else:
-                result = self.rembg_processor.process(input_path, output_path, options)
-
-            result = self._apply_post_processing(result)
-
-            bg_choice = self.bg_color_var.get()
-            bg_color = BACKGROUND_OPTIONS.get(bg_choice, (None, None))[1]
-            final = apply_background_color(result, bg_color)
-            final.save(output_path, "PNG")
-
-            self.bulk_completed += 1
-            self.root.after(0, self._on_bulk_item_complete)
-
-        except Exception as e:
-            self.bulk_errors += 1
-            self.bulk_completed += 1
-            self.root.after(0, lambda: self._on_bulk_item_error(file_path, str(e)))
-
-    def _on_bulk_item_complete(self):
-        self.processing = False
-        self.drop_label.config(text=f"Processing {self.bulk_total} images...\n\n{self.bulk_completed}/{self.bulk_total} completed")
-        self._process_next_in_queue()
+    def _update_bulk_progress(self):
+        jobs = f" ({self.bulk_jobs} jobs)" if self.bulk_jobs > 1 else ""
+        verb = "Paused" if self.scheduler.paused else "Processing"
+        self.drop_label.config(
+            text=f"{verb} {self.bulk_total} images{jobs}...\n\n{self.bulk_completed}/{self.bulk_total} completed"
+        )
+        # The single image being processed owns the status line
+        if not self.processing:
+            verb = "Bulk paused" if self.scheduler.paused else "Bulk processing"
+            self.status_var.set(f"{verb}{jobs}: {self.bulk_completed}/{self.bulk_total} images...")
+
+    def _toggle_bulk_pause(self):
+        if self.scheduler.paused:
+            self.scheduler.resume()
+            self.pause_btn.config(text="Pause")
+            self.progress.start(10)
+        else:
+            # Images already past the model are still written
+            self.scheduler.pause()
+            self.pause_btn.config(text="Resume")
+            self._stop_progress_if_idle()
+        self._update_bulk_progress()
+
+    def _cancel_bulk(self):
+        # Drop images not through the model yet; outputs already being
+        # written are finished (never left half-written)
+        self.scheduler.cancel_all(abort=True)
+        if self.scheduler.paused:
+            self.scheduler.resume()
+            self.pause_btn.config(text="Pause")
+        self.pause_btn.config(state=tk.DISABLED)
+        self.cancel_btn.config(state=tk.DISABLED)
+        if not self.processing:
+            self.status_var.set("Cancelling - finishing writes...")
+
+    def _on_bulk_item_complete(self, input_path: Path):
+        self.bulk_completed += 1
+        self.bulk_last_path = str(input_path)
+        self._update_bulk_progress()
+
+    def _on_bulk_item_skipped(self, input_path: Path):
+        self.bulk_skipped += 1
+        self.bulk_completed += 1
+        self._update_bulk_progress()
+
+    def _on_bulk_item_cancelled(self):
+        self.bulk_cancelled += 1
+        self.bulk_completed += 1
+        self._update_bulk_progress()
 
     def _on_bulk_item_error(self, file_path: str, error: str):
-        self.processing = False
-        self._process_next_in_queue()
+        self.bulk_errors += 1
+        self.bulk_completed += 1
+        print(f"[Bulk] Failed: {file_path}: {error}")
+        self._update_bulk_progress()
+
+    def _on_bulk_complete(self, job):
+        self.bulk_jobs -= 1
+        stats = job.stats
+        if stats:
+            print(f"[Bulk] {job.name}: {job.elapsed_seconds:.3f}s, {format_stage_summary(stats)}")
+            for name, sequence in stats.get("sequences", {}).items():
+                print(f"[Sequence] {format_sequence_summary(name, sequence)}")
+        if job.state == CANCELLED:
+            # Images never fed no longer count towards the total
+            self.bulk_total -= job.total - job.position
+            self.bulk_not_started += job.total - job.position
+
+        if self.bulk_jobs > 0:
+            self._update_bulk_progress()
+            return
 
-    def _on_bulk_complete(self):
         self.bulk_processing = False
-        self.processing = False
-        self.progress.stop()
-        self.process_btn.config(state=tk.NORMAL)
-
-        if self.bulk_errors > 0:
-            msg = f"Completed: {self.bulk_completed - self.bulk_errors}/{self.bulk_total} images ({self.bulk_errors} errors)"
+        self.image_queue = []
+        self.pause_btn.config(text="Pause", state=tk.DISABLED)
+        self.cancel_btn.config(state=tk.DISABLED)
+        self._stop_progress_if_idle()
+        profile_path = self._save_bulk_profile()
+        self._memory_checkpoint(f"bulk ({self.bulk_total} images)")
+
+        saved = self.bulk_completed - self.bulk_errors - self.bulk_skipped - self.bulk_cancelled
+        if self.bulk_cancelled or self.bulk_not_started:
+            msg = (f"Cancelled: {saved} saved, {self.bulk_errors} failed, {self.bulk_skipped} skipped, "
+                   f"{self.bulk_cancelled + self.bulk_not_started} not processed")
+        elif self.bulk_errors > 0:
+            msg = f"Completed: {self.bulk_completed - self.bulk_errors - self.bulk_skipped}/{self.bulk_total} images ({self.bulk_errors} errors)"
+        elif self.bulk_skipped > 0:
+            msg = f"Completed: {self.bulk_total - self.bulk_skipped}/{self.bulk_total} images processed"
         else:
             msg = f"Completed: {self.bulk_total} images processed successfully!"
 
-        self.status_var.set(msg)
+        routing = format_routing_summary(job.counters)
+        if routing:
+            msg += f" - {routing}"
+        if profile_path:
+            msg += f" - profile: {profile_path.name}"
+
+        if not self.processing:
+            self.status_var.set(msg)
         self.drop_label.config(text=f"Done!\n\n{msg}\n\nDrop more images to continue")
-        self.current_image_path = None
+
+    def _save_bulk_profile(self) -> Optional[Path]:
+        """
+        Write the finished bulk session's profile next to its outputs.
+
+        Returns:
+            The merged .prof file, or None if the session was not profiled
+        """
+        profiler = self.bulk_profiler
+        if profiler is None:
+            return None
+        self.bulk_profiler = None
+        profiler.stop(self._ui_profile)
+        self._ui_profile = None
+
+        folder = Path(self.bulk_last_path).parent if self.bulk_last_path else Path.cwd()
+        try:
+            written = profiler.save(default_profile_path(folder))
+        except OSError as e:
+            print(f"[Profile] Could not write profile to {folder}: {e}")
+            return None
+        if not written:
+            return None
+        print(f"[Profile] Wrote {', '.join(str(p) for p in written)}")
+        return written[0]
+
+    # Memory tracking
+
+    def _start_memory_tracking(self):
+        self.memory_tracker = MemoryTracker(
+            top_n=self.config.get("memory_top_n", 10),
+            recycle_mb=self.config.get("memory_recycle_mb", 0),
+            on_recycle=self._recycle_sessions,
+            log_path=self.config.get("memory_log") or None,
+        )
+        self.memory_tracker.start()
+        self._images_since_memory_check = 0
+
+    def _on_memory_tracking_change(self):
+        if self.memory_tracking_var.get():
+            if self.memory_tracker is None:
+                self._start_memory_tracking()
+        elif self.memory_tracker is not None:
+            self.memory_tracker.stop()
+            self.memory_tracker = None
+        self._save_current_config()
+
+    def _memory_checkpoint(self, label: str):
+        """Record memory growth since the last batch (off the Tk thread: snapshots take a moment)."""
+        self._images_since_memory_check = 0
+        tracker = self.memory_tracker
+        if tracker is not None:
+            threading.Thread(target=tracker.checkpoint, args=(label,), daemon=True).start()
+
+    def _recycle_sessions(self):
+        """
+        Drop the model sessions and the kept result image once memory has
+        grown past memory_recycle_mb (runs on the checkpoint thread).
+
+        Returns:
+            False while an image is being processed (retried at the next batch)
+        """
+        if self.processing or self.scheduler.bulk_busy or self.scheduler.interactive_busy:
+            return False
+        self.rembg_processor.clear_session()
+        self.last_result_image = None
+        return True
 
     def _open_output_folder(self):
-        if self.current_image_path:
-            folder = Path(self.current_image_path).parent
+        path = self.current_image_path or self.bulk_last_path
+        if path:
+            folder = Path(path).parent
         else:
             folder = Path.cwd()
 
@@ -1019,8 +1412,12 @@ class BackgroundRemoverApp:
         else:
             os.system(f'xdg-open "{folder}"')
 
-    def _save_current_config(self):
-        self.config.update({
+    def _current_settings(self) -> dict:
+        """The saved settings with the values currently in the widgets."""
+        return dict(self.config, **self._widget_settings())
+
+    def _widget_settings(self) -> dict:
+        return {
             "model": self.model_var.get(),
             "suffix": self.suffix_var.get(),
             "background": self.bg_color_var.get(),
@@ -1028,6 +1425,16 @@ class BackgroundRemoverApp:
             "alpha_matting_fg_threshold": self.fg_threshold_var.get(),
             "alpha_matting_bg_threshold": self.bg_threshold_var.get(),
             "alpha_matting_erode_size": self.erode_var.get(),
+            "alpha_matting_method": self.matting_method_var.get(),
+            "cascade": self.cascade_var.get(),
+            "fast_path": self.fast_path_var.get(),
+            "dedup": self.dedup_var.get(),
+            "roi": self.roi_var.get(),
+            "skip_processed": self.skip_processed_var.get(),
+            "cutout_post_process": self.cutout_post_var.get(),
+            "sequence_mode": self.sequence_var.get(),
+            "profile_runs": self.profile_var.get(),
+            "memory_tracking": self.memory_tracking_var.get(),
             "use_sam3": self.mode_var.get() == "sam3",
             "sam3_prompt": self.prompt_var.get(),
             "sam3_keep_subject": self.keep_subject_var.get(),
@@ -1036,12 +1443,37 @@ class BackgroundRemoverApp:
             "sticker_mode": self.sticker_var.get(),
             "sticker_color": self.sticker_color_var.get(),
             "sticker_width": self.sticker_width_var.get(),
-        })
+        }
+
+    def _save_current_config(self):
+        self.config.update(self._widget_settings())
         save_config(self.config)
 
     def _on_close(self):
         self._save_current_config()
-        self.root.destroy()
+        if self.memory_tracker is not None:
+            self.memory_tracker.stop()
+        busy = self.scheduler.bulk_busy or self.scheduler.interactive_busy
+        # Stop taking new work; images already past the model are written
+        # so no output is left half-done
+        self.scheduler.shutdown(abort=True)
+        if self.scheduler.paused:
+            self.scheduler.resume()
+        if busy:
+            self.status_var.set("Finishing writes...")
+            self.pause_btn.config(state=tk.DISABLED)
+            self.cancel_btn.config(state=tk.DISABLED)
+            self._close_when_idle(time.monotonic() + CLOSE_TIMEOUT_SECONDS)
+        else:
+            flush_metrics()
+            self.root.destroy()
+
+    def _close_when_idle(self, deadline: float):
+        if self.scheduler.wait_idle(timeout=0) or time.monotonic() >= deadline:
+            flush_metrics()
+            self.root.destroy()
+        else:
+            self.root.after(100, lambda: self._close_when_idle(deadline))
 
     def run(self):
         self.root.mainloop()
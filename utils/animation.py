@@ -0,0 +1,149 @@
+"""
+Animated images - GIF, APNG and animated WebP in, animated PNG out.
+
+Frames are decoded fully composited (PIL applies each format's disposal
+and blending), so every frame is a complete RGBA image. Frames are
+compared with the last keyframe on a small grayscale copy; while the mean
+difference stays below a threshold the keyframe's mask is reused, so the
+model only runs when the picture has actually changed. Outputs are saved
+as APNG, which keeps full alpha (GIF only has 1-bit transparency).
+"""
+
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import numpy as np
+from PIL import Image, PngImagePlugin
+
+try:
+    from core.metrics import span
+    from utils.image import add_sticker_outline, apply_background_color, hex_to_rgb
+except ImportError:
+    from ..core.metrics import span
+    from .image import add_sticker_outline, apply_background_color, hex_to_rgb
+
+
+# Mean absolute difference (0-1) from the last keyframe above which a frame
+# gets its own inference
+KEYFRAME_THRESHOLD = 0.02
+
+# Keyframes sent to the model per call (bounds the batched input size)
+KEYFRAME_BATCH = 4
+
+# Frames are compared at this size (longest side)
+COMPARE_SIZE = 128
+
+# Frame duration when the file does not give one (ms)
+DEFAULT_DURATION = 100
+
+
+class Animation:
+    """Frames of an animated image with their timing."""
+
+    def __init__(self, frames: List[Image.Image], durations: List[int], loop: int = 0):
+        """
+        Args:
+            frames: Frames, all the same size
+            durations: Display time of each frame in ms
+            loop: Number of loops (0 = forever)
+        """
+        self.frames = frames
+        self.durations = durations
+        self.loop = loop
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        return self.frames[0].size
+
+    def with_frames(self, frames: List[Image.Image]) -> "Animation":
+        """Same timing, new frames."""
+        return Animation(frames, self.durations, self.loop)
+
+
+def is_animated(image: Image.Image) -> bool:
+    """Whether an opened image has more than one frame."""
+    return getattr(image, "is_animated", False) and getattr(image, "n_frames", 1) > 1
+
+
+def load_frames(image: Image.Image) -> Animation:
+    """Decode every frame of an animated image as composited RGBA."""
+    frames, durations = [], []
+    with span("decode"):
+        for index in range(image.n_frames):
+            image.seek(index)
+            frames.append(image.convert("RGBA"))
+            durations.append(int(image.info.get("duration") or DEFAULT_DURATION))
+        image.seek(0)
+    return Animation(frames, durations, int(image.info.get("loop", 0)))
+
+
+def _thumbnail(frame: Image.Image) -> np.ndarray:
+    small = frame.convert("L")
+    small.thumbnail((COMPARE_SIZE, COMPARE_SIZE), Image.Resampling.BILINEAR)
+    return np.asarray(small, dtype=np.float32) / 255.0
+
+
+def select_keyframes(frames: List[Image.Image], threshold: float = KEYFRAME_THRESHOLD) -> List[int]:
+    """
+    Pick the frames that need inference.
+
+    Returns:
+        For each frame, the index of the keyframe whose mask it uses
+        (a keyframe maps to itself)
+    """
+    keys = []
+    key_index, key_thumb = -1, None
+    for index, frame in enumerate(frames):
+        thumb = _thumbnail(frame)
+        if key_thumb is None or float(np.abs(thumb - key_thumb).mean()) > threshold:
+            key_index, key_thumb = index, thumb
+        keys.append(key_index)
+    return keys
+
+
+def post_process_animation(animation: Animation, options: dict, bg_color: Optional[tuple]) -> Animation:
+    """
+    Apply post-processing (see apply_post_processing) and a background to
+    every frame. Auto-crop uses one box around the subject in all frames,
+    so the frames stay the same size.
+    """
+    frames = animation.frames
+
+    if options.get("auto_crop", False):
+        with span("auto_crop"):
+            boxes = [box for box in (frame.getchannel("A").getbbox() for frame in frames) if box]
+            if boxes:
+                margin = options.get("auto_crop_margin", 10)
+                width, height = animation.size
+                box = (
+                    max(0, min(b[0] for b in boxes) - margin),
+                    max(0, min(b[1] for b in boxes) - margin),
+                    min(width, max(b[2] for b in boxes) + margin),
+                    min(height, max(b[3] for b in boxes) + margin),
+                )
+                frames = [frame.crop(box) for frame in frames]
+
+    if options.get("sticker_mode", False):
+        color = hex_to_rgb(options.get("sticker_color", "#ffffff"))
+        with span("sticker"):
+            frames = [add_sticker_outline(frame, options.get("sticker_width", 5), color) for frame in frames]
+
+    with span("background"):
+        frames = [apply_background_color(frame, bg_color) for frame in frames]
+    return animation.with_frames(frames)
+
+
+def save_animation(animation: Animation, output_path: Path) -> None:
+    """Save as an animated PNG; each frame replaces the previous one."""
+    first, rest = animation.frames[0], animation.frames[1:]
+    with span("write"):
+        first.save(
+            output_path,
+            "PNG",
+            save_all=True,
+            append_images=rest,
+            duration=animation.durations,
+            loop=animation.loop,
+            disposal=PngImagePlugin.Disposal.OP_BACKGROUND,
+            blend=PngImagePlugin.Blend.OP_SOURCE,
+        )
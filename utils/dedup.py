@@ -0,0 +1,213 @@
+"""
+Near-duplicate detection - reuse a mask across visually identical frames.
+
+Product shoots contain runs of near-identical frames (exposure bracketing,
+retakes from a tripod). Each image gets a fingerprint: a 64-bit DCT
+perceptual hash plus a small, contrast-normalized grayscale copy. Images
+whose hashes are within a few bits of an earlier representative are
+aligned to it by phase correlation. If the aligned copies agree (the
+verification residual is small), the representative's mask is scaled and
+shifted onto the new image instead of running the model again.
+
+Normalizing the grayscale copy to zero mean and unit variance makes the
+check insensitive to exposure changes, so bracketed frames still match.
+"""
+
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+
+# Hash input size and the low-frequency block kept from its DCT
+HASH_SIZE = 32
+HASH_BLOCK = 8
+
+# Alignment and verification run at this size (longest side)
+ALIGN_SIZE = 512
+
+# Largest hash distance (bits out of 64) for two images to be compared
+MAX_HASH_DISTANCE = 6
+
+# Largest mean absolute difference after alignment, in standard deviations
+MAX_RESIDUAL = 0.15
+
+# Representatives kept per index (oldest dropped first); each holds its masks
+MAX_ENTRIES = 8
+
+
+def _dct_matrix(n: int) -> np.ndarray:
+    """Orthonormal DCT-II matrix."""
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    matrix = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    matrix[0] /= np.sqrt(2.0)
+    return matrix
+
+
+_DCT = _dct_matrix(HASH_SIZE)
+
+
+def perceptual_hash(gray: Image.Image) -> int:
+    """64-bit DCT perceptual hash of an "L" image."""
+    pixels = np.asarray(gray.resize((HASH_SIZE, HASH_SIZE), Image.Resampling.BILINEAR), dtype=np.float64)
+    coefficients = (_DCT @ pixels @ _DCT.T)[:HASH_BLOCK, :HASH_BLOCK].ravel()
+    # The DC term only measures overall brightness
+    bits = coefficients[1:] > np.median(coefficients[1:])
+    return int("".join("1" if b else "0" for b in bits), 2)
+
+
+def hash_distance(a: int, b: int) -> int:
+    """Number of differing bits between two hashes."""
+    return bin(a ^ b).count("1")
+
+
+class Fingerprint:
+    """What is kept of an image to find and verify its duplicates."""
+
+    def __init__(self, image: Image.Image):
+        self.size = image.size
+        gray = image.convert("L")
+        self.hash = perceptual_hash(gray)
+
+        scale = min(1.0, ALIGN_SIZE / max(gray.size))
+        small_size = (max(1, round(gray.width * scale)), max(1, round(gray.height * scale)))
+        small = np.asarray(gray.resize(small_size, Image.Resampling.BILINEAR), dtype=np.float32)
+        self.small = (small - small.mean()) / (small.std() + 1e-6)
+
+    def same_frame(self, other: "Fingerprint") -> bool:
+        """Same aspect ratio and alignment size (so the small copies line up)."""
+        return self.small.shape == other.small.shape
+
+
+def phase_correlation(reference: np.ndarray, moved: np.ndarray) -> Tuple[float, float]:
+    """
+    Estimate the (dx, dy) translation of `moved` relative to `reference`,
+    with a parabolic sub-pixel refinement of the correlation peak.
+    """
+    cross = np.fft.rfft2(moved) * np.conj(np.fft.rfft2(reference))
+    cross /= np.abs(cross) + 1e-9
+    surface = np.fft.irfft2(cross, s=reference.shape)
+    h, w = surface.shape
+    py, px = np.unravel_index(np.argmax(surface), surface.shape)
+
+    def refine(minus: float, center: float, plus: float) -> float:
+        denominator = minus - 2 * center + plus
+        return 0.0 if denominator == 0 else 0.5 * (minus - plus) / denominator
+
+    dy = py + refine(surface[(py - 1) % h, px], surface[py, px], surface[(py + 1) % h, px])
+    dx = px + refine(surface[py, (px - 1) % w], surface[py, px], surface[py, (px + 1) % w])
+    # Shifts past the middle wrap around to negative
+    if dy > h / 2:
+        dy -= h
+    if dx > w / 2:
+        dx -= w
+    return float(dx), float(dy)
+
+
+def alignment_residual(
+    reference: np.ndarray,
+    moved: np.ndarray,
+    dx: int,
+    dy: int,
+    weight: Optional[np.ndarray] = None
+) -> float:
+    """
+    Mean absolute difference over the overlap after shifting reference by
+    (dx, dy), optionally weighted per reference pixel.
+    """
+    h, w = reference.shape
+    if abs(dx) >= w // 2 or abs(dy) >= h // 2:
+        return float("inf")
+    rows, cols = slice(max(0, -dy), h - max(0, dy)), slice(max(0, -dx), w - max(0, dx))
+    difference = np.abs(reference[rows, cols] - moved[max(0, dy):h - max(0, -dy), max(0, dx):w - max(0, -dx)])
+    if weight is None:
+        return float(difference.mean())
+    weight = weight[rows, cols]
+    total = float(weight.sum())
+    return float((difference * weight).sum() / total) if total > 0 else float("inf")
+
+
+def align_masks(masks: List[Image.Image], size: Tuple[int, int], dx: float, dy: float) -> List[Image.Image]:
+    """Scale masks to size and shift them by (dx, dy) pixels (uncovered area is background)."""
+    aligned = []
+    for mask in masks:
+        if mask.size != size:
+            mask = mask.resize(size, Image.Resampling.BILINEAR)
+        if abs(dx) >= 0.5 or abs(dy) >= 0.5:
+            mask = mask.transform(size, Image.Transform.AFFINE, (1, 0, -dx, 0, 1, -dy),
+                                  resample=Image.Resampling.BILINEAR)
+        aligned.append(mask)
+    return aligned
+
+
+class DuplicateIndex:
+    """
+    Recent representative images and their masks.
+
+    Thread-safe; the model itself runs outside the index.
+    """
+
+    def __init__(
+        self,
+        max_distance: int = MAX_HASH_DISTANCE,
+        max_residual: float = MAX_RESIDUAL,
+        max_entries: int = MAX_ENTRIES
+    ):
+        """
+        Args:
+            max_distance: Largest hash distance (bits) for a candidate match
+            max_residual: Largest verification residual after alignment
+            max_entries: Representatives kept (least recently used dropped first)
+        """
+        self.max_distance = max_distance
+        self.max_residual = max_residual
+        self.max_entries = max(1, max_entries)
+        self._entries: "OrderedDict[int, Tuple[Fingerprint, List[Image.Image]]]" = OrderedDict()
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def similar(self, a: Fingerprint, b: Fingerprint) -> bool:
+        """Whether two images look like near-duplicates (hash only, no verification)."""
+        return a.same_frame(b) and hash_distance(a.hash, b.hash) <= self.max_distance
+
+    def reuse(self, fingerprint: Fingerprint) -> Optional[List[Image.Image]]:
+        """
+        Masks of a verified near-duplicate, aligned to this image.
+
+        Returns:
+            Mask list at the image size, or None when no representative matches
+        """
+        with self._lock:
+            candidates = sorted(
+                (hash_distance(fingerprint.hash, entry.hash), key)
+                for key, (entry, _) in self._entries.items()
+                if self.similar(fingerprint, entry)
+            )
+            candidates = [(key, self._entries[key]) for _, key in candidates]
+
+        for key, (entry, masks) in candidates:
+            dx, dy = phase_correlation(entry.small, fingerprint.small)
+            residual = alignment_residual(entry.small, fingerprint.small, round(dx), round(dy))
+            if residual > self.max_residual:
+                continue
+            with self._lock:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+            scale = fingerprint.size[0] / fingerprint.small.shape[1]
+            return align_masks(masks, fingerprint.size, dx * scale, dy * scale)
+        return None
+
+    def add(self, fingerprint: Fingerprint, masks: List[Image.Image]) -> None:
+        """Record an image whose masks came from the model."""
+        with self._lock:
+            self._entries[self._next_id] = (fingerprint, masks)
+            self._next_id += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
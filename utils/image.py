@@ -6,6 +6,48 @@ import numpy as np
 from PIL import Image, ImageDraw, ImageFilter
 from typing import Tuple, Optional
 
+try:
+    from core.metrics import span
+except ImportError:
+    from ..core.metrics import span
+
+
+def subject_bbox(
+    alpha: np.ndarray,
+    margin: int = 0,
+    threshold: int = 0
+) -> Optional[Tuple[int, int, int, int]]:
+    """
+    Bounding box of the pixels of an alpha channel or mask above a threshold.
+
+    Args:
+        alpha: 2D uint8 array (alpha channel or "L" mask)
+        margin: Pixels of padding around the subject (clipped to the image)
+        threshold: Values above this count as subject
+
+    Returns:
+        (left, top, right, bottom) box for Image.crop, or None if nothing
+        is above the threshold
+    """
+    rows = np.any(alpha > threshold, axis=1)
+    cols = np.any(alpha > threshold, axis=0)
+
+    if not np.any(rows) or not np.any(cols):
+        return None
+
+    row_indices = np.where(rows)[0]
+    col_indices = np.where(cols)[0]
+    top, bottom = row_indices[0], row_indices[-1]
+    left, right = col_indices[0], col_indices[-1]
+
+    height, width = alpha.shape
+    return (
+        int(max(0, left - margin)),
+        int(max(0, top - margin)),
+        int(min(width - 1, right + margin)) + 1,
+        int(min(height - 1, bottom + margin)) + 1,
+    )
+
 
 def auto_crop_image(image: Image.Image, margin: int = 10) -> Image.Image:
     """
@@ -22,33 +64,12 @@ def auto_crop_image(image: Image.Image, margin: int = 10) -> Image.Image:
     if image.mode != "RGBA":
         image = image.convert("RGBA")
 
-    # Get alpha channel
-    alpha = np.array(image)[:, :, 3]
-
-    # Find non-transparent pixels
-    rows = np.any(alpha > 0, axis=1)
-    cols = np.any(alpha > 0, axis=0)
-
-    if not np.any(rows) or not np.any(cols):
+    box = subject_bbox(np.array(image.getchannel("A")), margin)
+    if box is None:
         # No visible pixels, return original
         return image
 
-    # Get bounding box
-    row_indices = np.where(rows)[0]
-    col_indices = np.where(cols)[0]
-    top, bottom = row_indices[0], row_indices[-1]
-    left, right = col_indices[0], col_indices[-1]
-
-    # Add margin
-    top = max(0, top - margin)
-    left = max(0, left - margin)
-    bottom = min(image.height - 1, bottom + margin)
-    right = min(image.width - 1, right + margin)
-
-    # Crop
-    cropped = image.crop((left, top, right + 1, bottom + 1))
-
-    return cropped
+    return image.crop(box)
 
 
 def add_sticker_outline(
@@ -132,9 +153,11 @@ def create_checkerboard_preview(
     Returns:
         RGB PIL Image with checkerboard behind transparent areas
     """
-    # Create thumbnail
-    preview = image.copy()
-    preview.thumbnail(max_size, Image.Resampling.LANCZOS)
+    # Create thumbnail - resize straight to the preview size rather than
+    # copying the full image first (thumbnail() works in place)
+    scale = min(max_size[0] / image.width, max_size[1] / image.height, 1.0)
+    size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+    preview = image.resize(size, Image.Resampling.LANCZOS, reducing_gap=3.0)
 
     # For transparent images, add a checkerboard background
     if preview.mode == "RGBA":
@@ -175,3 +198,39 @@ def apply_background_color(
         return composite.convert("RGB")
     else:
         return image
+
+
+def hex_to_rgb(color_hex: str) -> Tuple[int, int, int]:
+    """Convert a '#rrggbb' color string to an RGB tuple."""
+    color_hex = color_hex.lstrip('#')
+    return tuple(int(color_hex[i:i+2], 16) for i in (0, 2, 4))
+
+
+def apply_post_processing(image: Image.Image, options: dict) -> Image.Image:
+    """
+    Apply post-processing effects (crop, sticker) described by an options dict.
+
+    Options:
+        auto_crop: bool - crop to the subject bounding box
+        auto_crop_margin: int - margin around the subject in pixels
+        sticker_mode: bool - add a colored outline
+        sticker_width: int - outline width in pixels
+        sticker_color: str - outline color as '#rrggbb'
+
+    Returns:
+        Post-processed PIL Image
+    """
+    result = image
+
+    # Auto-crop
+    if options.get("auto_crop", False):
+        with span("auto_crop"):
+            result = auto_crop_image(result, options.get("auto_crop_margin", 10))
+
+    # Sticker mode
+    if options.get("sticker_mode", False):
+        color = hex_to_rgb(options.get("sticker_color", "#ffffff"))
+        with span("sticker"):
+            result = add_sticker_outline(result, options.get("sticker_width", 5), color)
+
+    return result
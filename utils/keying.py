@@ -0,0 +1,197 @@
+"""
+Solid-background keying - a model-free mask for studio shots.
+
+Product and catalog photos on seamless white, grey or green paper don't need
+a neural network: the frame border is (nearly) one color, and the subject is
+everything that differs from it. Detection looks only at border pixels of a
+small copy of the image. The mask is a vectorized color key against that
+color, restricted to the background region connected to the border (a flood
+fill, so a white shirt on white paper is kept), with a distance ramp and a
+light blur for soft edges.
+
+Anything that does not look clean - a busy border, a nearly empty or full
+mask, a wide uncertain edge - returns None so the caller can use the model.
+"""
+
+from typing import Optional, Tuple
+
+import numpy as np
+from PIL import Image, ImageFilter
+
+try:
+    from utils.mask import is_confident
+except ImportError:
+    from .mask import is_confident
+
+
+# Detection and flood fill run at this size (longest side)
+ANALYSIS_SIZE = 512
+
+# Border band width as a fraction of the shorter side
+BORDER_FRACTION = 0.03
+
+# RGB distance within which a pixel matches the background color
+KEY_TOLERANCE = 30.0
+
+# Share of a border side's pixels that must match the background color
+MIN_BORDER_COVERAGE = 0.97
+
+# Width of the alpha ramp above the tolerance (RGB distance)
+SOFT_EDGE = 24.0
+
+# Largest uncertain-pixel fraction a keyed mask may have (see utils.mask)
+MAX_UNCERTAIN_FRACTION = 0.02
+
+
+def _analysis_array(image: Image.Image) -> np.ndarray:
+    """RGB float32 array with its longest side at most ANALYSIS_SIZE."""
+    small = image.convert("RGB")
+    scale = ANALYSIS_SIZE / max(small.size)
+    if scale < 1:
+        size = (max(1, round(small.width * scale)), max(1, round(small.height * scale)))
+        small = small.resize(size, Image.Resampling.BILINEAR, reducing_gap=2.0)
+    return np.asarray(small, dtype=np.float32)
+
+
+def detect_solid_background(
+    image: Image.Image,
+    tolerance: float = KEY_TOLERANCE,
+    min_coverage: float = MIN_BORDER_COVERAGE
+) -> Optional[Tuple[int, int, int]]:
+    """
+    Check whether an image sits on a near-uniform background.
+
+    Args:
+        image: Input image
+        tolerance: RGB distance within which a border pixel counts as background
+        min_coverage: Share of border pixels that must be within tolerance,
+            on at least three of the four sides
+
+    Returns:
+        The background color as an RGB tuple, or None
+    """
+    rgb = _analysis_array(image)
+    h, w = rgb.shape[:2]
+    band = max(2, round(min(h, w) * BORDER_FRACTION))
+    if min(h, w) <= band * 4:
+        return None
+
+    sides = [
+        rgb[:band].reshape(-1, 3),
+        rgb[-band:].reshape(-1, 3),
+        rgb[:, :band].reshape(-1, 3),
+        rgb[:, -band:].reshape(-1, 3),
+    ]
+    color = np.median(np.concatenate(sides), axis=0)
+    coverage = [
+        (np.sqrt(((side - color) ** 2).sum(axis=1)) <= tolerance).mean()
+        for side in sides
+    ]
+    # The subject may run off one edge (a model cropped at the waist, a
+    # product standing on the bottom of the frame) but not more
+    if sorted(coverage)[1] < min_coverage:
+        return None
+    return tuple(int(round(c)) for c in color)
+
+
+def _connected_to_border(candidate: np.ndarray) -> np.ndarray:
+    """Pixels of a boolean mask connected (4-neighbour) to the image border."""
+    try:
+        from scipy import ndimage
+    except ImportError:
+        ndimage = None
+
+    if ndimage is not None:
+        labels, _ = ndimage.label(candidate)
+        edge = np.concatenate([labels[0], labels[-1], labels[:, 0], labels[:, -1]])
+        edge = np.unique(edge[edge > 0])
+        return np.isin(labels, edge)
+
+    # Geodesic dilation from the border until nothing changes
+    region = np.zeros_like(candidate)
+    region[0], region[-1] = candidate[0], candidate[-1]
+    region[:, 0], region[:, -1] = candidate[:, 0], candidate[:, -1]
+    while True:
+        grown = region.copy()
+        grown[1:] |= region[:-1]
+        grown[:-1] |= region[1:]
+        grown[:, 1:] |= region[:, :-1]
+        grown[:, :-1] |= region[:, 1:]
+        grown &= candidate
+        if np.array_equal(grown, region):
+            return region
+        region = grown
+
+
+def _key_distance(image: Image.Image, color: Tuple[int, int, int]) -> np.ndarray:
+    """Per-pixel RGB distance from color, as float32 (one channel at a time to limit memory)."""
+    rgb = np.asarray(image.convert("RGB"))
+    squared = np.zeros(rgb.shape[:2], dtype=np.int32)
+    for channel, value in enumerate(color):
+        diff = rgb[..., channel].astype(np.int16) - value
+        squared += diff.astype(np.int32) ** 2
+    return np.sqrt(squared, dtype=np.float32)
+
+
+def solid_background_mask(
+    image: Image.Image,
+    color: Tuple[int, int, int],
+    tolerance: float = KEY_TOLERANCE,
+    soft_edge: float = SOFT_EDGE
+) -> Image.Image:
+    """
+    Key out a solid background color.
+
+    Only background-colored pixels connected to the border are removed;
+    the alpha ramps from 0 at `tolerance` to 255 at `tolerance + soft_edge`.
+
+    Args:
+        image: Input image
+        color: Background RGB color (see detect_solid_background)
+        tolerance: RGB distance keyed out fully
+        soft_edge: Width of the alpha ramp above the tolerance
+
+    Returns:
+        "L" mode mask at the image size (255 = subject)
+    """
+    # Connectivity at analysis size, then grown by one pixel so the
+    # upscaled region covers the whole edge band
+    small = _analysis_array(image)
+    small_distance = np.sqrt(((small - np.asarray(color, dtype=np.float32)) ** 2).sum(axis=2))
+    region = _connected_to_border(small_distance < tolerance + soft_edge)
+    grown = region.copy()
+    grown[1:] |= region[:-1]
+    grown[:-1] |= region[1:]
+    grown[:, 1:] |= region[:, :-1]
+    grown[:, :-1] |= region[:, 1:]
+    region_image = Image.fromarray(grown.astype(np.uint8) * 255, mode="L")
+    background = np.asarray(region_image.resize(image.size, Image.Resampling.NEAREST)) > 0
+
+    distance = _key_distance(image, color)
+    alpha = np.clip((distance - tolerance) * (255.0 / soft_edge), 0, 255)
+    alpha[~background] = 255
+    mask = Image.fromarray(alpha.astype(np.uint8), mode="L")
+
+    # Hide the stair steps of the upscaled region along the edge
+    radius = max(0.5, min(image.size) / 1500)
+    return mask.filter(ImageFilter.GaussianBlur(radius))
+
+
+def key_solid_background(
+    image: Image.Image,
+    tolerance: float = KEY_TOLERANCE,
+    max_uncertain_fraction: float = MAX_UNCERTAIN_FRACTION
+) -> Optional[Image.Image]:
+    """
+    Mask an image without a model if it is a clean solid-background shot.
+
+    Returns:
+        "L" mode mask, or None when the image should go to the model
+    """
+    color = detect_solid_background(image, tolerance)
+    if color is None:
+        return None
+    mask = solid_background_mask(image, color, tolerance)
+    if not is_confident(mask, max_uncertain_fraction=max_uncertain_fraction):
+        return None
+    return mask
@@ -0,0 +1,105 @@
+"""
+Mask analysis utilities - confidence scoring for predicted masks and
+detection of inputs that are already cutouts.
+"""
+
+from typing import Union
+
+import numpy as np
+from PIL import Image
+
+
+# Alpha values strictly between these count as uncertain (0-255 scale)
+UNCERTAIN_LOW = 16
+UNCERTAIN_HIGH = 240
+
+# Masks are scored at this size (longest side) - enough to judge the edge band
+SCORE_SIZE = 256
+
+
+def _small_mask(mask: Union[Image.Image, np.ndarray]) -> np.ndarray:
+    """Mask as a uint8 array with its longest side at most SCORE_SIZE."""
+    if isinstance(mask, np.ndarray):
+        mask = Image.fromarray(mask.astype(np.uint8, copy=False), mode="L")
+    mask = mask.convert("L")
+    scale = SCORE_SIZE / max(mask.size)
+    if scale < 1:
+        size = (max(1, round(mask.width * scale)), max(1, round(mask.height * scale)))
+        mask = mask.resize(size, Image.Resampling.BILINEAR)
+    return np.asarray(mask)
+
+
+def mask_confidence(mask: Union[Image.Image, np.ndarray]) -> dict:
+    """
+    Estimate how sure a model was about a mask.
+
+    Args:
+        mask: "L" mode mask or uint8 array (0 = background, 255 = foreground)
+
+    Returns:
+        Dict with:
+            uncertain_fraction: share of pixels that are neither clearly
+                foreground nor clearly background
+            edge_entropy: mean binary entropy (bits) of alpha over the
+                uncertain pixels - 1.0 means the model guessed 50/50
+            foreground_fraction: share of pixels that are foreground
+    """
+    alpha = _small_mask(mask)
+    uncertain = (alpha > UNCERTAIN_LOW) & (alpha < UNCERTAIN_HIGH)
+    uncertain_fraction = float(uncertain.mean())
+
+    edge_entropy = 0.0
+    if uncertain.any():
+        p = alpha[uncertain].astype(np.float64) / 255.0
+        edge_entropy = float(np.mean(-(p * np.log2(p) + (1 - p) * np.log2(1 - p))))
+
+    return {
+        "uncertain_fraction": uncertain_fraction,
+        "edge_entropy": edge_entropy,
+        "foreground_fraction": float((alpha >= 128).mean()),
+    }
+
+
+def is_confident(
+    mask: Union[Image.Image, np.ndarray],
+    max_uncertain_fraction: float = 0.03,
+    max_edge_entropy: float = 0.85
+) -> bool:
+    """
+    Whether a mask looks reliable enough to keep.
+
+    A mask is rejected when too many pixels are uncertain, when its soft
+    edge is mostly coin flips, or when it is (nearly) empty or full -
+    a fast model that finds no subject usually missed it.
+    """
+    score = mask_confidence(mask)
+    if not 0.005 <= score["foreground_fraction"] <= 0.98:
+        return False
+    if score["uncertain_fraction"] > max_uncertain_fraction:
+        return False
+    # A thin edge band is always soft; only judge entropy when there is a band
+    if score["uncertain_fraction"] > 0.002 and score["edge_entropy"] > max_edge_entropy:
+        return False
+    return True
+
+
+def has_cutout_alpha(image: Image.Image, min_transparent_fraction: float = 0.01) -> bool:
+    """
+    Whether an image already has a meaningful alpha channel (is a cutout).
+
+    A fully opaque alpha channel - common in PNGs saved from editors - does
+    not count; neither does an image that is (almost) entirely transparent.
+
+    Args:
+        image: Decoded image
+        min_transparent_fraction: Share of pixels that must be transparent
+    """
+    if image.mode not in ("RGBA", "LA", "PA") and not (
+        image.mode == "P" and "transparency" in image.info
+    ):
+        return False
+    if image.mode == "P":
+        image = image.convert("RGBA")
+    alpha = _small_mask(image.getchannel("A"))
+    transparent = float((alpha <= UNCERTAIN_LOW).mean())
+    return min_transparent_fraction <= transparent < 0.995
@@ -0,0 +1,261 @@
+"""
+Process memory utilities - RSS measurement, memory budget and buffer reuse.
+"""
+
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+def get_rss_bytes() -> Optional[int]:
+    """
+    Get the current resident set size of this process.
+
+    Returns:
+        RSS in bytes, or None if it cannot be determined
+    """
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+
+    # Linux fallback without psutil
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def get_peak_rss_bytes() -> Optional[int]:
+    """
+    Get the peak resident set size of this process since it started.
+
+    Returns:
+        Peak RSS in bytes, or None if it cannot be determined
+    """
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in bytes on macOS, kilobytes on Linux
+        return peak if sys.platform == 'darwin' else peak * 1024
+    except ImportError:
+        pass
+
+    # Windows: peak working set via psutil
+    try:
+        import psutil
+        return getattr(psutil.Process().memory_info(), "peak_wset", None)
+    except ImportError:
+        return None
+
+
+def get_memory_breakdown() -> Dict[str, Optional[int]]:
+    """
+    Split this process's memory into what it holds alone and what it shares
+    with other processes (e.g. memory-mapped model weights).
+
+    Returns:
+        Dict of "rss_bytes", "pss_bytes" (proportional set size: shared
+        pages divided among the processes using them), "shared_bytes" and
+        "private_bytes". Only RSS is known outside Linux; the rest is None.
+    """
+    breakdown = {"rss_bytes": None, "pss_bytes": None, "shared_bytes": None, "private_bytes": None}
+    fields = {}
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 3 and parts[2] == "kB":
+                    fields[parts[0].rstrip(":")] = int(parts[1]) * 1024
+    except (OSError, ValueError):
+        pass
+
+    if "Rss" in fields:
+        breakdown["rss_bytes"] = fields["Rss"]
+        breakdown["pss_bytes"] = fields.get("Pss")
+        breakdown["shared_bytes"] = fields.get("Shared_Clean", 0) + fields.get("Shared_Dirty", 0)
+        breakdown["private_bytes"] = fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0)
+    else:
+        breakdown["rss_bytes"] = get_rss_bytes()
+    return breakdown
+
+
+def format_memory_breakdown(breakdown: Dict[str, Optional[int]]) -> str:
+    """One-line summary of get_memory_breakdown(), in MB."""
+    mb = lambda key: (breakdown.get(key) or 0) / (1024 * 1024)
+    if breakdown.get("pss_bytes") is None:
+        return f"RSS {mb('rss_bytes'):.0f} MB"
+    return (f"RSS {mb('rss_bytes'):.0f} MB (private {mb('private_bytes'):.0f} MB, "
+            f"shared {mb('shared_bytes'):.0f} MB), PSS {mb('pss_bytes'):.0f} MB")
+
+
+# Rough peak bytes per pixel while one image is in flight: decoded RGB,
+# mask, RGBA cutout and post-processed copies
+BYTES_PER_PIXEL = 24
+
+# Extra bytes per pixel for alpha matting scratch arrays
+MATTING_BYTES_PER_PIXEL = {
+    "guided": 64,
+    # pymatting builds a sparse Laplacian over the whole image
+    "closed_form": 400,
+}
+
+# Bytes per pixel for each further frame of an animation: the decoded RGBA
+# frame and its RGBA output are kept until the file is written
+FRAME_BYTES_PER_PIXEL = 8
+
+
+def estimate_image_bytes(width: int, height: int, options: Optional[dict] = None, frames: int = 1) -> int:
+    """
+    Estimate the peak memory needed to process one image.
+
+    Args:
+        width, height: Input image size
+        options: Processing options (alpha matting adds scratch memory)
+        frames: Frame count of an animated image (all frames are kept)
+
+    Returns:
+        Estimated bytes
+    """
+    per_pixel = BYTES_PER_PIXEL
+    if options and options.get("alpha_matting", False):
+        method = options.get("alpha_matting_method", "closed_form")
+        per_pixel += MATTING_BYTES_PER_PIXEL.get(method, MATTING_BYTES_PER_PIXEL["closed_form"])
+    per_pixel += max(0, frames - 1) * FRAME_BYTES_PER_PIXEL
+    return width * height * per_pixel
+
+
+class MemoryBudget:
+    """
+    Caps memory by making work wait (back-pressure) until there is room.
+
+    Callers reserve an estimate before allocating and release it when done.
+    A reservation waits while the reservations plus the current RSS would
+    exceed the limit, unless nothing else is reserved - a single oversized
+    image is always allowed through so the queue cannot deadlock.
+    """
+
+    # How often waiting reservations re-check RSS (memory can drop without a release)
+    POLL_SECONDS = 0.25
+
+    def __init__(self, limit_bytes: int, check_rss: bool = True):
+        self.limit_bytes = limit_bytes
+        self.check_rss = check_rss
+        self.reserved = 0
+        self.peak_reserved = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self._baseline_rss = get_rss_bytes() or 0
+        self._cond = threading.Condition()
+
+    def _has_room(self, nbytes: int) -> bool:
+        if self.reserved == 0:
+            return True
+        if self.reserved + nbytes > self.limit_bytes:
+            return False
+        if self.check_rss:
+            rss = get_rss_bytes()
+            # Reserved work is already part of RSS once allocated, so only
+            # count what the process holds beyond its baseline plus this request
+            if rss is not None and max(rss, self._baseline_rss + self.reserved) + nbytes > self.limit_bytes:
+                return False
+        return True
+
+    def acquire(self, nbytes: int) -> int:
+        """
+        Reserve nbytes, blocking until the budget allows it.
+
+        Returns:
+            The number of bytes reserved (pass it to release)
+        """
+        nbytes = min(nbytes, self.limit_bytes)
+        with self._cond:
+            if not self._has_room(nbytes):
+                self.waits += 1
+                start = time.perf_counter()
+                while not self._has_room(nbytes):
+                    self._cond.wait(self.POLL_SECONDS)
+                self.wait_seconds += time.perf_counter() - start
+            self.reserved += nbytes
+            self.peak_reserved = max(self.peak_reserved, self.reserved)
+        return nbytes
+
+    def release(self, nbytes: int) -> None:
+        with self._cond:
+            self.reserved = max(0, self.reserved - nbytes)
+            self._cond.notify_all()
+
+    def to_dict(self) -> dict:
+        return {
+            "limit_bytes": self.limit_bytes,
+            "peak_reserved_bytes": self.peak_reserved,
+            "waits": self.waits,
+            "wait_seconds": round(self.wait_seconds, 3),
+            "peak_rss_bytes": get_peak_rss_bytes(),
+        }
+
+
+class BufferPool:
+    """
+    Reusable NumPy scratch buffers keyed by shape and dtype.
+
+    Batches of same-size images then reuse the same large arrays instead of
+    allocating and freeing them for every image.
+    """
+
+    def __init__(self, max_per_key: int = 2):
+        self.max_per_key = max_per_key
+        self.hits = 0
+        self.misses = 0
+        self._free: Dict[Tuple[Tuple[int, ...], str], List[np.ndarray]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, shape: Tuple[int, ...], dtype=np.float32) -> np.ndarray:
+        """Get an uninitialized array of the given shape and dtype."""
+        key = (tuple(shape), np.dtype(dtype).str)
+        with self._lock:
+            free = self._free.get(key)
+            if free:
+                self.hits += 1
+                return free.pop()
+            self.misses += 1
+        return np.empty(shape, dtype=dtype)
+
+    def put(self, array: np.ndarray) -> None:
+        """Return an array for reuse (dropped if the pool is full)."""
+        key = (array.shape, array.dtype.str)
+        with self._lock:
+            free = self._free.setdefault(key, [])
+            if len(free) < self.max_per_key:
+                free.append(array)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._free.clear()
+
+
+_local = threading.local()
+
+
+@contextmanager
+def use_buffer_pool(pool: Optional[BufferPool]):
+    """Make pool the scratch buffer pool for code running on this thread."""
+    previous = getattr(_local, "pool", None)
+    _local.pool = pool
+    try:
+        yield pool
+    finally:
+        _local.pool = previous
+
+
+def get_buffer_pool() -> Optional[BufferPool]:
+    """Get the buffer pool active on this thread, if any."""
+    return getattr(_local, "pool", None)
@@ -0,0 +1,101 @@
+"""
+Region of interest - two-pass inference for small subjects in large frames.
+
+Models resize every input to a fixed size (320-1024px), so a subject that
+fills a tenth of a 6000x4000 photo is seen at a few dozen pixels. The first
+pass runs on a downscaled copy only to find where the subject is; the
+second pass runs on a padded crop around it, which the model then sees at
+its full input resolution. The crop's mask is pasted back into a
+full-size mask that is empty outside the crop, so matting (see
+RembgProcessor.cutout) only works on the subject's region.
+"""
+
+from typing import List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+try:
+    from utils.image import subject_bbox
+except ImportError:
+    from .image import subject_bbox
+
+
+# Longest side of the first (locating) pass
+FIRST_PASS_SIZE = 1024
+
+# Padding around the subject, as a fraction of its larger side
+ROI_MARGIN = 0.15
+
+# Smallest padding in pixels of the full image
+MIN_PADDING = 16
+
+# Mask values above this count as subject when locating it
+SUBJECT_THRESHOLD = 32
+
+# Largest share of the frame a crop may cover; bigger subjects keep the
+# first pass mask (a second pass would see nearly the same image)
+MAX_CROP_FRACTION = 0.5
+
+
+def first_pass_image(image: Image.Image, size: int = FIRST_PASS_SIZE) -> Image.Image:
+    """Downscaled copy for the locating pass (the image itself if already small)."""
+    scale = size / max(image.size)
+    if scale >= 1:
+        return image
+    target = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+    return image.resize(target, Image.Resampling.BILINEAR, reducing_gap=2.0)
+
+
+def find_roi(
+    masks: List[Image.Image],
+    size: Tuple[int, int],
+    margin: float = ROI_MARGIN,
+    max_fraction: float = MAX_CROP_FRACTION
+) -> Optional[Tuple[int, int, int, int]]:
+    """
+    Crop box for the second pass from first-pass masks.
+
+    Args:
+        masks: First-pass masks (any size, all the same)
+        size: Full image size the box is for
+        margin: Padding as a fraction of the subject's larger side
+        max_fraction: Largest share of the frame the box may cover
+
+    Returns:
+        (left, top, right, bottom) in full image pixels, or None when there
+        is no subject or it is too large for a crop to help
+    """
+    if not masks:
+        return None
+    alpha = np.maximum.reduce([np.asarray(mask.convert("L")) for mask in masks])
+    box = subject_bbox(alpha, threshold=SUBJECT_THRESHOLD)
+    if box is None:
+        return None
+
+    scale_x = size[0] / alpha.shape[1]
+    scale_y = size[1] / alpha.shape[0]
+    left, top, right, bottom = box[0] * scale_x, box[1] * scale_y, box[2] * scale_x, box[3] * scale_y
+    pad = max(MIN_PADDING, margin * max(right - left, bottom - top))
+    box = (
+        max(0, int(left - pad)),
+        max(0, int(top - pad)),
+        min(size[0], int(np.ceil(right + pad))),
+        min(size[1], int(np.ceil(bottom + pad))),
+    )
+    if (box[2] - box[0]) * (box[3] - box[1]) > max_fraction * size[0] * size[1]:
+        return None
+    return box
+
+
+def paste_masks(masks: List[Image.Image], box: Tuple[int, int, int, int], size: Tuple[int, int]) -> List[Image.Image]:
+    """Place crop masks into empty full-size masks."""
+    crop_size = (box[2] - box[0], box[3] - box[1])
+    pasted = []
+    for mask in masks:
+        if mask.size != crop_size:
+            mask = mask.resize(crop_size, Image.Resampling.LANCZOS)
+        full = Image.new("L", size, 0)
+        full.paste(mask.convert("L"), box[:2])
+        pasted.append(full)
+    return pasted
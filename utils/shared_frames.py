@@ -0,0 +1,179 @@
+"""
+Shared-memory frame ring - decoded images passed between processes by slot.
+
+Sending a decoded 24MP image from a decode process to the inference process
+through a pipe means pickling ~100MB and copying it twice. The ring is one
+multiprocessing.shared_memory block cut into fixed-size slots instead:
+
+1. The owning (pipeline) process takes a free slot and hands its number to
+   a decode process with the file path.
+2. The decode process decodes the file, copies the pixels into the slot
+   and returns only the size (a few bytes through the pipe).
+3. The owning process wraps the slot as a PIL image without copying
+   (Image.frombuffer) and releases the slot when the image is dropped.
+
+Pixels are stored as RGBA (4 bytes per pixel), the layout PIL can map
+without a copy; opaque images get alpha 255. Masks (uint8, one channel) can
+be carried the same way with view(). Slots are handed out only by the
+owning process, so no cross-process locking is needed.
+
+Shared memory is allocated as it is written, but it counts against
+/dev/shm on Linux (64MB by default in Docker containers); size slots and
+the slot count to fit.
+"""
+
+import queue
+import threading
+import time
+from multiprocessing import shared_memory
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+from PIL import Image, ImageOps
+
+
+# Default slot size: a 4000x4000 RGBA image
+DEFAULT_SLOT_BYTES = 4000 * 4000 * 4
+
+
+class SharedFrameRing:
+    """Fixed-size slots in one shared memory block (owning process side)."""
+
+    def __init__(self, slots: int, slot_bytes: int = DEFAULT_SLOT_BYTES):
+        """
+        Args:
+            slots: Number of slots (images in flight at once)
+            slot_bytes: Size of each slot; larger images don't fit
+        """
+        self.slots = max(1, slots)
+        self.slot_bytes = slot_bytes
+        self._shm = shared_memory.SharedMemory(create=True, size=self.slots * slot_bytes)
+        self._free: "queue.Queue[int]" = queue.Queue()
+        for slot in range(self.slots):
+            self._free.put(slot)
+
+        self._lock = threading.Lock()
+        self.in_use = 0
+        self.peak_in_use = 0
+        self.acquired = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self._occupancy_total = 0
+
+    @property
+    def handle(self) -> Tuple[str, int, int]:
+        """Picklable reference for attach() in another process."""
+        return self._shm.name, self.slots, self.slot_bytes
+
+    def fits(self, nbytes: int) -> bool:
+        return nbytes <= self.slot_bytes
+
+    def acquire(self, timeout: Optional[float] = None) -> int:
+        """
+        Take a free slot, waiting for one if all are in use.
+
+        Raises:
+            queue.Empty: No slot was freed within the timeout
+        """
+        try:
+            slot = self._free.get_nowait()
+        except queue.Empty:
+            start = time.perf_counter()
+            slot = self._free.get(timeout=timeout)
+            with self._lock:
+                self.waits += 1
+                self.wait_seconds += time.perf_counter() - start
+        with self._lock:
+            self.in_use += 1
+            self.acquired += 1
+            self.peak_in_use = max(self.peak_in_use, self.in_use)
+            self._occupancy_total += self.in_use
+        return slot
+
+    def release(self, slot: int) -> None:
+        with self._lock:
+            self.in_use -= 1
+        self._free.put(slot)
+
+    def view(self, slot: int, shape: Tuple[int, ...], dtype=np.uint8) -> np.ndarray:
+        """NumPy array over a slot (no copy)."""
+        return _slot_view(self._shm, slot, self.slot_bytes, shape, dtype)
+
+    def image(self, slot: int, size: Tuple[int, int]) -> Image.Image:
+        """Read-only RGBA image over a slot (no copy). Valid until the slot is released."""
+        width, height = size
+        buffer = self._shm.buf[slot * self.slot_bytes:slot * self.slot_bytes + width * height * 4]
+        return Image.frombuffer("RGBA", size, buffer, "raw", "RGBA", 0, 1)
+
+    def to_dict(self) -> dict:
+        """Occupancy stats: in use now, peak, mean at acquire, waits for a free slot."""
+        with self._lock:
+            return {
+                "slots": self.slots,
+                "slot_bytes": self.slot_bytes,
+                "in_use": self.in_use,
+                "peak_in_use": self.peak_in_use,
+                "mean_in_use": round(self._occupancy_total / self.acquired, 2) if self.acquired else 0.0,
+                "acquired": self.acquired,
+                "waits": self.waits,
+                "wait_seconds": round(self.wait_seconds, 3),
+            }
+
+    def close(self) -> None:
+        """Free the shared memory (images over slots must be gone by now)."""
+        try:
+            self._shm.close()
+        except BufferError:
+            # A view is still referenced; the block is freed when it goes
+            pass
+        self._shm.unlink()
+
+
+def _slot_view(shm: shared_memory.SharedMemory, slot: int, slot_bytes: int,
+               shape: Tuple[int, ...], dtype) -> np.ndarray:
+    count = int(np.prod(shape))
+    if count * np.dtype(dtype).itemsize > slot_bytes:
+        raise ValueError(f"{shape} {np.dtype(dtype).name} does not fit a {slot_bytes} byte slot")
+    return np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=slot * slot_bytes)
+
+
+# Blocks attached in this (worker) process, by name
+_attached: Dict[str, shared_memory.SharedMemory] = {}
+
+
+def attach(handle: Tuple[str, int, int]) -> shared_memory.SharedMemory:
+    """Open a ring created by another process (cached per process)."""
+    name = handle[0]
+    shm = _attached.get(name)
+    if shm is None:
+        # Pool processes share the owner's resource tracker, which forgets
+        # the block when the owner unlinks it
+        shm = shared_memory.SharedMemory(name=name)
+        _attached[name] = shm
+    return shm
+
+
+def decode_into_slot(handle: Tuple[str, int, int], slot: int, path: str) -> Optional[Tuple[int, int]]:
+    """
+    Decode an image file into a ring slot (runs in a decode process).
+
+    EXIF orientation is applied here, so the pixels are upright.
+
+    Returns:
+        The image size, or None when it does not fit a slot (the caller
+        decodes it itself)
+    """
+    _, _, slot_bytes = handle
+    image = Image.open(path)
+    if image.width * image.height * 4 > slot_bytes:
+        return None
+    # What rembg's fix_image_orientation does, without importing rembg here
+    image = ImageOps.exif_transpose(image)
+    if image.width * image.height * 4 > slot_bytes:
+        return None
+
+    image = image.convert("RGBA")
+    pixels = _slot_view(attach(handle), slot, slot_bytes, (image.height, image.width, 4), np.uint8)
+    # The only copies are in this process; the pipe carries just the size
+    pixels[...] = np.asarray(image)
+    return image.size